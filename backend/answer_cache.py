@@ -0,0 +1,155 @@
+"""
+Semantic Answer Cache
+Reuses answers for paraphrased questions
+"""
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional
+
+class SemanticAnswerCache:
+    """In-memory LRU cache of answers keyed by query embedding similarity."""
+
+    def __init__(self, max_entries: int = 1000, max_distance: float = 0.05):
+        """
+        Initialize the answer cache.
+
+        Args:
+            max_entries: Maximum number of cached answers before LRU eviction
+            max_distance: Maximum cosine distance for a cached question to match
+        """
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._matrix = None
+        self._matrix_keys: List[int] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> Optional[np.ndarray]:
+        """Return the unit-length float32 embedding, or None for a zero vector."""
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def lookup(
+        self,
+        embedding,
+        ids_exist: Optional[Callable[[List[str]], bool]] = None
+    ) -> Optional[dict]:
+        """
+        Find a cached answer for a question embedding.
+
+        Args:
+            embedding: Query embedding
+            ids_exist: Callback checking that the cached answer's chunk IDs
+                are still present in the vector store
+
+        Returns:
+            Cached result dictionary, or None on a miss
+        """
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            if vector is None or not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[key]["embedding"] for key in self._matrix_keys])
+
+            similarities = self._matrix @ vector
+            best = int(np.argmax(similarities))
+            key = self._matrix_keys[best]
+            entry = self._entries[key]
+
+            if 1.0 - float(similarities[best]) > self.max_distance:
+                self.misses += 1
+                return None
+
+        # Checking chunk IDs may hit the vector store, so do it unlocked
+        if ids_exist is not None and entry["chunk_ids"] and not ids_exist(entry["chunk_ids"]):
+            with self._lock:
+                self._remove(key)
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+
+        return dict(entry["result"])
+
+    def store(
+        self,
+        embedding,
+        result: dict,
+        chunk_ids: Iterable[str],
+        version: Optional[int] = None
+    ):
+        """
+        Cache an answer.
+
+        Args:
+            embedding: Query embedding
+            result: Result dictionary returned by the RAG query
+            chunk_ids: IDs of the chunks the answer was generated from
+            version: Cache version read before retrieval; the answer is
+                dropped if the cache was invalidated in the meantime
+        """
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+
+            self._entries[self._next_key] = {
+                "embedding": vector,
+                "result": dict(result),
+                "chunk_ids": list(chunk_ids)
+            }
+            self._next_key += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            self._matrix = None
+
+    def _remove(self, key: int):
+        """Drop one entry (caller holds the lock)."""
+        if self._entries.pop(key, None) is not None:
+            self._matrix = None
+
+    def invalidate(self):
+        """Drop every cached answer (the knowledge base changed)."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self.version += 1
+            self.invalidations += 1
+
+    def get_stats(self) -> dict:
+        """Get cache statistics."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "max_distance": self.max_distance,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
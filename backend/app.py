@@ -2,17 +2,30 @@
 FastAPI backend for Cloud RAG system
 Handles document upload and question answering
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import os
+import json
 import sys
+import asyncio
 from pathlib import Path
+from typing import List, Optional
 import shutil
+import uuid
 
 sys.path.append(str(Path(__file__).parent.parent))
 
 from rag_system import CloudRAG
+from http_client import aclose_async_client
+from ingestion import IngestionQueue, QueueFullError
+from document_loader import shutdown_parser_pool
+from metrics import REGISTRY
+from provider_client import ProviderError
+from metadata_filter import normalize_filter
+from tenants import TenantManager, UnknownTenantError
 
 app = FastAPI(title="Cloud RAG API")
 
@@ -25,51 +38,150 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
-# Single RAG instance to maintain state
+# Single RAG instance to maintain state; tenants are views over it
 rag_instance = None
+tenant_manager = None
+ingestion_queue = None
+warm_up_task = None
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
 class QueryRequest(BaseModel):
     question: str
+    include_timings: bool = False
+    # Metadata filter scoping retrieval, e.g. {"type": "pdf"} or
+    # {"source": {"$in": [...]}, "uploaded_at": {"$gte": 1700000000}}
+    filters: Optional[dict] = None
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
 
 class QueryResponse(BaseModel):
     question: str
     response: str
     sources: list
     num_sources: int
+    timings: Optional[dict] = None
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize RAG system on startup"""
-    global rag_instance
+    """Initialize RAG system on startup, loading its heavy components in the background"""
+    global rag_instance, tenant_manager, ingestion_queue, warm_up_task
     try:
         rag_instance = CloudRAG()
-        print("✅ RAG system initialized")
+        tenant_manager = TenantManager(
+            rag_instance,
+            default_tenant=rag_instance.config.DEFAULT_TENANT,
+            max_resident=rag_instance.config.TENANT_MAX_RESIDENT,
+            memory_budget_bytes=rag_instance.config.TENANT_MEMORY_BUDGET_MB * 1024 * 1024
+        )
+        ingestion_queue = IngestionQueue(
+            rag_instance,
+            num_workers=rag_instance.config.INGEST_WORKERS,
+            max_queue_size=rag_instance.config.INGEST_QUEUE_SIZE,
+            batch_size=rag_instance.config.INGEST_BATCH_SIZE,
+            tenants=tenant_manager
+        )
+        # The port opens now; requests arriving before warm-up completes wait
+        # for just the components they use
+        warm_up_task = asyncio.create_task(rag_instance.awarm_up())
+        print("✅ RAG system initialized, warming up in the background")
     except Exception as e:
         print(f"❌ Failed to initialize RAG: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop ingestion and parsing workers, flush the vector index and release pooled provider connections"""
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+    if ingestion_queue:
+        ingestion_queue.shutdown()
+    if tenant_manager:
+        tenant_manager.close()
+    if rag_instance:
+        rag_instance.flush()
+    shutdown_parser_pool()
+    await aclose_async_client()
+
+def get_tenant_id(x_tenant_id: Optional[str] = Header(None)) -> str:
+    """Resolve the tenant a request is for from its X-Tenant-ID header"""
+    if not tenant_manager:
+        raise HTTPException(status_code=500, detail="RAG system not initialized")
+    try:
+        return tenant_manager.resolve(x_tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid tenant: {str(e)}")
+
+async def get_known_tenant_id(tenant_id: str = Depends(get_tenant_id)) -> str:
+    """Resolve the tenant of a read, which must already have a knowledge base (uploads create one)"""
+    try:
+        # Opens the tenant now, so an unknown one is a 404 rather than an error mid-stream
+        async with tenant_manager.alease(tenant_id):
+            pass
+    except UnknownTenantError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return tenant_id
+
+def _upload_dir(tenant_id: str) -> Path:
+    """Directory of a tenant's uploads (the default tenant's are at the top level)"""
+    if tenant_id == tenant_manager.default_tenant:
+        return UPLOAD_DIR
+    return UPLOAD_DIR / tenant_id
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe: 200 once every component is loaded, 503 until then"""
+    if not rag_instance:
+        return JSONResponse(status_code=503, content={"ready": False, "detail": "RAG system not initialized"})
+    readiness = rag_instance.get_readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
 @app.get("/")
-async def root():
+async def root(tenant_id: str = Depends(get_known_tenant_id)):
     """Health check endpoint"""
+    async with tenant_manager.alease(tenant_id) as rag:
+        vector_store = await rag.acomponent("vector_store")
+        documents = await run_in_threadpool(vector_store.count)
     return {
         "status": "online",
         "message": "Cloud RAG API",
-        "documents": rag_instance.vector_store.count() if rag_instance else 0
+        "tenant": tenant_id,
+        "documents": documents
     }
 
 @app.get("/stats")
-async def get_stats():
+async def get_stats(tenant_id: str = Depends(get_known_tenant_id)):
     """Get system statistics"""
     if not rag_instance:
         raise HTTPException(status_code=500, detail="RAG system not initialized")
-    return rag_instance.get_stats()
+    async with tenant_manager.alease(tenant_id) as rag:
+        stats = await run_in_threadpool(rag.get_stats)
+    stats["tenant"] = tenant_id
+    stats["tenants"] = tenant_manager.get_stats()
+    if ingestion_queue:
+        stats["ingestion"] = ingestion_queue.get_stats()
+    return stats
 
-@app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
-    """Upload and process a document"""
-    if not rag_instance:
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Stage latency histograms and provider counters in Prometheus format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def _save_upload(file: UploadFile, file_path: Path):
+    """Copy an uploaded file to disk (blocking, run in a worker thread)"""
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+@app.post("/upload", status_code=202)
+async def upload_document(file: UploadFile = File(...), tenant_id: str = Depends(get_tenant_id)):
+    """Upload a document and queue it for background processing"""
+    if not rag_instance or not ingestion_queue:
         raise HTTPException(status_code=500, detail="RAG system not initialized")
     
     allowed_extensions = {'.pdf', '.txt', '.docx', '.html', '.htm'}
@@ -81,27 +193,79 @@ async def upload_document(file: UploadFile = File(...)):
             detail=f"Unsupported file type. Allowed: {', '.join(allowed_extensions)}"
         )
     
+    incoming_path = None
     try:
-        file_path = UPLOAD_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        upload_dir = _upload_dir(tenant_id)
+        upload_dir.mkdir(exist_ok=True)
+        # Each upload gets its own file, so a re-upload never overwrites one
+        # an earlier job is still parsing; the job moves it to file_path
+        incoming_dir = upload_dir / ".incoming"
+        incoming_dir.mkdir(exist_ok=True)
+        file_path = upload_dir / file.filename
+        incoming_path = incoming_dir / f"{uuid.uuid4().hex}-{file.filename}"
+        await run_in_threadpool(_save_upload, file, incoming_path)
         
-        rag_instance.add_document(str(file_path))
+        job = ingestion_queue.submit(
+            str(incoming_path), file.filename, tenant_id=tenant_id, source=str(file_path)
+        )
+        incoming_path = None
         
         return {
-            "status": "success",
-            "message": f"Document '{file.filename}' processed successfully",
+            "status": "queued",
+            "message": f"Document '{file.filename}' queued for processing",
             "filename": file.filename,
-            "total_documents": rag_instance.vector_store.count()
+            "tenant": tenant_id,
+            "job_id": job.id
         }
     
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
     finally:
         file.file.close()
+        # Not handed to a job
+        if incoming_path is not None:
+            incoming_path.unlink(missing_ok=True)
+
+@app.get("/jobs")
+async def list_jobs(tenant_id: str = Depends(get_tenant_id)):
+    """List the tenant's ingestion jobs"""
+    if not ingestion_queue:
+        raise HTTPException(status_code=500, detail="RAG system not initialized")
+    return {
+        "queue": ingestion_queue.get_stats(),
+        "jobs": [job.to_dict() for job in ingestion_queue.list_jobs(tenant_id)]
+    }
+
+def _tenant_job(job_id: str, tenant_id: str):
+    """Get one of the tenant's jobs (other tenants' jobs are not found)"""
+    job = ingestion_queue.get(job_id)
+    if not job or job.tenant_id != tenant_id:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, tenant_id: str = Depends(get_tenant_id)):
+    """Get the progress of an ingestion job"""
+    if not ingestion_queue:
+        raise HTTPException(status_code=500, detail="RAG system not initialized")
+    
+    return _tenant_job(job_id, tenant_id).to_dict()
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, tenant_id: str = Depends(get_tenant_id)):
+    """Cancel a queued or running ingestion job"""
+    if not ingestion_queue:
+        raise HTTPException(status_code=500, detail="RAG system not initialized")
+    
+    job = _tenant_job(job_id, tenant_id)
+    if not job.cancel():
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' already {job.status}")
+    return job.to_dict()
 
 @app.post("/query", response_model=QueryResponse)
-async def query_rag(request: QueryRequest):
+async def query_rag(request: QueryRequest, tenant_id: str = Depends(get_known_tenant_id)):
     """Ask a question to the RAG system"""
     if not rag_instance:
         raise HTTPException(status_code=500, detail="RAG system not initialized")
@@ -110,27 +274,114 @@ async def query_rag(request: QueryRequest):
         raise HTTPException(status_code=400, detail="Question cannot be empty")
     
     try:
-        result = rag_instance.ask(request.question)
+        normalize_filter(request.filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filters: {str(e)}")
+    
+    try:
+        async with tenant_manager.alease(tenant_id) as rag:
+            result = await rag.aquery(
+                request.question,
+                include_timings=request.include_timings,
+                filters=request.filters
+            )
         return QueryResponse(**result)
     
+    except ProviderError as e:
+        # Upstream overload or outage the client could not retry away
+        if e.status_code == 429:
+            status_code = 429
+        elif e.retryable:
+            status_code = 503
+        else:
+            status_code = 502
+        headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after else None
+        raise HTTPException(status_code=status_code, detail=str(e), headers=headers)
+    
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
+@app.post("/query/stream")
+async def query_rag_stream(request: QueryRequest, tenant_id: str = Depends(get_known_tenant_id)):
+    """Ask a question and stream the answer as server-sent events"""
+    if not rag_instance:
+        raise HTTPException(status_code=500, detail="RAG system not initialized")
+    
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+    
+    try:
+        normalize_filter(request.filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid filters: {str(e)}")
+    
+    async def event_stream():
+        try:
+            # Leased inside the generator, so the lease ends with the stream
+            async with tenant_manager.alease(tenant_id) as rag:
+                async for event in rag.aquery_stream(request.question, filters=request.filters):
+                    yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        except Exception as e:
+            error = {"detail": f"Error generating response: {str(e)}"}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/query/batch")
+async def query_rag_batch(request: BatchQueryRequest, tenant_id: str = Depends(get_known_tenant_id)):
+    """Answer many questions, streaming one JSON result per line in input order"""
+    if not rag_instance:
+        raise HTTPException(status_code=500, detail="RAG system not initialized")
+    
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Questions cannot be empty")
+    
+    max_questions = rag_instance.config.BATCH_MAX_QUESTIONS
+    if len(request.questions) > max_questions:
+        raise HTTPException(status_code=400, detail=f"At most {max_questions} questions per batch")
+    
+    empty = [i for i, question in enumerate(request.questions) if not question.strip()]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"Question {empty[0]} is empty")
+    
+    async def ndjson_stream():
+        try:
+            async with tenant_manager.alease(tenant_id) as rag:
+                async for result in rag.aquery_batch(request.questions):
+                    yield json.dumps(result) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Error generating responses: {str(e)}"}) + "\n"
+    
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.delete("/clear")
-async def clear_knowledge_base():
-    """Clear all documents from the knowledge base"""
+async def clear_knowledge_base(tenant_id: str = Depends(get_known_tenant_id)):
+    """Clear all documents from the tenant's knowledge base"""
     if not rag_instance:
         raise HTTPException(status_code=500, detail="RAG system not initialized")
     
     try:
-        rag_instance.clear_knowledge_base()
-        for file in UPLOAD_DIR.glob("*"):
+        async with tenant_manager.alease(tenant_id) as rag:
+            await run_in_threadpool(rag.clear_knowledge_base)
+        for file in _upload_dir(tenant_id).glob("*"):
             if file.is_file():
                 file.unlink()
         
         return {
             "status": "success",
-            "message": "Knowledge base cleared"
+            "message": "Knowledge base cleared",
+            "tenant": tenant_id
         }
     
     except Exception as e:
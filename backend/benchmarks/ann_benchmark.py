@@ -0,0 +1,121 @@
+"""
+ANN Backend Benchmark
+Compare recall@k, query throughput and cold start of the vector backends
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from vector_backends import create_vector_backend
+
+def make_dataset(num_items: int, num_queries: int, dim: int, seed: int = 0):
+    """Generate clustered unit vectors (closer to real embeddings than uniform noise)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, num_items // 100), dim)).astype(np.float32)
+
+    def sample(n):
+        points = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+    return sample(num_items), sample(num_queries)
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Ground-truth neighbours by brute force."""
+    scores = queries @ vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def run_backend(name: str, kind: str, options: dict, vectors, queries, truth, k: int, batch: int) -> dict:
+    """Load the dataset into one backend and measure it."""
+    directory = tempfile.mkdtemp(prefix=f"ann_{name}_")
+    try:
+        started = time.perf_counter()
+        backend = create_vector_backend(kind, "bench", directory, **options)
+        open_seconds = time.perf_counter() - started
+
+        ids = [str(i) for i in range(len(vectors))]
+        started = time.perf_counter()
+        for start in range(0, len(vectors), batch):
+            end = start + batch
+            backend.upsert(
+                ids[start:end],
+                vectors[start:end].tolist(),
+                [""] * len(ids[start:end]),
+                [{"source": "bench"}] * len(ids[start:end])
+            )
+        insert_seconds = time.perf_counter() - started
+
+        # First query pays for any lazy index build
+        started = time.perf_counter()
+        backend.query(queries[0].tolist(), k)
+        first_query_seconds = time.perf_counter() - started
+
+        hits = 0
+        latencies = []
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            result = backend.query(query.tolist(), k)
+            latencies.append(time.perf_counter() - started)
+            hits += len(set(int(i) for i in result["ids"]) & set(expected.tolist()))
+
+        latencies = np.array(latencies)
+        return {
+            "backend": name,
+            "open_seconds": round(open_seconds, 4),
+            "insert_per_second": round(len(vectors) / insert_seconds, 1),
+            "first_query_seconds": round(first_query_seconds, 4),
+            f"recall@{k}": round(hits / (len(queries) * k), 4),
+            "qps": round(len(queries) / latencies.sum(), 1),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3)
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark vector index backends")
+    parser.add_argument("--items", type=int, default=20000, help="Number of indexed vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--batch", type=int, default=1000, help="Vectors per upsert")
+    parser.add_argument("--ef", type=int, default=64, help="HNSW ef at query time")
+    parser.add_argument("--m", type=int, default=16, help="HNSW graph degree")
+    parser.add_argument("--rerank", type=int, default=4, help="Shortlist multiple for compressed vectors")
+    parser.add_argument("--backends", default="local-exact,local-float16,local-int8,local-hnsw,chroma",
+                        help="Comma-separated backends")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    configs = {
+        "local-exact": ("local", {"hnsw_min_items": 0}),
+        "local-float16": ("local", {"hnsw_min_items": 0, "vector_dtype": "float16", "rerank_factor": args.rerank}),
+        "local-int8": ("local", {"hnsw_min_items": 0, "vector_dtype": "int8", "rerank_factor": args.rerank}),
+        "local-hnsw": ("local", {"hnsw_min_items": 1, "hnsw_m": args.m, "hnsw_ef_search": args.ef}),
+        "chroma": ("chroma", {})
+    }
+
+    vectors, queries = make_dataset(args.items, args.queries, args.dim)
+    truth = exact_top_k(vectors, queries, args.k)
+
+    results = []
+    for name in args.backends.split(","):
+        kind, options = configs[name]
+        print(f"⏱️  {name}...")
+        result = run_backend(name, kind, options, vectors, queries, truth, args.k, args.batch)
+        results.append(result)
+        print(f"   {json.dumps(result)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Mock HuggingFace Inference Server
+Local stand-in for the router's embedding and chat-completions endpoints
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+class MockHFServer:
+    """
+    HTTP server mimicking the HuggingFace router.
+
+    POST /models/<model> returns feature-extraction embeddings: hashed
+    bag-of-words vectors, so similar texts get similar vectors and
+    retrieval behaves plausibly. POST /v1/chat/completions answers with
+    the end of the prompt, as JSON or as server-sent events when
+    "stream" is set.
+
+    Every request waits its configured latency and can fail at random
+    with a 429 (with Retry-After) or a 503, as the real router does
+    under load.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        dim: int = 1024,
+        embed_latency_ms: float = 20.0,
+        embed_item_latency_ms: float = 0.5,
+        llm_latency_ms: float = 200.0,
+        jitter: float = 0.2,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        answer_words: int = 40,
+        seed: Optional[int] = None
+    ):
+        """
+        Initialize the server (call ``start`` to serve).
+
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+            dim: Embedding dimension
+            embed_latency_ms: Latency of an embedding request
+            embed_item_latency_ms: Extra latency per text in a batch
+            llm_latency_ms: Latency of a chat completion (spread over the
+                tokens when streaming)
+            jitter: Relative random variation of latencies
+            error_rate: Share of requests answered with 503
+            rate_limit_rate: Share of requests answered with 429
+            retry_after: Retry-After seconds sent with 429s
+            answer_words: Words per generated answer
+            seed: Random seed for reproducible latencies and failures
+        """
+        self.dim = dim
+        self.embed_latency_ms = embed_latency_ms
+        self.embed_item_latency_ms = embed_item_latency_ms
+        self.llm_latency_ms = llm_latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.answer_words = answer_words
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {
+            "embedding_requests": 0,
+            "embedded_texts": 0,
+            "chat_requests": 0,
+            "rate_limited": 0,
+            "errors": 0
+        }
+
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as HF_API_BASE."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockHFServer":
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockHFServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _delay(self, milliseconds: float):
+        """Sleep for a jittered latency."""
+        with self._lock:
+            factor = 1.0 + self._random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, milliseconds * factor) / 1000)
+
+    def _failure(self) -> Optional[int]:
+        """Status code of an injected failure, or None."""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            self._count("rate_limited")
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            self._count("errors")
+            return 503
+        return None
+
+    def embed(self, text: str) -> list:
+        """Deterministic unit vector from the hashed words of a text."""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in _WORD_PATTERN.findall(text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0 if digest[4] & 1 else -1.0
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            vector[0] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def answer(self, prompt: str) -> str:
+        """Canned answer echoing the end of the prompt."""
+        words = prompt.split()[-self.answer_words:]
+        return "Mock answer: " + " ".join(words)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; without this,
+            # Nagle + delayed ACK adds ~40 ms to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload, headers: Optional[dict] = None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_chunk(self, data: bytes):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+            def do_GET(self):
+                if self.path == "/stats":
+                    with server._lock:
+                        stats = dict(server.stats)
+                    self._send_json(200, stats)
+                else:
+                    self._send_json(404, {"error": "Not found"})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+                failure = server._failure()
+                if failure == 429:
+                    self._send_json(429, {"error": "Rate limit reached"}, {"Retry-After": str(server.retry_after)})
+                    return
+                if failure == 503:
+                    self._send_json(503, {"error": "Model is currently loading"})
+                    return
+
+                if self.path == "/v1/chat/completions":
+                    self._chat(body)
+                elif self.path.startswith("/models/"):
+                    self._embed(body)
+                else:
+                    self._send_json(404, {"error": "Not found"})
+
+            def _embed(self, body: dict):
+                inputs = body.get("inputs", "")
+                texts = inputs if isinstance(inputs, list) else [inputs]
+                server._count("embedding_requests")
+                server._count("embedded_texts", len(texts))
+                server._delay(server.embed_latency_ms + server.embed_item_latency_ms * len(texts))
+
+                vectors = [server.embed(text) for text in texts]
+                self._send_json(200, vectors if isinstance(inputs, list) else vectors[0])
+
+            def _chat(self, body: dict):
+                server._count("chat_requests")
+                messages = body.get("messages") or [{}]
+                answer = server.answer(messages[-1].get("content", ""))
+
+                if not body.get("stream"):
+                    server._delay(server.llm_latency_ms)
+                    self._send_json(200, {"choices": [{"message": {"role": "assistant", "content": answer}}]})
+                    return
+
+                words = answer.split(" ")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, word in enumerate(words):
+                    server._delay(server.llm_latency_ms / len(words))
+                    delta = {"choices": [{"delta": {"content": word if i == 0 else " " + word}}]}
+                    self._send_chunk(f"data: {json.dumps(delta)}\n\n".encode("utf-8"))
+                self._send_chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+def main():
+    """Run the mock server in the foreground."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[-1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=1024, help="Embedding dimension")
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests failing with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockHFServer(
+        host=args.host,
+        port=args.port,
+        dim=args.dim,
+        embed_latency_ms=args.embed_latency_ms,
+        llm_latency_ms=args.llm_latency_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed
+    ).start()
+
+    print(f"🧪 Mock HuggingFace server on {server.url}")
+    print(f"   export HF_API_BASE={server.url}")
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+RAG Benchmark
+Offline ingest throughput, query latency and memory against a mock HF provider
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from mock_hf_server import MockHFServer
+
+# Progress goes here even while the system's own prints are silenced
+_console = sys.stdout
+
+def report(message: str):
+    """Print benchmark progress."""
+    print(message, file=_console, flush=True)
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process so far (MB)."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def current_rss_mb() -> float:
+    """Current resident memory of this process (MB, Linux only)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError):
+        return 0.0
+
+def git_commit() -> str:
+    """Commit of the benchmarked tree, if known."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+def free_port() -> int:
+    """An unused local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class Corpus:
+    """Synthetic documents and questions over a fixed pseudo-word vocabulary."""
+
+    def __init__(self, vocabulary_size: int = 5000, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.vocabulary = [f"term{i}" for i in range(vocabulary_size)]
+        # Zipf-like word frequencies, like natural text
+        weights = 1.0 / np.arange(1, vocabulary_size + 1)
+        self.weights = weights / weights.sum()
+        self.sentences = []
+
+    def sentence(self) -> str:
+        words = self.rng.choice(self.vocabulary, size=int(self.rng.integers(8, 20)), p=self.weights)
+        text = " ".join(words).capitalize() + "."
+        if len(self.sentences) < 10000:
+            self.sentences.append(text)
+        return text
+
+    def document(self, size_bytes: int) -> str:
+        """Paragraphs of sentences totalling about size_bytes."""
+        paragraphs = []
+        size = 0
+        while size < size_bytes:
+            paragraph = " ".join(self.sentence() for _ in range(5))
+            paragraphs.append(paragraph)
+            size += len(paragraph) + 2
+        return "\n\n".join(paragraphs)
+
+    def question(self, number: int) -> str:
+        """A question about a sentence seen in the documents (unique per number)."""
+        sentence = self.sentences[int(self.rng.integers(0, len(self.sentences)))]
+        words = sentence.rstrip(".").split()
+        start = int(self.rng.integers(0, max(1, len(words) - 5)))
+        return f"What is said about {' '.join(words[start:start + 5])}? (question {number})"
+
+def start_app(port: int):
+    """Serve the FastAPI app with uvicorn in a background thread."""
+    import uvicorn
+    import app as app_module
+
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    deadline = time.time() + 120
+    while not server.started:
+        if not thread.is_alive() or time.time() > deadline:
+            raise RuntimeError("API server failed to start")
+        time.sleep(0.05)
+    return server, thread, app_module
+
+def bench_ingest(rag, corpus: Corpus, sizes_kb, docs_per_size: int, directory: str) -> list:
+    """Ingest synthetic text documents of each size, measuring chunks/s."""
+    results = []
+    for size_kb in sizes_kb:
+        chunks = 0
+        seconds = 0.0
+        for i in range(docs_per_size):
+            path = os.path.join(directory, f"doc_{size_kb}kb_{i}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(corpus.document(size_kb * 1024))
+
+            before = rag.vector_store.count()
+            started = time.perf_counter()
+            rag.add_document(path, "txt")
+            seconds += time.perf_counter() - started
+            chunks += rag.vector_store.count() - before
+
+        result = {
+            "doc_size_kb": size_kb,
+            "documents": docs_per_size,
+            "chunks": chunks,
+            "seconds": round(seconds, 3),
+            "chunks_per_second": round(chunks / seconds, 1) if seconds else 0.0,
+            "peak_rss_mb": peak_rss_mb()
+        }
+        results.append(result)
+        report(f"   {json.dumps(result)}")
+    return results
+
+async def bench_queries(base_url: str, questions: list, concurrency: int) -> dict:
+    """Send questions to /query from ``concurrency`` clients, measuring latency."""
+    import httpx
+
+    pending = list(enumerate(questions))
+    latencies = []
+    errors = 0
+
+    async def client_loop(client):
+        nonlocal errors
+        while pending:
+            _, question = pending.pop()
+            started = time.perf_counter()
+            try:
+                response = await client.post("/query", json={"question": question})
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": len(questions),
+        "errors": errors,
+        "throughput_rps": round(len(questions) / elapsed, 2),
+        "mean_ms": round(float(latencies_ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p90_ms": round(float(np.percentile(latencies_ms, 90)), 2),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 2),
+        "max_ms": round(float(latencies_ms.max()), 2),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+_SAMPLE_PATTERN = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+
+def scrape_metrics(text: str) -> dict:
+    """Summarize /metrics: mean stage latencies and provider counters."""
+    sums, counts, counters = {}, {}, {}
+    for line in text.splitlines():
+        match = _SAMPLE_PATTERN.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', labels))
+        if name.endswith("_sum") or name.endswith("_count"):
+            base, kind = name.rsplit("_", 1)
+            key = f"{base}:{labels.get('stage') or labels.get('provider') or labels.get('cached')}"
+            (sums if kind == "sum" else counts)[key] = float(value)
+        elif name.endswith("_total"):
+            counters[f"{name}:{labels.get('provider')}:{labels.get('reason')}"] = float(value)
+
+    mean_ms = {
+        key: round(sums[key] / counts[key] * 1000, 3)
+        for key in sorted(sums)
+        if counts.get(key)
+    }
+    return {"mean_ms": mean_ms, "counts": {key: int(counts[key]) for key in sorted(counts)}, "counters": counters}
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and queries against a mock HF provider")
+    parser.add_argument("--doc-sizes", default="16,256,2048", help="Comma-separated document sizes (KB)")
+    parser.add_argument("--docs-per-size", type=int, default=2, help="Documents ingested per size")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated client concurrency levels")
+    parser.add_argument("--queries", type=int, default=100, help="Queries per concurrency level")
+    parser.add_argument("--vector-backend", default="chroma", help="VECTOR_BACKEND to benchmark")
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0, help="Mock embedding request latency")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="Mock chat completion latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock requests failing with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of mock requests failing with 429")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus and injected failures")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the system's own log output")
+    args = parser.parse_args()
+
+    mock = MockHFServer(
+        embed_latency_ms=args.embed_latency_ms,
+        llm_latency_ms=args.llm_latency_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed
+    ).start()
+
+    # The system reads its configuration at import; point it at the mock
+    # and keep all data in a scratch directory
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    os.environ["HF_API_BASE"] = mock.url
+    os.environ["HF_TOKEN"] = "mock-token"
+    os.environ["EMBEDDING_BACKEND"] = "huggingface"
+    os.environ["VECTOR_BACKEND"] = args.vector_backend
+    previous_cwd = os.getcwd()
+    os.chdir(workdir)
+
+    results = {
+        "params": vars(args),
+        "environment": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()
+        }
+    }
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    server = None
+    try:
+        with quiet:
+            report(f"🧪 Mock provider at {mock.url}, data in {workdir}")
+
+            started = time.perf_counter()
+            port = free_port()
+            server, thread, app_module = start_app(port)
+            serving_seconds = time.perf_counter() - started
+            rag = app_module.rag_instance
+            # Components load in the background once the port is open
+            deadline = time.time() + 120
+            while not rag.get_readiness()["ready"]:
+                if time.time() > deadline:
+                    raise RuntimeError(f"API server not ready: {rag.get_readiness()['errors']}")
+                time.sleep(0.01)
+            results["startup"] = {
+                "seconds": round(serving_seconds, 3),
+                "ready_seconds": round(time.perf_counter() - started, 3),
+                "rss_mb": current_rss_mb()
+            }
+            report(f"⏱️  Startup: {json.dumps(results['startup'])}")
+
+            report("⏱️  Ingest...")
+            corpus = Corpus(seed=args.seed)
+            sizes_kb = [int(size) for size in args.doc_sizes.split(",")]
+            results["ingest"] = bench_ingest(rag, corpus, sizes_kb, args.docs_per_size, workdir)
+
+            report("⏱️  Queries...")
+            base_url = f"http://127.0.0.1:{port}"
+            results["queries"] = []
+            number = 0
+            for concurrency in [int(level) for level in args.concurrency.split(",")]:
+                questions = [corpus.question(number + i) for i in range(args.queries)]
+                number += args.queries
+                result = asyncio.run(bench_queries(base_url, questions, concurrency))
+                results["queries"].append(result)
+                report(f"   {json.dumps(result)}")
+
+            import httpx
+            results["metrics"] = scrape_metrics(httpx.get(f"{base_url}/metrics").text)
+            results["mock_provider"] = dict(mock.stats)
+            results["memory"] = {"peak_rss_mb": peak_rss_mb(), "rss_mb": current_rss_mb()}
+            report(f"📊 Memory: {json.dumps(results['memory'])}")
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join(timeout=30)
+        mock.stop()
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        report(f"💾 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Startup Benchmark
+Cold import time, time to liveness and time to readiness of the API server
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from mock_hf_server import MockHFServer
+from rag_benchmark import Corpus, free_port, git_commit, report
+
+# Medians compared against a baseline run
+TRACKED = ("import_seconds", "healthz_seconds", "ready_seconds", "first_query_seconds")
+
+_IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def server_env(mock_url: str, vector_backend: str) -> dict:
+    """Environment of the benchmarked server: the mock provider and the backend directory."""
+    env = dict(os.environ)
+    env.update({
+        "HF_API_BASE": mock_url,
+        "HF_TOKEN": "mock-token",
+        "EMBEDDING_BACKEND": "huggingface",
+        "VECTOR_BACKEND": vector_backend,
+        "PYTHONPATH": BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    })
+    return env
+
+def prepare_collection(workdir: str, num_chunks: int, seed: int):
+    """Ingest a synthetic document of about num_chunks chunks, so startup opens a real collection."""
+    from rag_system import CloudRAG
+
+    rag = CloudRAG()
+    path = os.path.join(workdir, "corpus.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(Corpus(seed=seed).document(num_chunks * (rag.config.CHUNK_SIZE - rag.config.CHUNK_OVERLAP)))
+    rag.add_document(path, "txt")
+    rag.flush()
+    return rag.vector_store.count()
+
+def measure_import(workdir: str, env: dict, top: int) -> dict:
+    """Import the app in a fresh interpreter with -X importtime."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=workdir, env=env, capture_output=True, text=True, timeout=300
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing the app failed:\n{completed.stderr[-2000:]}")
+
+    total_us = 0
+    packages = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORT_TIME_PATTERN.match(line)
+        if not match:
+            continue
+        _, cumulative_us, indent, module = match.groups()
+        if module == "app" and len(indent) == 1:
+            total_us = int(cumulative_us)
+        elif "." not in module:
+            # Top-level packages and the backend's own modules, submodules included
+            packages.append((int(cumulative_us), module))
+
+    return {
+        "import_seconds": round(total_us / 1e6, 3),
+        "slowest_imports_ms": {module: round(us / 1000, 1) for us, module in sorted(packages, reverse=True)[:top]}
+    }
+
+def measure_server(workdir: str, env: dict, question: str, timeout: float = 120.0) -> dict:
+    """Start the server in a fresh process and time liveness, readiness and the first answer."""
+    import httpx
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    result = {}
+    try:
+        with httpx.Client(base_url=base_url, timeout=timeout) as client:
+            def wait_for(path: str) -> float:
+                deadline = time.perf_counter() + timeout
+                while time.perf_counter() < deadline:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"Server exited with code {process.returncode}")
+                    try:
+                        if client.get(path, timeout=1.0).status_code == 200:
+                            return round(time.perf_counter() - started, 3)
+                    except httpx.HTTPError:
+                        pass
+                    time.sleep(0.01)
+                raise RuntimeError(f"Server not answering {path} after {timeout}s")
+
+            result["healthz_seconds"] = wait_for("/healthz")
+            result["ready_seconds"] = wait_for("/readyz")
+            result["components"] = client.get("/readyz").json()["load_seconds"]
+
+            query_started = time.perf_counter()
+            response = client.post("/query", json={"question": question})
+            response.raise_for_status()
+            result["first_query_seconds"] = round(time.perf_counter() - query_started, 3)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+def compare(medians: dict, baseline_path: str, tolerance: float) -> list:
+    """Tracked medians slower than the baseline's by more than the tolerance."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["medians"]
+
+    regressions = []
+    for key in TRACKED:
+        before, after = baseline.get(key), medians.get(key)
+        if before and after and after > before * (1 + tolerance):
+            regressions.append(f"{key}: {before}s -> {after}s (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark API server import, liveness and readiness times")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts measured (medians are reported)")
+    parser.add_argument("--chunks", type=int, default=2000, help="Chunks in the collection opened at startup")
+    parser.add_argument("--vector-backend", default="chroma", help="VECTOR_BACKEND to benchmark")
+    parser.add_argument("--top-imports", type=int, default=10, help="Slowest imports listed")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the corpus")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show the system's own log output")
+    args = parser.parse_args()
+
+    mock = MockHFServer(embed_latency_ms=0, llm_latency_ms=0, seed=args.seed).start()
+    workdir = tempfile.mkdtemp(prefix="rag_startup_")
+    env = server_env(mock.url, args.vector_backend)
+    previous_cwd = os.getcwd()
+
+    results = {
+        "params": vars(args),
+        "environment": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count()
+        },
+        "runs": []
+    }
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    try:
+        with quiet:
+            report(f"🧪 Mock provider at {mock.url}, data in {workdir}")
+            os.environ.update(env)
+            os.chdir(workdir)
+            results["chunks"] = prepare_collection(workdir, args.chunks, args.seed)
+            report(f"📚 Collection: {results['chunks']} chunks")
+
+            for run in range(args.runs):
+                measurement = measure_import(workdir, env, args.top_imports)
+                measurement.update(measure_server(workdir, env, "What is said about term1?"))
+                results["runs"].append(measurement)
+                report(f"   run {run + 1}: " + json.dumps({key: measurement.get(key) for key in TRACKED}))
+    finally:
+        mock.stop()
+        os.chdir(previous_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results["medians"] = {
+        key: round(statistics.median(run[key] for run in results["runs"]), 3)
+        for key in TRACKED
+    }
+    results["slowest_imports_ms"] = results["runs"][-1]["slowest_imports_ms"]
+    report(f"⏱️  Medians: {json.dumps(results['medians'])}")
+    report(f"🐢 Slowest imports: {json.dumps(results['slowest_imports_ms'])}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        report(f"💾 Results written to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results["medians"], args.baseline, args.tolerance)
+        for regression in regressions:
+            report(f"❌ Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        report("✅ No regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Bulk Ingestion
+Load whole directories or zip archives into the knowledge base
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+SUPPORTED_EXTENSIONS = {'.pdf', '.txt', '.docx', '.html', '.htm'}
+
+class IngestManifest:
+    """
+    Resumable record of which files (by content hash) were ingested.
+
+    Outcomes are appended to a JSON Lines log, one line per file, so
+    recording costs the same however many files a run covers. Loading
+    keeps each file's last line and rewrites the log compacted when it
+    has superseded or damaged lines.
+    """
+
+    def __init__(self, path: str):
+        """
+        Load or create a manifest.
+
+        Args:
+            path: JSON Lines manifest file (a whole-file JSON manifest of
+                earlier versions is read and converted)
+        """
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        self._log = None
+
+        if os.path.exists(path):
+            if self._load():
+                self.save()
+
+    def _load(self) -> bool:
+        """Read the log into ``entries``; returns True if it needs compacting."""
+        lines = 0
+        compact = False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    # Cut short by an interrupted run; appending would extend it
+                    compact = True
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    compact = compact or bool(line.strip())
+                    continue
+                lines += 1
+                if "files" in entry:
+                    # Whole-file manifest of earlier versions
+                    self.entries.update(entry["files"])
+                    compact = True
+                else:
+                    self.entries[entry.pop("hash")] = entry
+        return compact or lines > len(self.entries)
+
+    def is_done(self, content_hash: str) -> bool:
+        """Check whether a file with this content was already ingested."""
+        return self.entries.get(content_hash, {}).get("status") == "done"
+
+    def record(self, content_hash: str, name: str, status: str, chunks: int = 0, error: str = None):
+        """Record the outcome of one file, appending it to the log."""
+        entry = {
+            "name": name,
+            "status": status,
+            "chunks": chunks,
+            "error": error,
+            "updated_at": time.time()
+        }
+        self.entries[content_hash] = entry
+
+        if self._log is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._log = open(self.path, 'a', encoding='utf-8')
+        self._log.write(json.dumps({"hash": content_hash, **entry}) + "\n")
+        self._log.flush()
+
+    def save(self):
+        """Rewrite the log with one line per file, atomically so an interrupted run never corrupts it."""
+        self.close()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for content_hash, entry in self.entries.items():
+                f.write(json.dumps({"hash": content_hash, **entry}) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        """Close the log (it is reopened by the next ``record``)."""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+def default_manifest_path(path: str) -> str:
+    """
+    Manifest of a directory or archive: "<path>.manifest.jsonl".
+
+    A "<path>.manifest.json" left by earlier versions is renamed to it, and
+    converted when loaded.
+    """
+    base = path.rstrip(os.sep)
+    manifest_path = f"{base}.manifest.jsonl"
+    legacy_path = f"{base}.manifest.json"
+    if not os.path.exists(manifest_path) and os.path.exists(legacy_path):
+        os.replace(legacy_path, manifest_path)
+    return manifest_path
+
+def hash_file(file_path: str) -> str:
+    """Compute the SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_source_files(path: str, extract_dir: str) -> Iterator[Tuple[str, str]]:
+    """
+    Walk a directory or zip archive for supported documents.
+
+    Archive members are extracted one at a time into ``extract_dir`` as the
+    walk reaches them.
+
+    Args:
+        path: Directory or .zip file
+        extract_dir: Scratch directory for extracted archive members
+
+    Yields:
+        Tuples of (display name, path on disk)
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for i, member in enumerate(sorted(archive.namelist())):
+                if member.endswith("/") or os.path.splitext(member)[1].lower() not in SUPPORTED_EXTENSIONS:
+                    continue
+
+                # Keep the extension for type detection; avoid name clashes
+                target = os.path.join(extract_dir, f"{i}_{os.path.basename(member)}")
+                with archive.open(member) as src, open(target, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+
+                yield f"{path}/{member}", target
+        return
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                file_path = os.path.join(root, name)
+                yield file_path, file_path
+
+def bulk_ingest(
+    rag,
+    path: str,
+    manifest_path: Optional[str] = None,
+    batch_size: Optional[int] = None
+) -> dict:
+    """
+    Ingest every supported document under a directory or in a zip archive.
+
+    Files are deduplicated by content hash. Parsing runs on the loader's
+    process pool a few files ahead, embedding runs concurrently inside the
+    embeddings provider, and each file's vector store write overlaps with
+    embedding of the next one. Completed files are recorded in the
+    manifest, so re-running after an interruption skips them.
+
+    Args:
+        rag: CloudRAG instance
+        path: Directory or .zip file
+        manifest_path: JSON Lines manifest (defaults to "<path>.manifest.jsonl")
+        batch_size: Chunks per embedding batch (defaults to INGEST_BATCH_SIZE)
+
+    Returns:
+        Run statistics with per-stage throughput
+    """
+    manifest = IngestManifest(manifest_path or default_manifest_path(path))
+    batch_size = batch_size or rag.config.INGEST_BATCH_SIZE
+
+    stats = {
+        "files_seen": 0,
+        "files_ingested": 0,
+        "files_skipped": 0,
+        "files_duplicate": 0,
+        "files_failed": 0,
+        "chunks": 0,
+        "embeddings": 0,
+        "parse_seconds": 0.0,
+        "embed_seconds": 0.0,
+        "index_seconds": 0.0
+    }
+    # path on disk -> (display name, content hash)
+    pending_files: Dict[str, Tuple[str, str]] = {}
+    seen_hashes = set()
+    started = time.time()
+
+    extract_dir = tempfile.mkdtemp(prefix="bulk_ingest_")
+    index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-index")
+    pending_index: Optional[Tuple[Future, str, str, int]] = None
+
+    def cleanup(file_path: str):
+        if file_path.startswith(extract_dir):
+            os.remove(file_path)
+
+    def files_to_parse() -> Iterator[str]:
+        for name, file_path in iter_source_files(path, extract_dir):
+            stats["files_seen"] += 1
+            content_hash = hash_file(file_path)
+
+            if content_hash in seen_hashes:
+                stats["files_duplicate"] += 1
+                cleanup(file_path)
+                continue
+            if manifest.is_done(content_hash):
+                stats["files_skipped"] += 1
+                cleanup(file_path)
+                continue
+
+            seen_hashes.add(content_hash)
+            pending_files[file_path] = (name, content_hash)
+            yield file_path
+
+    def index_file(name, texts, metadatas, embeddings):
+        index_started = time.time()
+        previous_ids = rag.vector_store.get_source_ids(name)
+        current_ids = set()
+        for start in range(0, len(texts), batch_size):
+            current_ids.update(rag.index_chunks(
+                texts[start:start + batch_size],
+                metadatas[start:start + batch_size],
+                embeddings[start:start + batch_size]
+            ))
+        rag.remove_stale_chunks(name, previous_ids, current_ids)
+        stats["index_seconds"] += time.time() - index_started
+
+    def finish_pending_index():
+        content_hash, name, num_chunks = pending_index[1:]
+        try:
+            pending_index[0].result()
+            manifest.record(content_hash, name, "done", chunks=num_chunks)
+            stats["files_ingested"] += 1
+            stats["chunks"] += num_chunks
+        except Exception as e:
+            manifest.record(content_hash, name, "failed", error=f"index: {str(e)}")
+            stats["files_failed"] += 1
+            print(f"❌ {name}: {str(e)}")
+
+    try:
+        results = rag.document_loader.load_documents(files_to_parse())
+        while True:
+            parse_started = time.time()
+            item = next(results, None)
+            stats["parse_seconds"] += time.time() - parse_started
+            if item is None:
+                break
+
+            file_path, chunks, error = item
+            name, content_hash = pending_files.pop(file_path)
+            cleanup(file_path)
+
+            if error:
+                manifest.record(content_hash, name, "failed", error=f"parse: {error}")
+                stats["files_failed"] += 1
+                print(f"❌ {name}: {error}")
+                continue
+
+            texts = [chunk["content"] for chunk in chunks]
+            metadatas = [{**chunk["metadata"], "source": name} for chunk in chunks]
+
+            try:
+                embed_started = time.time()
+                embeddings = rag.embed_new_chunks(texts, metadatas)
+                stats["embed_seconds"] += time.time() - embed_started
+                stats["embeddings"] += sum(1 for embedding in embeddings if embedding is not None)
+            except Exception as e:
+                manifest.record(content_hash, name, "failed", error=f"embed: {str(e)}")
+                stats["files_failed"] += 1
+                print(f"❌ {name}: {str(e)}")
+                continue
+
+            # Let the previous file's write finish before queueing this one
+            if pending_index:
+                finish_pending_index()
+            pending_index = (
+                index_executor.submit(index_file, name, texts, metadatas, embeddings),
+                content_hash,
+                name,
+                len(chunks)
+            )
+            print(f"📄 {name}: {len(chunks)} chunks")
+
+        if pending_index:
+            finish_pending_index()
+            pending_index = None
+    finally:
+        if pending_index:
+            finish_pending_index()
+        index_executor.shutdown(wait=True)
+        manifest.close()
+        shutil.rmtree(extract_dir, ignore_errors=True)
+
+    elapsed = time.time() - started
+    stats["elapsed_seconds"] = round(elapsed, 3)
+    stats["files_per_second"] = round(stats["files_ingested"] / elapsed, 2) if elapsed else 0.0
+    stats["chunks_per_second"] = round(stats["chunks"] / elapsed, 2) if elapsed else 0.0
+    stats["embeddings_per_second"] = (
+        round(stats["embeddings"] / stats["embed_seconds"], 2) if stats["embed_seconds"] else 0.0
+    )
+    for key in ("parse_seconds", "embed_seconds", "index_seconds"):
+        stats[key] = round(stats[key], 3)
+
+    return stats
+
+def print_stats(stats: dict):
+    """Print a bulk ingestion summary."""
+    print("\n" + "="*70)
+    print("📦 BULK INGESTION SUMMARY")
+    print("="*70)
+    print(f"Files: {stats['files_ingested']} ingested, {stats['files_skipped']} already done, "
+          f"{stats['files_duplicate']} duplicates, {stats['files_failed']} failed")
+    print(f"Chunks: {stats['chunks']}   Embeddings: {stats['embeddings']}")
+    print(f"Time: {stats['elapsed_seconds']}s "
+          f"(parse {stats['parse_seconds']}s, embed {stats['embed_seconds']}s, index {stats['index_seconds']}s)")
+    print(f"Throughput: {stats['files_per_second']} files/s, {stats['chunks_per_second']} chunks/s, "
+          f"{stats['embeddings_per_second']} embeddings/s")
+    print("="*70 + "\n")
+
+def main():
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory or zip archive into the knowledge base")
+    parser.add_argument("path", help="Directory or .zip archive to ingest")
+    parser.add_argument("--manifest", help="Manifest file for resuming (default: <path>.manifest.jsonl)")
+    parser.add_argument("--batch-size", type=int, help="Chunks per embedding batch")
+    parser.add_argument("--tenant", help="Tenant whose knowledge base receives the documents")
+    args = parser.parse_args()
+
+    from rag_system import CloudRAG
+    from tenants import TenantManager
+
+    base = CloudRAG()
+    tenants = TenantManager(base, default_tenant=base.config.DEFAULT_TENANT)
+    try:
+        tenants.resolve(args.tenant)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        with tenants.lease(args.tenant, create=True) as rag:
+            stats = bulk_ingest(rag, args.path, manifest_path=args.manifest, batch_size=args.batch_size)
+    finally:
+        tenants.close()
+    print_stats(stats)
+
+if __name__ == "__main__":
+    main()
@@ -11,10 +11,48 @@ class Config:
     # HuggingFace Token - REQUIRED
     HF_TOKEN: str = os.getenv("HF_TOKEN") or os.getenv("HUGGINGFACE_TOKEN") or ""
     
+    # Inference API base URL (point at a local stand-in for offline benchmarks)
+    HF_API_BASE: str = os.getenv("HF_API_BASE", "https://router.huggingface.co")
+    
     # Model Selection
     LLM_MODEL: str = "moonshotai/Kimi-K2-Instruct:novita"
     EMBEDDING_MODEL: str = "BAAI/bge-large-en-v1.5"
     
+    # Embedding Backend: "huggingface" (remote API) or "local" (ONNX on CPU).
+    # Backends produce different vectors; clear the knowledge base when switching.
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "huggingface")
+    LOCAL_EMBEDDING_MODEL: str = "Xenova/bge-small-en-v1.5"
+    LOCAL_EMBEDDING_QUANTIZED: bool = True
+    LOCAL_EMBEDDING_THREADS: int = 0
+    LOCAL_EMBEDDING_POOLING: str = "cls"
+    
+    # Embedding Batching
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_BATCH_MAX_CHARS: int = 16000
+    EMBEDDING_MAX_IN_FLIGHT: int = 4
+    
+    # Embedding Cache
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "./data/embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 200000
+    
+    # HTTP Connection Pool
+    HTTP_POOL_SIZE: int = 16
+    
+    # Provider Resilience (each provider: embeddings, LLM)
+    # Rate limit in requests/s (0 = unlimited) with a token-bucket burst;
+    # concurrency adapts below the ceiling, halving on 429/503
+    PROVIDER_RATE_LIMIT: float = float(os.getenv("PROVIDER_RATE_LIMIT", "0"))
+    PROVIDER_BURST: int = 10
+    PROVIDER_MAX_CONCURRENCY: int = 16
+    # Retries of 429/5xx/timeouts, with exponential backoff and jitter
+    PROVIDER_MAX_RETRIES: int = 4
+    PROVIDER_BACKOFF_BASE: float = 0.5
+    PROVIDER_BACKOFF_MAX: float = 30.0
+    # Consecutive failures that open the circuit, and seconds it stays open
+    PROVIDER_BREAKER_THRESHOLD: int = 5
+    PROVIDER_BREAKER_RESET: float = 30.0
+    
     # Generation Parameters
     MAX_TOKENS: int = 512
     TEMPERATURE: float = 0.7
@@ -24,9 +62,81 @@ class Config:
     COLLECTION_NAME: str = "rag_knowledge"
     TOP_K_RESULTS: int = 4
     
+    # Vector Index Backend: "chroma" or "local" (in-process NumPy, HNSW when large)
+    VECTOR_BACKEND: str = os.getenv("VECTOR_BACKEND", "chroma")
+    HNSW_MIN_ITEMS: int = 50000
+    HNSW_M: int = 16
+    HNSW_EF_CONSTRUCTION: int = 200
+    HNSW_EF_SEARCH: int = 64
+    # Compressed vectors scanned by local exact search ("float32", "float16", "int8"),
+    # with the best top_k * VECTOR_RERANK_FACTOR re-ranked on exact vectors.
+    # int8 uses ~4x less memory at float32 speed; float16 halves it but scans slower.
+    # Compressed collections never switch to HNSW (its graph holds float32 copies),
+    # and the Chroma backend always stores float32.
+    VECTOR_DTYPE: str = "float32"
+    VECTOR_RERANK_FACTOR: int = 4
+    
+    # Hybrid Retrieval (BM25 + vector, reciprocal-rank fusion)
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_DENSE_WEIGHT: float = 1.0
+    HYBRID_LEXICAL_WEIGHT: float = 1.0
+    HYBRID_RRF_K: int = 60
+    HYBRID_CANDIDATES: int = 20
+    
+    # Reranking: "overlap" (token overlap), "cross-encoder" (ONNX on CPU) or "none".
+    # RERANK_CANDIDATES are retrieved and the best TOP_K_RESULTS sent to the LLM.
+    RERANKER: str = os.getenv("RERANKER", "overlap")
+    RERANK_CANDIDATES: int = 20
+    RERANK_MODEL: str = "Xenova/ms-marco-MiniLM-L-6-v2"
+    RERANK_BATCH_SIZE: int = 16
+    
+    # Context Assembly: adjacent chunks are merged, near-duplicates (share of
+    # shingles already in a better chunk >= threshold) dropped, and the rest
+    # packed into the token budget (estimated at ~4 characters per token).
+    CONTEXT_TOKEN_BUDGET: int = 1500
+    CONTEXT_DUPLICATE_THRESHOLD: float = 0.8
+    CONTEXT_MERGE_ADJACENT: bool = True
+    
+    # Semantic Answer Cache
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_MAX_DISTANCE: float = 0.05
+    
+    # Request Coalescing: concurrent identical questions share one embedding,
+    # search and answer; waiters give up after SINGLE_FLIGHT_TIMEOUT seconds
+    # (0 derives it from the provider timeouts, retries and backoff, so
+    # waiters outlast the leader's own retries)
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_TIMEOUT: float = 0.0
+    
+    # Batch Queries: questions embedded and searched together per chunk,
+    # and LLM generations in flight at once
+    BATCH_QUERY_CHUNK: int = 64
+    BATCH_LLM_CONCURRENCY: int = 8
+    BATCH_MAX_QUESTIONS: int = 10000
+    
     # Document Processing
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
+    STREAM_BLOCK_CHARS: int = 1000000
+    
+    # Parallel Parsing (1 worker parses in-process)
+    PARSER_WORKERS: int = min(4, os.cpu_count() or 1)
+    PDF_PAGES_PER_SHARD: int = 16
+    
+    # Background Ingestion
+    INGEST_WORKERS: int = 2
+    INGEST_QUEUE_SIZE: int = 16
+    INGEST_BATCH_SIZE: int = 64
+
+    # Multi-Tenancy: requests pick a knowledge base with the X-Tenant-ID header
+    # (DEFAULT_TENANT, the COLLECTION_NAME collection, if absent). Tenant
+    # collections open on first use; the least recently used idle ones close
+    # once more than TENANT_MAX_RESIDENT are open or their indexes exceed
+    # TENANT_MEMORY_BUDGET_MB
+    DEFAULT_TENANT: str = "default"
+    TENANT_MAX_RESIDENT: int = 64
+    TENANT_MEMORY_BUDGET_MB: int = 1024
 
 def get_config() -> Config:
     """Get system configuration."""
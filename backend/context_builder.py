@@ -0,0 +1,217 @@
+"""
+Context Builder
+Assemble retrieved chunks into a deduplicated, token-budgeted prompt context
+"""
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Set
+
+_WORD_PATTERN = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"[.!?\n]\s")
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the LLM token count of a text (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+def shingles(text: str, size: int = 5) -> Set[int]:
+    """Hashed word n-grams of a text (the whole text if shorter than one n-gram)."""
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {
+        zlib.crc32(" ".join(words[i:i + size]).encode("utf-8"))
+        for i in range(len(words) - size + 1)
+    }
+
+class ContextBuilder:
+    """
+    Turns ranked retrieval results into the blocks sent to the LLM.
+
+    1. Chunks adjacent in the same source are merged into one block, with
+       their overlapping text included once.
+    2. Blocks whose shingles are mostly contained in a better-ranked block
+       (overlaps, repeated boilerplate, re-uploaded copies) are dropped.
+    3. Blocks are packed in rank order into the token budget; the first
+       block that does not fit is cut at a sentence boundary.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 1500,
+        duplicate_threshold: float = 0.8,
+        merge_adjacent: bool = True,
+        shingle_size: int = 5,
+        min_partial_tokens: int = 64
+    ):
+        """
+        Initialize the context builder.
+
+        Args:
+            token_budget: Maximum estimated tokens of context
+            duplicate_threshold: Share of a block's shingles found in a
+                better-ranked block above which it is dropped
+            merge_adjacent: Merge consecutive chunks of the same source
+            shingle_size: Words per shingle
+            min_partial_tokens: Smallest truncated block worth including
+        """
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.merge_adjacent = merge_adjacent
+        self.shingle_size = shingle_size
+        self.min_partial_tokens = min_partial_tokens
+
+        self.builds = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.duplicates_dropped = 0
+        self.chunks_merged = 0
+        self._lock = threading.Lock()
+
+    def build(self, documents: List[Dict]) -> List[Dict]:
+        """
+        Assemble the context blocks for a prompt.
+
+        Args:
+            documents: Retrieval results, best first
+
+        Returns:
+            Blocks, best first; each is shaped like a retrieval result (its
+            metadata is the best member's) plus "ids" listing every chunk
+            it contains
+        """
+        tokens_in = sum(estimate_tokens(doc["content"]) for doc in documents)
+
+        blocks = self._merge(documents) if self.merge_adjacent else [
+            {**doc, "ids": [doc["id"]]} for doc in documents
+        ]
+        merged = len(documents) - len(blocks)
+        blocks, dropped = self._dedupe(blocks)
+        blocks = self._pack(blocks)
+
+        with self._lock:
+            self.builds += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += sum(estimate_tokens(block["content"]) for block in blocks)
+            self.duplicates_dropped += dropped
+            self.chunks_merged += merged
+
+        return blocks
+
+    def _merge(self, documents: List[Dict]) -> List[Dict]:
+        """Merge runs of consecutive chunks from the same source."""
+        # (source, chunk_index) -> rank of that chunk in the results
+        positions = {}
+        for rank, doc in enumerate(documents):
+            index = doc["metadata"].get("chunk_index")
+            if index is not None:
+                positions.setdefault((doc["metadata"].get("source"), index), rank)
+
+        blocks = []
+        consumed = set()
+        for rank, doc in enumerate(documents):
+            if rank in consumed:
+                continue
+
+            source = doc["metadata"].get("source")
+            index = doc["metadata"].get("chunk_index")
+            if index is None:
+                blocks.append({**doc, "ids": [doc["id"]]})
+                continue
+
+            # Extend the run in both directions through retrieved neighbours
+            first = index
+            while (source, first - 1) in positions and positions[(source, first - 1)] not in consumed:
+                first -= 1
+            last = index
+            while (source, last + 1) in positions and positions[(source, last + 1)] not in consumed:
+                last += 1
+
+            members = [positions[(source, i)] for i in range(first, last + 1)]
+            consumed.update(members)
+
+            content = documents[members[0]]["content"]
+            for member in members[1:]:
+                content = self._join(content, documents[member]["content"])
+
+            blocks.append({
+                **doc,
+                "content": content,
+                "ids": [documents[member]["id"] for member in members]
+            })
+
+        return blocks
+
+    @staticmethod
+    def _join(left: str, right: str, probe_chars: int = 50) -> str:
+        """Concatenate consecutive chunks, keeping their shared overlap once."""
+        probe = right[:probe_chars]
+        # The overlap is a suffix of the left chunk; look for where it starts
+        start = left.rfind(probe) if probe else -1
+        while start >= 0:
+            if right.startswith(left[start:]):
+                return left + right[len(left) - start:]
+            start = left.rfind(probe, 0, start)
+        return left + "\n" + right
+
+    def _dedupe(self, blocks: List[Dict]):
+        """Drop blocks mostly contained in a better-ranked block; returns (kept, dropped)."""
+        kept = []
+        kept_shingles: List[Set[int]] = []
+        dropped = 0
+
+        for block in blocks:
+            block_shingles = shingles(block["content"], self.shingle_size)
+            duplicate = block_shingles and any(
+                len(block_shingles & other) / len(block_shingles) >= self.duplicate_threshold
+                for other in kept_shingles
+            )
+            if duplicate:
+                dropped += 1
+                continue
+            kept.append(block)
+            kept_shingles.append(block_shingles)
+
+        return kept, dropped
+
+    def _pack(self, blocks: List[Dict]) -> List[Dict]:
+        """Keep blocks in rank order until the token budget is spent."""
+        packed = []
+        remaining = self.token_budget
+
+        for block in blocks:
+            tokens = estimate_tokens(block["content"])
+            if tokens <= remaining:
+                packed.append(block)
+                remaining -= tokens
+                continue
+
+            if remaining >= self.min_partial_tokens:
+                truncated = self._truncate(block["content"], remaining * 4)
+                if truncated:
+                    packed.append({**block, "content": truncated, "truncated": True})
+            break
+
+        return packed
+
+    @staticmethod
+    def _truncate(text: str, max_chars: int) -> Optional[str]:
+        """Cut text at the last sentence end within max_chars."""
+        head = text[:max_chars]
+        ends = [match.end() for match in _SENTENCE_END.finditer(head)]
+        if ends:
+            return head[:ends[-1]].rstrip()
+        return None
+
+    def get_stats(self) -> dict:
+        """Get context assembly statistics."""
+        with self._lock:
+            return {
+                "builds": self.builds,
+                "token_budget": self.token_budget,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "duplicates_dropped": self.duplicates_dropped,
+                "chunks_merged": self.chunks_merged
+            }
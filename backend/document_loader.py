@@ -2,152 +2,424 @@
 Document Loaders
 Load and process different document types
 """
-from typing import List, Dict, Any
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from metrics import INGEST_STAGE_SECONDS, span, timed_iter
+
+_parser_pool = None
+_parser_pool_lock = threading.Lock()
+
+# DocumentLoader instances reused inside worker processes
+_worker_loaders: Dict[Tuple[int, int], "DocumentLoader"] = {}
+
+def get_parser_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Get the process pool used for CPU-bound document parsing.
+    
+    Created on first use with the "spawn" start method, so workers never
+    inherit the API server's threads or open connections.
+    
+    Args:
+        workers: Number of worker processes
+        
+    Returns:
+        Shared process pool
+    """
+    global _parser_pool
+    
+    if _parser_pool is None:
+        with _parser_pool_lock:
+            if _parser_pool is None:
+                _parser_pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    
+    return _parser_pool
+
+def shutdown_parser_pool():
+    """Stop the parsing worker processes."""
+    global _parser_pool
+    
+    with _parser_pool_lock:
+        if _parser_pool is not None:
+            _parser_pool.shutdown(wait=False, cancel_futures=True)
+            _parser_pool = None
+
+def _ordered_map(
+    executor: Executor,
+    fn: Callable,
+    args: Iterable[tuple],
+    max_in_flight: int
+) -> Iterator[Any]:
+    """Run ``fn(*arg)`` on an executor, yielding results in submission order."""
+    pending = deque()
+    try:
+        for arg in args:
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+            pending.append(executor.submit(fn, *arg))
+        
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+def _extract_pdf_pages(file_path: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) of a PDF (runs in a worker process)."""
+    import pypdf
+    
+    with open(file_path, 'rb') as f:
+        pdf_reader = pypdf.PdfReader(f)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def _load_document_in_worker(
+    file_path: str,
+    doc_type: Optional[str],
+    chunk_size: int,
+    chunk_overlap: int
+) -> List[Dict[str, Any]]:
+    """Load and chunk a whole document (runs in a worker process)."""
+    key = (chunk_size, chunk_overlap)
+    if key not in _worker_loaders:
+        _worker_loaders[key] = DocumentLoader(chunk_size, chunk_overlap)
+    return _worker_loaders[key].load_document(file_path, doc_type)
 
 class DocumentLoader:
     """Load and chunk documents."""
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        stream_block_chars: int = 1_000_000,
+        parser_workers: int = 1,
+        pdf_pages_per_shard: int = 16
+    ):
         """
         Initialize document loader.
         
         Args:
             chunk_size: Size of text chunks
             chunk_overlap: Overlap between chunks
+            stream_block_chars: Characters buffered before splitting when streaming
+            parser_workers: Worker processes for parsing (1 parses in-process)
+            pdf_pages_per_shard: Pages of a PDF extracted per worker task
         """
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-        )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.stream_block_chars = max(stream_block_chars, chunk_size * 4)
+        self.parser_workers = max(1, parser_workers)
+        self.pdf_pages_per_shard = max(1, pdf_pages_per_shard)
+        self._text_splitter = None
     
-    def load_text(self, file_path: str) -> List[Dict[str, Any]]:
-        """Load a text file."""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+    @property
+    def text_splitter(self):
+        """Recursive character splitter, created on first use (langchain is slow to import)."""
+        if self._text_splitter is None:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                length_function=len,
+            )
+        return self._text_splitter
+    
+    def _split_text(self, text: str) -> List[str]:
+        """Split text into chunks, timed as the "chunk" ingest stage."""
+        with span(INGEST_STAGE_SECONDS, "chunk"):
+            return self.text_splitter.split_text(text)
+    
+    def _split_blocks(self, blocks: Iterable[str], separator: str = "") -> Iterator[str]:
+        """
+        Split a stream of text blocks into chunks with bounded memory.
         
-        chunks = self.text_splitter.split_text(text)
+        Blocks are buffered until ``stream_block_chars`` characters are
+        available, then split; every chunk but the last is emitted and the
+        raw text of the last one is carried into the next buffer, so no text
+        is lost at block boundaries and consecutive chunks keep their overlap.
         
-        return [
-            {
+        Args:
+            blocks: Text pieces in document order
+            separator: Text placed between consecutive blocks
+            
+        Yields:
+            Chunk texts
+        """
+        parts: List[str] = []
+        size = 0
+        
+        for block in blocks:
+            if parts and separator:
+                parts.append(separator)
+                size += len(separator)
+            parts.append(block)
+            size += len(block)
+            
+            if size >= self.stream_block_chars:
+                buffer = "".join(parts)
+                chunks = self._split_text(buffer)
+                for chunk in chunks[:-1]:
+                    yield chunk
+                
+                carry = ""
+                if chunks:
+                    position = buffer.rfind(chunks[-1])
+                    carry = buffer[position:] if position >= 0 else chunks[-1]
+                parts = [carry] if carry else []
+                size = len(carry)
+        
+        if parts:
+            yield from self._split_text("".join(parts))
+    
+    def _with_metadata(
+        self,
+        chunks: Iterable[str],
+        file_path: str,
+        doc_type: str,
+        start_index: int = 0,
+        **extra: Any
+    ) -> Iterator[Dict[str, Any]]:
+        """Wrap chunk texts in chunk dictionaries with source metadata."""
+        for i, chunk in enumerate(chunks, start=start_index):
+            yield {
                 "content": chunk,
                 "metadata": {
                     "source": file_path,
                     "chunk_index": i,
-                    "type": "text"
+                    "type": doc_type,
+                    **extra
                 }
             }
-            for i, chunk in enumerate(chunks)
-        ]
     
-    def load_pdf(self, file_path: str) -> List[Dict[str, Any]]:
-        """Load a PDF file."""
+    def iter_text(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """Stream chunks from a text file, reading it block by block."""
+        def blocks():
+            with open(file_path, 'r', encoding='utf-8') as f:
+                while True:
+                    block = f.read(self.stream_block_chars)
+                    if not block:
+                        return
+                    yield block
+        
+        blocks = timed_iter(blocks(), INGEST_STAGE_SECONDS, "parse")
+        yield from self._with_metadata(self._split_blocks(blocks), file_path, "text")
+    
+    def _iter_pdf_pages(self, file_path: str) -> Iterator[str]:
+        """
+        Extract the text of each PDF page in order.
+        
+        With more than one parser worker, page ranges are sharded across the
+        process pool (a bounded number at a time) and reassembled in order.
+        """
         try:
             import pypdf
+        except ImportError:
+            raise ImportError("pypdf not installed. Install with: pip install pypdf")
+        
+        with open(file_path, 'rb') as f:
+            pdf_reader = pypdf.PdfReader(f)
+            num_pages = len(pdf_reader.pages)
             
-            text = ""
-            with open(file_path, 'rb') as f:
-                pdf_reader = pypdf.PdfReader(f)
-                for page_num, page in enumerate(pdf_reader.pages):
-                    text += f"\n--- Page {page_num + 1} ---\n"
-                    text += page.extract_text()
+            if self.parser_workers == 1 or num_pages <= self.pdf_pages_per_shard:
+                for page in pdf_reader.pages:
+                    yield page.extract_text() or ""
+                return
+        
+        shards = (
+            (file_path, start, min(start + self.pdf_pages_per_shard, num_pages))
+            for start in range(0, num_pages, self.pdf_pages_per_shard)
+        )
+        for page_texts in _ordered_map(
+            get_parser_pool(self.parser_workers),
+            _extract_pdf_pages,
+            shards,
+            max_in_flight=self.parser_workers * 2
+        ):
+            yield from page_texts
+    
+    def iter_pdf(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """Stream chunks from a PDF file, one page at a time."""
+        chunk_index = 0
+        pages = timed_iter(self._iter_pdf_pages(file_path), INGEST_STAGE_SECONDS, "parse")
+        for page_num, page_text in enumerate(pages):
+            if not page_text.strip():
+                continue
             
-            chunks = self.text_splitter.split_text(text)
+            text = f"--- Page {page_num + 1} ---\n" + page_text
+            chunks = self._split_text(text)
             
-            return [
-                {
-                    "content": chunk,
-                    "metadata": {
-                        "source": file_path,
-                        "chunk_index": i,
-                        "type": "pdf"
-                    }
-                }
-                for i, chunk in enumerate(chunks)
-            ]
-        except ImportError:
-            raise ImportError("pypdf not installed. Install with: pip install pypdf")
+            yield from self._with_metadata(chunks, file_path, "pdf", chunk_index, page=page_num + 1)
+            chunk_index += len(chunks)
     
-    def load_docx(self, file_path: str) -> List[Dict[str, Any]]:
-        """Load a Word document."""
+    def iter_docx(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """Stream chunks from a Word document, paragraph by paragraph."""
         try:
             from docx import Document
-            
-            doc = Document(file_path)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-            
-            chunks = self.text_splitter.split_text(text)
-            
-            return [
-                {
-                    "content": chunk,
-                    "metadata": {
-                        "source": file_path,
-                        "chunk_index": i,
-                        "type": "docx"
-                    }
-                }
-                for i, chunk in enumerate(chunks)
-            ]
         except ImportError:
             raise ImportError("python-docx not installed. Install with: pip install python-docx")
+        
+        with span(INGEST_STAGE_SECONDS, "parse"):
+            doc = Document(file_path)
+        paragraphs = (paragraph.text for paragraph in doc.paragraphs)
+        
+        yield from self._with_metadata(self._split_blocks(paragraphs, "\n"), file_path, "docx")
     
-    def load_html(self, file_path: str) -> List[Dict[str, Any]]:
-        """Load an HTML file."""
+    def iter_html(self, file_path: str) -> Iterator[Dict[str, Any]]:
+        """Stream chunks from an HTML file, text node by text node."""
         try:
             from bs4 import BeautifulSoup
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-            
-            soup = BeautifulSoup(html_content, 'html.parser')
-            text = soup.get_text(separator='\n', strip=True)
-            
-            chunks = self.text_splitter.split_text(text)
-            
-            return [
-                {
-                    "content": chunk,
-                    "metadata": {
-                        "source": file_path,
-                        "chunk_index": i,
-                        "type": "html"
-                    }
-                }
-                for i, chunk in enumerate(chunks)
-            ]
         except ImportError:
             raise ImportError("beautifulsoup4 not installed. Install with: pip install beautifulsoup4")
+        
+        # BeautifulSoup needs the whole tree; chunking still streams from it
+        with span(INGEST_STAGE_SECONDS, "parse"), open(file_path, 'r', encoding='utf-8') as f:
+            soup = BeautifulSoup(f, 'html.parser')
+        
+        yield from self._with_metadata(self._split_blocks(soup.stripped_strings, "\n"), file_path, "html")
     
-    def load_document(self, file_path: str, doc_type: str = None) -> List[Dict[str, Any]]:
+    def load_text(self, file_path: str) -> List[Dict[str, Any]]:
+        """Load a text file."""
+        return list(self.iter_text(file_path))
+    
+    def load_pdf(self, file_path: str) -> List[Dict[str, Any]]:
+        """Load a PDF file."""
+        return list(self.iter_pdf(file_path))
+    
+    def load_docx(self, file_path: str) -> List[Dict[str, Any]]:
+        """Load a Word document."""
+        return list(self.iter_docx(file_path))
+    
+    def load_html(self, file_path: str) -> List[Dict[str, Any]]:
+        """Load an HTML file."""
+        return list(self.iter_html(file_path))
+    
+    def _detect_type(self, file_path: str) -> str:
+        """Auto-detect the document type from the file extension."""
+        if file_path.endswith('.pdf'):
+            return 'pdf'
+        elif file_path.endswith('.docx'):
+            return 'docx'
+        elif file_path.endswith('.html') or file_path.endswith('.htm'):
+            return 'html'
+        else:
+            return 'text'
+    
+    def iter_document(self, file_path: str, doc_type: str = None) -> Iterator[Dict[str, Any]]:
         """
-        Load a document based on file type.
+        Stream the chunks of a document as it is parsed.
         
         Args:
             file_path: Path to document
             doc_type: Document type (txt, pdf, docx, html) - auto-detected if None
             
-        Returns:
-            List of document chunks with metadata
+        Yields:
+            Document chunks with metadata (PDF chunks carry their page number)
         """
-        # Auto-detect type from extension
         if doc_type is None:
-            if file_path.endswith('.pdf'):
-                doc_type = 'pdf'
-            elif file_path.endswith('.docx'):
-                doc_type = 'docx'
-            elif file_path.endswith('.html') or file_path.endswith('.htm'):
-                doc_type = 'html'
-            else:
-                doc_type = 'text'
-        
-        # Load based on type
+            doc_type = self._detect_type(file_path)
+        
         if doc_type == 'pdf':
-            return self.load_pdf(file_path)
+            return self.iter_pdf(file_path)
         elif doc_type == 'docx':
-            return self.load_docx(file_path)
+            return self.iter_docx(file_path)
         elif doc_type == 'html':
-            return self.load_html(file_path)
+            return self.iter_html(file_path)
         else:
-            return self.load_text(file_path)
+            return self.iter_text(file_path)
+    
+    def iter_document_batches(
+        self,
+        file_path: str,
+        doc_type: str = None,
+        batch_size: int = 64
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Stream the chunks of a document in bounded batches.
+        
+        Args:
+            file_path: Path to document
+            doc_type: Document type - auto-detected if None
+            batch_size: Maximum number of chunks per batch
+            
+        Yields:
+            Lists of at most ``batch_size`` chunks
+        """
+        chunks = self.iter_document(file_path, doc_type)
+        while True:
+            batch = list(islice(chunks, batch_size))
+            if not batch:
+                return
+            yield batch
+    
+    def load_document(self, file_path: str, doc_type: str = None) -> List[Dict[str, Any]]:
+        """
+        Load a document based on file type.
+        
+        Args:
+            file_path: Path to document
+            doc_type: Document type (txt, pdf, docx, html) - auto-detected if None
+            
+        Returns:
+            List of document chunks with metadata
+        """
+        return list(self.iter_document(file_path, doc_type))
+    
+    def load_documents(
+        self,
+        file_paths: Iterable[str],
+        doc_type: str = None
+    ) -> Iterator[Tuple[str, List[Dict[str, Any]], Optional[str]]]:
+        """
+        Load a batch of documents, parsing files in parallel.
+        
+        Each file is parsed whole in a worker process (in-process when
+        ``parser_workers`` is 1); results come back in input order.
+        ``file_paths`` is consumed lazily, a few files ahead of the results.
+        
+        Args:
+            file_paths: Paths to documents
+            doc_type: Document type for every file - auto-detected if None
+            
+        Yields:
+            Tuples of (file path, chunks, error message or None)
+        """
+        if self.parser_workers == 1:
+            for file_path in file_paths:
+                try:
+                    yield file_path, self.load_document(file_path, doc_type), None
+                except Exception as e:
+                    yield file_path, [], str(e)
+            return
+        
+        pool = get_parser_pool(self.parser_workers)
+        pending = deque()
+        paths = iter(file_paths)
+        
+        def submit_next() -> bool:
+            file_path = next(paths, None)
+            if file_path is None:
+                return False
+            future = pool.submit(
+                _load_document_in_worker, file_path, doc_type, self.chunk_size, self.chunk_overlap
+            )
+            pending.append((file_path, future))
+            return True
+        
+        for _ in range(self.parser_workers * 2):
+            if not submit_next():
+                break
+        
+        while pending:
+            file_path, future = pending.popleft()
+            try:
+                yield file_path, future.result(), None
+            except Exception as e:
+                yield file_path, [], str(e)
+            submit_next()
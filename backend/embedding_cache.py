@@ -0,0 +1,187 @@
+"""
+Persistent Embedding Cache
+Content-addressed, disk-backed cache for embedding vectors
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache keyed by (model, normalized text hash)."""
+
+    def __init__(self, path: str, max_entries: int = 200000):
+        """
+        Initialize the embedding cache.
+
+        Args:
+            path: SQLite database file
+            max_entries: Maximum number of cached vectors before LRU eviction
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access"
+            " ON embeddings (last_access)"
+        )
+        self._conn.commit()
+        # Kept up to date by this process; recounted before evicting, in
+        # case other processes share the file
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize text so trivially different copies share a cache entry."""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def make_key(self, model_name: str, text: str) -> str:
+        """Build the cache key for a text embedded with a given model."""
+        digest = hashlib.sha256(self.normalize(text).encode("utf-8")).hexdigest()
+        return f"{model_name}:{digest}"
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up cached embeddings.
+
+        Args:
+            model_name: Embedding model name
+            texts: Texts to look up
+
+        Returns:
+            One entry per text: the cached vector, or None on a miss
+        """
+        keys = [self.make_key(model_name, text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for result in results if result is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return results
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        """Look up a single cached embedding."""
+        return self.get_many(model_name, [text])[0]
+
+    def put_many(self, model_name: str, texts: List[str], vectors: Sequence[np.ndarray]):
+        """
+        Store embeddings, evicting least recently used entries if needed.
+
+        Args:
+            model_name: Embedding model name
+            texts: Embedded texts
+            vectors: Embedding vectors, one per text
+        """
+        if not texts:
+            return
+
+        now = time.time()
+        rows = [
+            (
+                self.make_key(model_name, text),
+                model_name,
+                np.asarray(vector, dtype=np.float32).tobytes(),
+                now
+            )
+            for text, vector in zip(texts, vectors)
+        ]
+
+        with self._lock:
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, vector, last_access)"
+                " VALUES (?, ?, ?, ?)",
+                rows
+            ).rowcount
+            if inserted < len(rows):
+                # Some keys were already cached: refresh them
+                self._conn.executemany(
+                    "UPDATE embeddings SET vector = ?, last_access = ? WHERE key = ?",
+                    [(vector, last_access, key) for key, _, vector, last_access in rows]
+                )
+            self._count += inserted
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def put(self, model_name: str, text: str, vector: np.ndarray):
+        """Store a single embedding."""
+        self.put_many(model_name, [text], [vector])
+
+    def _evict(self):
+        """Drop least recently used entries above ``max_entries`` (caller holds the lock)."""
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = self._count - self.max_entries
+        if overflow > 0:
+            # Evict a little extra so we don't run this on every insert
+            overflow += self.max_entries // 20
+            self._count -= self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            ).rowcount
+
+    def clear(self):
+        """Remove all cached embeddings."""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._count = 0
+
+    def get_stats(self) -> dict:
+        """Get cache statistics."""
+        with self._lock:
+            entries = self._count
+
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -2,23 +2,66 @@
 HuggingFace Inference Providers - Embeddings Provider
 Cloud-based text embeddings
 """
+import asyncio
+import httpx
+import numpy as np
 import requests
-from typing import List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Optional, Union
+from embedding_cache import EmbeddingCache
+from metrics import PROVIDER_RETRIES
+from provider_client import ProviderClient, ProviderError
+
+# Seconds each embedding attempt may take
+REQUEST_TIMEOUT = 30.0
 
 class HuggingFaceEmbeddings:
     """HuggingFace Inference Providers for text embeddings."""
     
-    def __init__(self, model_name: str, api_token: str):
+    def __init__(
+        self,
+        model_name: str,
+        api_token: str,
+        batch_size: int = 32,
+        max_batch_chars: int = 16000,
+        max_in_flight: int = 4,
+        session: Optional[requests.Session] = None,
+        async_client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[EmbeddingCache] = None,
+        api_base: str = "https://router.huggingface.co",
+        client: Optional[ProviderClient] = None
+    ):
         """
         Initialize HuggingFace embeddings.
         
         Args:
             model_name: Embedding model name
             api_token: HuggingFace API token
+            batch_size: Maximum number of texts sent per request
+            max_batch_chars: Maximum total characters sent per request
+            max_in_flight: Maximum number of concurrent batch requests
+            session: Pooled HTTP session (shared process-wide if None)
+            async_client: Pooled async HTTP client (shared process-wide if None)
+            cache: Persistent embedding cache consulted before the API
+            api_base: Inference API base URL
+            client: Rate-limited, retrying provider client (created from
+                ``session`` and ``async_client`` if None)
         """
         self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.max_batch_chars = max_batch_chars
+        self.max_in_flight = max(1, max_in_flight)
+        self.client = client or ProviderClient(
+            "embeddings",
+            session=session,
+            async_client=async_client,
+            max_concurrency=self.max_in_flight
+        )
+        self.cache = cache
+        self._executor = None
         # FIXED: Use new router endpoint instead of deprecated api-inference
-        self.api_url = f"https://router.huggingface.co/models/{model_name}"
+        self.api_url = f"{api_base.rstrip('/')}/models/{model_name}"
         self.api_token = api_token
         
         # Set embedding dimension based on model
@@ -43,23 +86,170 @@ class HuggingFaceEmbeddings:
         }
         return dimension_map.get(model_name, 768)  # Default to 768 if unknown
     
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
         """
         Generate embeddings for multiple documents.
         
+        Cached texts are served from the embedding cache. The rest are sent
+        to the API in batches (bounded by ``batch_size`` and
+        ``max_batch_chars``), up to ``max_in_flight`` batches at a time, and
+        the results are returned in input order.
+        
         Args:
             texts: List of text documents
             
         Returns:
-            List of embedding vectors
+            float32 matrix with one embedding row per text
         """
+        if self.cache is None:
+            return self._stack(self._embed_uncached(texts))
+        
+        embeddings = self.cache.get_many(self.model_name, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
+        if missing:
+            fresh = self._embed_uncached([texts[i] for i in missing])
+            for i, embedding in zip(missing, fresh):
+                embeddings[i] = embedding
+            self._cache_results([texts[i] for i in missing], fresh)
+        
+        return self._stack(embeddings)
+    
+    def _stack(self, embeddings: List[np.ndarray]) -> np.ndarray:
+        """Stack embedding vectors into one float32 matrix."""
+        if not embeddings:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        return np.stack(embeddings)
+    
+    def _cache_results(self, texts: List[str], embeddings: List[np.ndarray]):
+        """Store fresh embeddings in the cache."""
+        if texts:
+            self.cache.put_many(self.model_name, texts, embeddings)
+    
+    def _embed_uncached(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed texts through the API, batched and concurrent."""
         embeddings = []
-        for text in texts:
-            embedding = self.embed_query(text)
-            embeddings.append(embedding)
+        for batch_embeddings in self._map_in_flight(self._embed_batch, self._make_batches(texts)):
+            embeddings.extend(batch_embeddings)
         return embeddings
     
-    def embed_query(self, text: str) -> List[float]:
+    def _map_in_flight(self, fn, batches: Iterator[List[str]]) -> Iterator[List[np.ndarray]]:
+        """
+        Apply ``fn`` to each batch concurrently, yielding results in order.
+        
+        At most ``max_in_flight`` batches are submitted at once; the next
+        batch is only pulled from ``batches`` once the oldest one finishes,
+        so a slow provider applies backpressure to the producer.
+        """
+        if self.max_in_flight == 1:
+            for batch in batches:
+                yield fn(batch)
+            return
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_in_flight,
+                thread_name_prefix="embed"
+            )
+        
+        pending = deque()
+        try:
+            for batch in batches:
+                if len(pending) >= self.max_in_flight:
+                    yield pending.popleft().result()
+                pending.append(self._executor.submit(fn, batch))
+            
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+    
+    def _make_batches(self, texts: List[str]) -> Iterator[List[str]]:
+        """Group texts into batches respecting the size and character budget."""
+        batch = []
+        batch_chars = 0
+        for text in texts:
+            if batch and (
+                len(batch) >= self.batch_size
+                or batch_chars + len(text) > self.max_batch_chars
+            ):
+                yield batch
+                batch = []
+                batch_chars = 0
+            batch.append(text)
+            batch_chars += len(text)
+        if batch:
+            yield batch
+    
+    def _embed_batch(self, batch: List[str]) -> List[np.ndarray]:
+        """
+        Embed one batch of texts with a single request.
+        
+        If the provider rejects the batch (a 4xx) or returns a malformed
+        response, the batch falls back to per-item requests so one bad input
+        does not take down its neighbours. Overload and outage errors, left
+        after the client's retries, are raised instead.
+        
+        Args:
+            batch: Texts to embed together
+            
+        Returns:
+            One embedding vector per input text, in order
+            
+        Raises:
+            ProviderError: If any text could not be embedded
+        """
+        if len(batch) == 1:
+            return [self._embed_single(batch[0])]
+        
+        try:
+            return self._parse_batch(self._post(batch), len(batch))
+        
+        except ProviderError as e:
+            if e.retryable:
+                raise
+            print(f"⚠️  Batch embedding failed ({len(batch)} texts), retrying per item: {str(e)}")
+            PROVIDER_RETRIES.inc(provider="embeddings", reason="batch_fallback")
+            return [self._embed_single(text) for text in batch]
+    
+    def _post(self, inputs: Union[str, List[str]]) -> Any:
+        """
+        Send inputs to the feature-extraction endpoint.
+        
+        Rate limiting, retries (e.g. while the model loads) and circuit
+        breaking are handled by the provider client.
+        
+        Args:
+            inputs: A single text or a list of texts
+            
+        Returns:
+            Decoded JSON response
+            
+        Raises:
+            ProviderError: If the request fails
+        """
+        return self.client.post(self.api_url, self.headers, {"inputs": inputs}, timeout=REQUEST_TIMEOUT)
+    
+    def _parse_batch(self, result: Any, expected: int) -> List[np.ndarray]:
+        """Extract one embedding vector per input from a batched API response."""
+        if not isinstance(result, list) or len(result) != expected:
+            raise ProviderError(f"Expected {expected} embeddings, got {len(result) if isinstance(result, list) else type(result).__name__}")
+        
+        return [self._parse_embedding(item) for item in result]
+    
+    def _parse_embedding(self, result: Any) -> np.ndarray:
+        """Extract a single embedding vector from an API response item."""
+        # Handle different response formats
+        if isinstance(result, list):
+            if len(result) > 0 and isinstance(result[0], list):
+                return np.asarray(result[0], dtype=np.float32)  # Nested list format
+            if len(result) > 0:
+                return np.asarray(result, dtype=np.float32)  # Direct list format
+        
+        raise ProviderError(f"Unexpected embedding format: {type(result).__name__}")
+    
+    def embed_query(self, text: str) -> np.ndarray:
         """
         Generate embedding for a single query.
         
@@ -69,55 +259,130 @@ class HuggingFaceEmbeddings:
         Returns:
             Embedding vector
         """
-        try:
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json={"inputs": text},
-                timeout=30
-            )
+        if self.cache is not None:
+            cached = self.cache.get(self.model_name, text)
+            if cached is not None:
+                return cached
+        
+        embedding = self._embed_single(text)
+        
+        if self.cache is not None:
+            self._cache_results([text], [embedding])
+        
+        return embedding
+    
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for many queries in batched API calls.
+        
+        Queries are embedded exactly like documents, so this shares the
+        document batching and cache.
+        
+        Args:
+            texts: Query texts
             
-            if response.status_code == 200:
-                result = response.json()
-                
-                # Handle different response formats
-                if isinstance(result, list):
-                    if len(result) > 0 and isinstance(result[0], list):
-                        return result[0]  # Nested list format
-                    return result  # Direct list format
-                
-                return []
+        Returns:
+            float32 matrix with one embedding row per query
+        """
+        return self.embed_documents(texts)
+    
+    def _embed_single(self, text: str) -> np.ndarray:
+        """
+        Embed one text through the API.
+        
+        Raises:
+            ProviderError: If the text could not be embedded
+        """
+        return self._parse_embedding(self._post(text))
+    
+    async def aembed_documents(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for multiple documents without blocking the event loop.
+        
+        Async counterpart of ``embed_documents``: same batching and cache,
+        with at most ``max_in_flight`` batch requests outstanding. Cache
+        reads and writes (SQLite) run in a worker thread.
+        
+        Args:
+            texts: List of text documents
             
-            elif response.status_code == 503:
-                # Model is loading, wait and retry once
-                import time
-                print("⏳ Model loading, waiting 20 seconds...")
-                time.sleep(20)
-                
-                response = requests.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json={"inputs": text},
-                    timeout=30
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if isinstance(result, list):
-                        if len(result) > 0 and isinstance(result[0], list):
-                            return result[0]
-                        return result
-                
-                raise Exception("Model still loading after retry")
+        Returns:
+            float32 matrix with one embedding row per text
+        """
+        if self.cache is None:
+            return self._stack(await self._aembed_uncached(texts))
+        
+        embeddings = await asyncio.to_thread(self.cache.get_many, self.model_name, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
+        if missing:
+            fresh = await self._aembed_uncached([texts[i] for i in missing])
+            for i, embedding in zip(missing, fresh):
+                embeddings[i] = embedding
+            await asyncio.to_thread(self._cache_results, [texts[i] for i in missing], fresh)
+        
+        return self._stack(embeddings)
+    
+    async def _aembed_uncached(self, texts: List[str]) -> List[np.ndarray]:
+        """Embed texts through the API, batched and concurrent (async)."""
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        
+        async def run(batch: List[str]) -> List[np.ndarray]:
+            async with semaphore:
+                return await self._aembed_batch(batch)
+        
+        results = await asyncio.gather(*(run(batch) for batch in self._make_batches(texts)))
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+    
+    async def _aembed_batch(self, batch: List[str]) -> List[np.ndarray]:
+        """Async counterpart of ``_embed_batch``."""
+        if len(batch) == 1:
+            return [await self._aembed_single(batch[0])]
+        
+        try:
+            return self._parse_batch(await self._apost(batch), len(batch))
+        
+        except ProviderError as e:
+            if e.retryable:
+                raise
+            print(f"⚠️  Batch embedding failed ({len(batch)} texts), retrying per item: {str(e)}")
+            PROVIDER_RETRIES.inc(provider="embeddings", reason="batch_fallback")
+            return [await self._aembed_single(text) for text in batch]
+    
+    async def _apost(self, inputs: Union[str, List[str]]) -> Any:
+        """Async counterpart of ``_post``."""
+        return await self.client.apost(self.api_url, self.headers, {"inputs": inputs}, timeout=REQUEST_TIMEOUT)
+    
+    async def aembed_query(self, text: str) -> np.ndarray:
+        """
+        Generate embedding for a single query without blocking the event loop.
+        
+        Args:
+            text: Query text
             
-            else:
-                raise Exception(f"API Error ({response.status_code}): {response.text}")
+        Returns:
+            Embedding vector
+        """
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, self.model_name, text)
+            if cached is not None:
+                return cached
+        
+        embedding = await self._aembed_single(text)
+        
+        if self.cache is not None:
+            await asyncio.to_thread(self._cache_results, [text], [embedding])
         
-        except Exception as e:
-            print(f"❌ Embedding error: {str(e)}")
-            # FIXED: Return a zero vector with correct dimension for the model
-            return [0.0] * self.embedding_dim
+        return embedding
+    
+    async def aembed_queries(self, texts: List[str]) -> np.ndarray:
+        """Async counterpart of ``embed_queries``."""
+        return await self.aembed_documents(texts)
+    
+    async def _aembed_single(self, text: str) -> np.ndarray:
+        """Async counterpart of ``_embed_single``."""
+        return self._parse_embedding(await self._apost(text))
     
-    def __call__(self, text: str) -> List[float]:
+    def __call__(self, text: str) -> np.ndarray:
         """Allow calling instance directly."""
         return self.embed_query(text)
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""
+Shared HTTP Client
+Pooled connections shared by the HuggingFace providers
+"""
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session(pool_size: int = 16) -> requests.Session:
+    """
+    Get the process-wide pooled HTTP session.
+
+    The session is created on first use and reused by every provider so
+    requests to the router keep their TCP/TLS connections alive instead of
+    paying a new handshake per call.
+
+    Args:
+        pool_size: Maximum number of pooled connections per host
+
+    Returns:
+        Shared requests session
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=pool_size,
+                    pool_maxsize=pool_size
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+
+    return _session
+
+def warm_session(session: requests.Session, url: str, timeout: float = 5.0) -> bool:
+    """
+    Open a pooled connection to a host before the first real request.
+
+    Any HTTP response leaves a kept-alive connection in the pool; errors
+    are ignored, since the first real request will simply connect itself.
+
+    Args:
+        session: Session whose pool to warm
+        url: Any URL on the host
+        timeout: Seconds to wait for the connection
+
+    Returns:
+        True if a connection was made
+    """
+    try:
+        session.head(url, timeout=timeout)
+        return True
+    except requests.RequestException:
+        return False
+
+def close_session():
+    """Close the shared session and release its pooled connections."""
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+_async_client = None
+
+def get_async_client(pool_size: int = 16) -> httpx.AsyncClient:
+    """
+    Get the process-wide pooled async HTTP client.
+
+    Used by the async provider methods so the API event loop never blocks
+    on network I/O. Must be used from a single event loop (the server's).
+
+    Args:
+        pool_size: Maximum number of pooled connections
+
+    Returns:
+        Shared httpx async client
+    """
+    global _async_client
+
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size
+            )
+        )
+
+    return _async_client
+
+async def awarm_async_client(client: httpx.AsyncClient, url: str, timeout: float = 5.0) -> bool:
+    """Async counterpart of ``warm_session`` (call from the client's event loop)."""
+    try:
+        await client.head(url, timeout=timeout)
+        return True
+    except httpx.HTTPError:
+        return False
+
+async def aclose_async_client():
+    """Close the shared async client and release its pooled connections."""
+    global _async_client
+
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
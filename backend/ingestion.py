@@ -0,0 +1,494 @@
+"""
+Background Ingestion
+Job queue that loads, embeds and indexes documents off the request path
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Marks the end of a stage's output
+_DONE = object()
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue cannot accept more jobs."""
+
+class JobCancelled(Exception):
+    """Raised inside a pipeline stage when its job has been stopped."""
+
+class IngestionJob:
+    """Progress and state of one document ingestion."""
+
+    def __init__(
+        self,
+        file_path: str,
+        filename: str,
+        doc_type: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+        source: Optional[str] = None
+    ):
+        """
+        Initialize an ingestion job.
+
+        Args:
+            file_path: Path of the saved document
+            filename: Original file name (for display)
+            doc_type: Type of document (auto-detected if None)
+            tenant_id: Tenant whose knowledge base receives the document
+            source: Logical source the chunks are stored under, which
+                ``file_path`` replaces once the job completes (``file_path``
+                itself if None)
+        """
+        self.id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.filename = filename
+        self.source = source or file_path
+        self.doc_type = doc_type
+        self.tenant_id = tenant_id
+
+        self.status = "queued"
+        self.chunks_parsed = 0
+        self.chunks_embedded = 0
+        self.chunks_indexed = 0
+        self.chunks_removed = 0
+        self.errors: List[str] = []
+
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._failed = False
+        self._committed = False
+
+    @property
+    def stopped(self) -> bool:
+        """True once the job was cancelled or one of its stages failed."""
+        return self._stop.is_set()
+
+    @property
+    def failed(self) -> bool:
+        """True once one of the job's stages failed."""
+        return self._failed
+
+    @property
+    def committed(self) -> bool:
+        """True once every batch is written and the job can no longer be cancelled."""
+        return self._committed
+
+    def cancel(self) -> bool:
+        """Request cancellation; returns False if the job already finished (or is finishing)."""
+        with self._lock:
+            if self.status in ("completed", "failed", "cancelled") or self._committed:
+                return False
+            self._stop.set()
+            if self.status == "queued":
+                self._finish("cancelled")
+            return True
+
+    def start(self) -> bool:
+        """Mark the job as running; returns False if it was cancelled first."""
+        with self._lock:
+            if self.stopped:
+                return False
+            self.status = "running"
+            self.started_at = time.time()
+            return True
+
+    def finish(self):
+        """Set the final status of a job that was running."""
+        with self._lock:
+            if self.status != "running":
+                return
+            if self._failed:
+                self._finish("failed")
+            elif self.stopped:
+                self._finish("cancelled")
+            else:
+                self._finish("completed")
+
+    def fail(self, error: str):
+        """Record a stage error and stop the remaining stages."""
+        with self._lock:
+            self.errors.append(error)
+            self._failed = True
+        self._stop.set()
+
+    def note(self, message: str):
+        """Record a message in the job's errors without failing it."""
+        with self._lock:
+            self.errors.append(message)
+
+    def commit(self) -> bool:
+        """Make the job's writes final; returns False if it was stopped first."""
+        with self._lock:
+            if self.stopped:
+                return False
+            self._committed = True
+            return True
+
+    def add_progress(self, stage: str, count: int):
+        """Increment the chunk counter of a pipeline stage."""
+        with self._lock:
+            setattr(self, f"chunks_{stage}", getattr(self, f"chunks_{stage}") + count)
+
+    def _finish(self, status: str):
+        """Set the final status (caller holds the lock)."""
+        self.status = status
+        self.finished_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job for the progress API."""
+        elapsed = 0.0
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "tenant": self.tenant_id,
+            "status": self.status,
+            "chunks_parsed": self.chunks_parsed,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_indexed": self.chunks_indexed,
+            "chunks_removed": self.chunks_removed,
+            "elapsed_seconds": round(elapsed, 3),
+            "chunks_per_second": round(self.chunks_indexed / elapsed, 2) if elapsed > 0 else 0.0,
+            "errors": list(self.errors),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+class IngestionQueue:
+    """Bounded job queue served by a pool of ingestion workers."""
+
+    def __init__(
+        self,
+        rag,
+        num_workers: int = 2,
+        max_queue_size: int = 16,
+        batch_size: int = 64,
+        pipeline_depth: int = 4,
+        max_finished_jobs: int = 200,
+        tenants=None
+    ):
+        """
+        Initialize the ingestion queue and start its workers.
+
+        Each job runs as three pipelined stages (parse -> embed -> index)
+        connected by bounded queues, so embedding of one batch overlaps
+        with parsing of the next and writing of the previous one.
+
+        Args:
+            rag: CloudRAG instance providing the loader, embeddings and store
+            num_workers: Number of jobs processed concurrently
+            max_queue_size: Maximum number of jobs waiting to start
+            batch_size: Number of chunks per embedding/indexing batch
+            pipeline_depth: Maximum number of batches buffered between stages
+            max_finished_jobs: Number of finished jobs kept for the progress API
+            tenants: TenantManager leasing each job's knowledge base for the
+                duration of the job (every job goes to ``rag`` if None)
+        """
+        self.rag = rag
+        self.tenants = tenants
+        self.batch_size = batch_size
+        self.pipeline_depth = pipeline_depth
+        self.max_finished_jobs = max_finished_jobs
+
+        self._queue: "queue.Queue[Optional[IngestionJob]]" = queue.Queue(maxsize=max_queue_size)
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        # Jobs for one (tenant, source) run one at a time: each diffs the
+        # source's stored chunks against what it wrote. Entries are
+        # [lock, jobs holding or waiting for it]
+        self._source_locks: Dict[Tuple[Optional[str], str], list] = {}
+        self._source_locks_lock = threading.Lock()
+
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"ingest-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+        print(f"✅ Ingestion queue started: {num_workers} workers, queue size {max_queue_size}")
+
+    def submit(
+        self,
+        file_path: str,
+        filename: str,
+        doc_type: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> IngestionJob:
+        """
+        Queue a document for ingestion.
+
+        Args:
+            file_path: Path of the saved document
+            filename: Original file name
+            doc_type: Type of document (auto-detected if None)
+            tenant_id: Tenant whose knowledge base receives the document
+            source: Logical source of the document (see ``IngestionJob``)
+
+        Returns:
+            The queued job
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+        """
+        job = IngestionJob(file_path, filename, doc_type, tenant_id, source)
+
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFullError("Ingestion queue is full, try again later")
+
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._prune_jobs()
+
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        """Get a job by ID."""
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, tenant_id: Optional[str] = None) -> List[IngestionJob]:
+        """Get all tracked jobs (or one tenant's), oldest first."""
+        with self._jobs_lock:
+            jobs = list(self._jobs.values())
+        if tenant_id is not None:
+            jobs = [job for job in jobs if job.tenant_id == tenant_id]
+        return jobs
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; returns False if it can't be cancelled."""
+        job = self.get(job_id)
+        return job.cancel() if job else False
+
+    def get_stats(self) -> dict:
+        """Get queue statistics."""
+        jobs = self.list_jobs()
+        by_status: Dict[str, int] = {}
+        for job in jobs:
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize(),
+            "max_queue_size": self._queue.maxsize,
+            "jobs": by_status
+        }
+
+    def shutdown(self):
+        """Cancel outstanding jobs and stop the workers."""
+        for job in self.list_jobs():
+            job.cancel()
+        for _ in self._workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+
+    def _prune_jobs(self):
+        """Forget the oldest finished jobs (caller holds the jobs lock)."""
+        finished = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in ("completed", "failed", "cancelled")
+        ]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def _worker(self):
+        """Take jobs off the queue until shutdown."""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._source_lock(job):
+                try:
+                    self._run(job)
+                except Exception as e:
+                    job.fail(str(e))
+
+                job.finish()
+                self._settle_upload(job)
+
+            print(f"📦 Ingestion job {job.id} {job.status}: {job.chunks_indexed} chunks indexed")
+
+    @contextmanager
+    def _source_lock(self, job: IngestionJob) -> Iterator[None]:
+        """Hold the job's (tenant, source) lock, waiting for earlier jobs of the source."""
+        key = (job.tenant_id, job.source)
+        with self._source_locks_lock:
+            entry = self._source_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._source_locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._source_locks[key]
+
+    @staticmethod
+    def _settle_upload(job: IngestionJob):
+        """Move a completed job's file to its source path; drop it otherwise."""
+        if job.file_path == job.source:
+            return
+        try:
+            if job.status == "completed":
+                os.replace(job.file_path, job.source)
+            else:
+                os.remove(job.file_path)
+        except OSError as e:
+            print(f"⚠️  Could not settle upload {job.file_path}: {e}")
+
+    def _run(self, job: IngestionJob):
+        """Run the parse -> embed -> index pipeline for one job."""
+        if not job.start():
+            return
+
+        if self.tenants is None:
+            self._run_pipeline(job, self.rag)
+            return
+
+        # The tenant's collection (created by its first upload) stays open
+        # until the job is done with it
+        with self.tenants.lease(job.tenant_id, create=True) as rag:
+            self._run_pipeline(job, rag)
+
+    def _run_pipeline(self, job: IngestionJob, rag):
+        """Run the pipeline stages against one knowledge base."""
+        parsed: queue.Queue = queue.Queue(maxsize=self.pipeline_depth)
+        embedded: queue.Queue = queue.Queue(maxsize=self.pipeline_depth)
+
+        parser = threading.Thread(target=self._parse_stage, args=(job, rag, parsed), daemon=True)
+        indexer = threading.Thread(target=self._index_stage, args=(job, rag, embedded), daemon=True)
+        parser.start()
+        indexer.start()
+
+        self._embed_stage(job, rag, parsed, embedded)
+
+        parser.join()
+        indexer.join()
+
+    def _put(self, job: IngestionJob, q: queue.Queue, item: Any):
+        """Put an item on a stage queue, giving up if the job stops."""
+        while True:
+            if job.stopped:
+                raise JobCancelled()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, job: IngestionJob, q: queue.Queue) -> Any:
+        """Get an item from a stage queue, giving up if the job stops."""
+        while True:
+            if job.stopped:
+                raise JobCancelled()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _parse_stage(self, job: IngestionJob, rag, out: queue.Queue):
+        """Stream the document's chunks in batches as it is parsed."""
+        try:
+            batches = rag.document_loader.iter_document_batches(
+                job.file_path, job.doc_type, self.batch_size
+            )
+            for batch in batches:
+                # Chunks belong to the logical source, not the upload's file
+                for chunk in batch:
+                    chunk["metadata"]["source"] = job.source
+                job.add_progress("parsed", len(batch))
+                self._put(job, out, batch)
+
+            self._put(job, out, _DONE)
+        except JobCancelled:
+            pass
+        except Exception as e:
+            job.fail(f"parse: {str(e)}")
+
+    def _embed_stage(self, job: IngestionJob, rag, inp: queue.Queue, out: queue.Queue):
+        """Embed each parsed batch."""
+        try:
+            while True:
+                batch = self._get(job, inp)
+                if batch is _DONE:
+                    self._put(job, out, _DONE)
+                    return
+
+                # Chunks already stored from an earlier upload are not re-embedded
+                embeddings = rag.embed_new_chunks(
+                    [chunk["content"] for chunk in batch],
+                    [chunk["metadata"] for chunk in batch]
+                )
+                job.add_progress("embedded", len(batch))
+
+                self._put(job, out, (batch, embeddings))
+        except JobCancelled:
+            pass
+        except Exception as e:
+            job.fail(f"embed: {str(e)}")
+
+    def _index_stage(self, job: IngestionJob, rag, inp: queue.Queue):
+        """
+        Write embedded batches to the vector store, then drop stale chunks.
+
+        A job stopped before its last batch (cancelled, or failed in any
+        stage) deletes the chunks it added, so the source's previous version
+        is left intact rather than mixed with part of the new one.
+        """
+        previous_ids = set()
+        written_ids = set()
+        try:
+            previous_ids = rag.vector_store.get_source_ids(job.source)
+
+            while True:
+                item = self._get(job, inp)
+                if item is _DONE:
+                    if not job.commit():
+                        raise JobCancelled()
+                    job.chunks_removed = rag.remove_stale_chunks(
+                        job.source, previous_ids, written_ids
+                    )
+                    return
+
+                batch, embeddings = item
+                texts = [chunk["content"] for chunk in batch]
+                metadatas = [chunk["metadata"] for chunk in batch]
+                # Recorded before writing, so a batch that fails partway is rolled back too
+                written_ids.update(rag.vector_store.chunk_ids(texts, metadatas))
+                rag.index_chunks(texts, metadatas, embeddings)
+                job.add_progress("indexed", len(batch))
+        except JobCancelled:
+            pass
+        except Exception as e:
+            job.fail(f"index: {str(e)}")
+
+        if not job.committed:
+            self._roll_back(job, rag, previous_ids, written_ids)
+
+    @staticmethod
+    def _roll_back(job: IngestionJob, rag, previous_ids: set, written_ids: set):
+        """Delete what a stopped job added to its source, noting why in its errors."""
+        reason = "failed" if job.failed else "was cancelled"
+        try:
+            removed = rag.rollback_chunks(job.source, previous_ids, written_ids)
+        except Exception as e:
+            job.fail(f"rollback: {str(e)}")
+            return
+        job.note(f"rolled back: job {reason}, removed {removed} newly written chunks; previous version kept")
@@ -3,8 +3,14 @@ HuggingFace Inference Providers - LLM Provider
 Cloud-based language model inference
 """
 import os
+import json
+import httpx
 import requests
-from typing import Optional
+from typing import AsyncIterator, Iterator, Optional, Union
+from provider_client import ProviderClient, ProviderError
+
+# Seconds each generation attempt may take
+REQUEST_TIMEOUT = 60.0
 
 class HuggingFaceLLM:
     """HuggingFace Inference Providers for language model inference."""
@@ -14,7 +20,11 @@ class HuggingFaceLLM:
         model_name: str,
         api_token: str,
         max_tokens: int = 512,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        session: Optional[requests.Session] = None,
+        async_client: Optional[httpx.AsyncClient] = None,
+        api_base: str = "https://router.huggingface.co",
+        client: Optional[ProviderClient] = None
     ):
         """
         Initialize HuggingFace Inference Providers LLM.
@@ -24,12 +34,19 @@ class HuggingFaceLLM:
             api_token: HuggingFace API token
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature
+            session: Pooled HTTP session (shared process-wide if None)
+            async_client: Pooled async HTTP client (shared process-wide if None)
+            api_base: Inference API base URL
+            client: Rate-limited, retrying provider client (created from
+                ``session`` and ``async_client`` if None)
         """
         self.model_name = model_name
-        self.api_url = "https://router.huggingface.co/v1/chat/completions"
+        self.api_url = f"{api_base.rstrip('/')}/v1/chat/completions"
         self.api_token = api_token
         self.max_tokens = max_tokens
         self.temperature = temperature
+        self.client = client or ProviderClient("llm", session=session, async_client=async_client)
+        self.client.error_message = self._error_message
         
         self.headers = {
             "Authorization": f"Bearer {self.api_token}",
@@ -39,6 +56,82 @@ class HuggingFaceLLM:
         print(f"✅ LLM initialized: {model_name}")
         print(f"🌐 Using HuggingFace Inference Providers")
     
+    def _build_payload(self, prompt: str, stream: bool) -> dict:
+        """Build the chat-completions request body."""
+        return {
+            "model": self.model_name,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "stream": stream
+        }
+    
+    def _error_message(self, response: Union[requests.Response, httpx.Response]) -> str:
+        """Turn a non-200 API response into a user-facing error message."""
+        if response.status_code == 401:
+            return (f"Authentication Error: Invalid HuggingFace token.\n"
+                   f"Get a token from: https://huggingface.co/settings/tokens\n"
+                   f"Ensure it has 'Make calls to Inference Providers' permission.")
+        
+        elif response.status_code == 404:
+            return (f"Model Not Found: '{self.model_name}' not available.\n"
+                   f"Check available models at:\n"
+                   f"https://huggingface.co/models?inference_provider=all")
+        
+        elif response.status_code == 429:
+            return (f"Rate Limit Exceeded. Wait a moment and try again.\n"
+                   f"Consider upgrading to HuggingFace Pro for higher limits.")
+        
+        elif response.status_code == 503:
+            return "Model is loading. Please try again shortly."
+        
+        else:
+            try:
+                error_detail = response.json()
+                error_msg = error_detail.get("error", response.text)
+            except:
+                error_msg = response.text
+            
+            return f"API Error ({response.status_code}): {error_msg}"
+    
+    def _parse_completion(self, result: dict) -> str:
+        """Extract the generated text from a chat-completions response."""
+        if "choices" in result and len(result["choices"]) > 0:
+            content = result["choices"][0].get("message", {}).get("content", "")
+            if content:
+                return content.strip()
+            else:
+                raise ProviderError("No content in response", status_code=200)
+        else:
+            raise ProviderError("Unexpected response format", status_code=200)
+    
+    def _parse_stream_line(self, line: str) -> Optional[str]:
+        """
+        Extract the content delta from one server-sent event line.
+        
+        Returns:
+            The text fragment, "" for lines without content, or None at [DONE]
+        """
+        if not line.startswith("data:"):
+            return ""
+        
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return None
+        
+        try:
+            chunk = json.loads(data)
+        except ValueError:
+            return ""
+        
+        choices = chunk.get("choices") or []
+        if not choices:
+            return ""
+        
+        return (choices[0].get("delta") or {}).get("content") or ""
+    
     def generate(self, prompt: str) -> str:
         """
         Generate response from prompt.
@@ -48,71 +141,80 @@ class HuggingFaceLLM:
             
         Returns:
             Generated text response
+            
+        Raises:
+            ProviderError: If generation fails (after retries)
         """
-        try:
-            payload = {
-                "model": self.model_name,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": self.max_tokens,
-                "temperature": self.temperature,
-                "stream": False
-            }
+        result = self.client.post(self.api_url, self.headers, self._build_payload(prompt, stream=False), timeout=REQUEST_TIMEOUT)
+        return self._parse_completion(result)
+    
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """
+        Generate a response token by token.
+        
+        Reads the server-sent events of a streaming chat-completions request
+        and yields each content delta as soon as it arrives. The request is
+        retried only before the first fragment.
+        
+        Args:
+            prompt: Input text prompt
             
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload,
-                timeout=60
-            )
+        Yields:
+            Generated text fragments
             
-            if response.status_code == 200:
-                result = response.json()
-                
-                if "choices" in result and len(result["choices"]) > 0:
-                    content = result["choices"][0].get("message", {}).get("content", "")
+        Raises:
+            ProviderError: If generation fails or the stream breaks off
+        """
+        with self.client.stream(self.api_url, self.headers, self._build_payload(prompt, stream=True), timeout=REQUEST_TIMEOUT) as response:
+            try:
+                for raw_line in response.iter_lines():
+                    content = self._parse_stream_line(raw_line.decode("utf-8", errors="replace"))
+                    if content is None:
+                        break
                     if content:
-                        return content.strip()
-                    else:
-                        return f"❌ No content in response"
-                else:
-                    return f"❌ Unexpected response format"
-            
-            elif response.status_code == 401:
-                return (f"❌ Authentication Error: Invalid HuggingFace token.\n"
-                       f"Get a token from: https://huggingface.co/settings/tokens\n"
-                       f"Ensure it has 'Make calls to Inference Providers' permission.")
+                        yield content
+            except requests.exceptions.RequestException as e:
+                raise ProviderError(f"Stream interrupted: {e}", retryable=True) from e
+    
+    async def agenerate(self, prompt: str) -> str:
+        """
+        Generate response from prompt without blocking the event loop.
+        
+        Args:
+            prompt: Input text prompt
             
-            elif response.status_code == 404:
-                return (f"❌ Model Not Found: '{self.model_name}' not available.\n"
-                       f"Check available models at:\n"
-                       f"https://huggingface.co/models?inference_provider=all")
+        Returns:
+            Generated text response
             
-            elif response.status_code == 429:
-                return (f"⏳ Rate Limit Exceeded. Wait a moment and try again.\n"
-                       f"Consider upgrading to HuggingFace Pro for higher limits.")
+        Raises:
+            ProviderError: If generation fails (after retries)
+        """
+        result = await self.client.apost(self.api_url, self.headers, self._build_payload(prompt, stream=False), timeout=REQUEST_TIMEOUT)
+        return self._parse_completion(result)
+    
+    async def agenerate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Generate a response token by token without blocking the event loop.
+        
+        Args:
+            prompt: Input text prompt
             
-            elif response.status_code == 503:
-                return "⏳ Model is loading. Please try again in 20 seconds."
+        Yields:
+            Generated text fragments
             
-            else:
-                try:
-                    error_detail = response.json()
-                    error_msg = error_detail.get("error", response.text)
-                except:
-                    error_msg = response.text
-                
-                return f"❌ API Error ({response.status_code}): {error_msg}"
-        
-        except requests.exceptions.Timeout:
-            return "❌ Request timeout. Model took too long to respond."
-        
-        except requests.exceptions.ConnectionError:
-            return "❌ Connection error. Check your internet connection."
-        
-        except Exception as e:
-            return f"❌ Error: {str(e)}"
+        Raises:
+            ProviderError: If generation fails or the stream breaks off
+        """
+        async with self.client.astream(self.api_url, self.headers, self._build_payload(prompt, stream=True), timeout=REQUEST_TIMEOUT) as response:
+            try:
+                async for line in response.aiter_lines():
+                    content = self._parse_stream_line(line)
+                    if content is None:
+                        break
+                    if content:
+                        yield content
+            except httpx.HTTPError as e:
+                raise ProviderError(f"Stream interrupted: {e}", retryable=True) from e
     
     def get_info(self) -> dict:
         """Get model information."""
@@ -121,5 +223,5 @@ class HuggingFaceLLM:
             "model": self.model_name,
             "max_tokens": self.max_tokens,
             "temperature": self.temperature,
-            "endpoint": "router.huggingface.co/v1"
+            "endpoint": self.api_url
         }
@@ -0,0 +1,260 @@
+"""
+Local Embeddings Provider
+CPU text embeddings with ONNX Runtime, no network on the hot path
+"""
+import asyncio
+import os
+import threading
+import numpy as np
+from typing import List, Optional
+from embedding_cache import EmbeddingCache
+
+def resolve_model_file(model_name: str, filename: str) -> str:
+    """
+    Find a model file in a local directory or download it from the Hub.
+
+    Args:
+        model_name: Local directory or HuggingFace Hub repo
+        filename: File path within the model
+
+    Returns:
+        Local path of the file
+
+    Raises:
+        FileNotFoundError: If the model has no such file
+    """
+    if os.path.isdir(model_name):
+        path = os.path.join(model_name, filename)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return path
+
+    try:
+        from huggingface_hub import constants, hf_hub_download
+        from huggingface_hub.utils import EntryNotFoundError, LocalEntryNotFoundError
+    except ImportError:
+        raise ImportError("huggingface_hub not installed. Install with: pip install huggingface_hub")
+
+    try:
+        return hf_hub_download(model_name, filename)
+    except LocalEntryNotFoundError as e:
+        # Not cached: missing for offline mode, else the Hub was unreachable
+        if not constants.HF_HUB_OFFLINE:
+            raise ConnectionError(f"Could not download {model_name}/{filename} from the HuggingFace Hub") from e
+        raise FileNotFoundError(f"{model_name}/{filename} (not cached, offline mode)") from e
+    except EntryNotFoundError as e:
+        raise FileNotFoundError(f"{model_name}/{filename}") from e
+
+def resolve_onnx_model(model_name: str, quantized: bool) -> str:
+    """
+    Locate the ONNX export of a model, quantizing it to int8 if requested.
+
+    Looks for "model_quantized.onnx" / "model.onnx" at the top level or
+    under "onnx/"; without a shipped quantized export, one is created once
+    with dynamic quantization.
+    """
+    names = ["model_quantized.onnx", "model.onnx"] if quantized else ["model.onnx"]
+    for name in names:
+        for filename in (name, f"onnx/{name}"):
+            # Only a missing file moves on to the next candidate; auth,
+            # network and repo errors propagate
+            try:
+                path = resolve_model_file(model_name, filename)
+            except FileNotFoundError:
+                continue
+
+            if quantized and name == "model.onnx":
+                return _quantize(path)
+            return path
+
+    raise FileNotFoundError(f"No ONNX model found for {model_name}")
+
+def _quantize(path: str) -> str:
+    """Create (once) an int8 dynamically quantized copy of a model."""
+    quantized_path = os.path.join(os.path.dirname(path), "model_quantized.onnx")
+    if os.path.exists(quantized_path):
+        return quantized_path
+
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError:
+        raise ImportError("onnx not installed. Install with: pip install onnx")
+
+    print(f"🔧 Quantizing {path} to int8...")
+    quantize_dynamic(path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+def create_onnx_session(model_path: str, num_threads: int = 0):
+    """Create a CPU ONNX Runtime session with full graph optimization."""
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = num_threads
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return onnxruntime.InferenceSession(
+        model_path,
+        sess_options=options,
+        providers=["CPUExecutionProvider"]
+    )
+
+class LocalEmbeddings:
+    """ONNX Runtime text embeddings, a drop-in for HuggingFaceEmbeddings."""
+
+    def __init__(
+        self,
+        model_name: str = "Xenova/bge-small-en-v1.5",
+        quantized: bool = True,
+        batch_size: int = 32,
+        num_threads: int = 0,
+        max_length: int = 512,
+        pooling: str = "cls",
+        query_instruction: str = "",
+        cache: Optional[EmbeddingCache] = None
+    ):
+        """
+        Load the tokenizer and ONNX model.
+
+        Args:
+            model_name: Local directory or HuggingFace Hub repo containing
+                "tokenizer.json" and an ONNX export ("model.onnx", optionally
+                "model_quantized.onnx", at the top level or under "onnx/")
+            quantized: Use int8 weights; if the model ships no quantized
+                export, one is created with dynamic quantization
+            batch_size: Maximum number of texts per inference call
+            num_threads: ONNX Runtime intra-op threads (0 lets it decide)
+            max_length: Maximum tokens per text (longer texts are truncated)
+            pooling: "cls" (BGE models) or "mean" (sentence-transformers models)
+            query_instruction: Prefix added to queries (not documents)
+            cache: Persistent embedding cache consulted before the model
+        """
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError("onnxruntime not installed. Install with: pip install onnxruntime tokenizers")
+
+        if pooling not in ("cls", "mean"):
+            raise ValueError(f"Unsupported pooling: {pooling}")
+
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.pooling = pooling
+        self.query_instruction = query_instruction
+        self.cache = cache
+
+        model_path = resolve_onnx_model(model_name, quantized)
+        # Cache keys include the variant so fp32 and int8 vectors never mix
+        self.cache_model_name = f"{model_name}:int8" if quantized else model_name
+
+        self.tokenizer = Tokenizer.from_file(resolve_model_file(model_name, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        self.session = create_onnx_session(model_path, num_threads)
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+        # ONNX Runtime sessions are thread-safe, but one run at a time keeps
+        # the intra-op thread pool from being oversubscribed
+        self._lock = threading.Lock()
+
+        self.embedding_dim = len(self._embed_uncached(["warm-up"])[0])
+
+        print(f"✅ Local embeddings initialized: {model_name} ({'int8' if quantized else 'fp32'})")
+        print(f"📐 Embedding dimension: {self.embedding_dim}")
+
+    def _embed_uncached(self, texts: List[str]) -> np.ndarray:
+        """Run the model over texts in batches."""
+        if not texts:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        return np.concatenate([
+            self._embed_batch(texts[start:start + self.batch_size])
+            for start in range(0, len(texts), self.batch_size)
+        ])
+
+    def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        """Embed one batch, returning unit-length vectors."""
+        encodings = self.tokenizer.encode_batch(batch)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+
+        with self._lock:
+            hidden = self.session.run(None, inputs)[0]
+
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for multiple documents.
+
+        Args:
+            texts: List of text documents
+
+        Returns:
+            float32 matrix with one embedding row per text
+        """
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        embeddings = self.cache.get_many(self.cache_model_name, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        if missing:
+            fresh = self._embed_uncached([texts[i] for i in missing])
+            for i, embedding in zip(missing, fresh):
+                embeddings[i] = embedding
+            self.cache.put_many(self.cache_model_name, [texts[i] for i in missing], fresh)
+
+        return np.stack(embeddings) if embeddings else self._embed_uncached([])
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """
+        Generate embedding for a single query.
+
+        Queries are short and cheap to embed locally, so the cache is skipped.
+
+        Args:
+            text: Query text
+
+        Returns:
+            Embedding vector
+        """
+        return self._embed_uncached([self.query_instruction + text])[0]
+
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for many queries in batched inference calls.
+
+        Args:
+            texts: Query texts
+
+        Returns:
+            float32 matrix with one embedding row per query
+        """
+        return self._embed_uncached([self.query_instruction + text for text in texts])
+
+    async def aembed_documents(self, texts: List[str]) -> np.ndarray:
+        """Async counterpart of ``embed_documents`` (inference runs in a thread)."""
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> np.ndarray:
+        """Async counterpart of ``embed_query`` (inference runs in a thread)."""
+        return await asyncio.to_thread(self.embed_query, text)
+
+    async def aembed_queries(self, texts: List[str]) -> np.ndarray:
+        """Async counterpart of ``embed_queries`` (inference runs in a thread)."""
+        return await asyncio.to_thread(self.embed_queries, texts)
+
+    def __call__(self, text: str) -> np.ndarray:
+        """Allow calling instance directly."""
+        return self.embed_query(text)
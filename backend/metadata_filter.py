@@ -0,0 +1,88 @@
+"""
+Metadata Filters
+Validation of the filter expressions that scope retrieval to matching chunks
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+# Comparison operators, in the Chroma "where" dialect the backends share
+COMPARISON_OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin")
+LOGICAL_OPERATORS = ("$and", "$or")
+
+_SCALAR_TYPES = (str, int, float, bool)
+
+def _check_scalar(key: str, value: Any):
+    if not isinstance(value, _SCALAR_TYPES):
+        raise ValueError(f"Filter value for '{key}' must be a string, number or boolean")
+
+def _normalize_condition(key: str, condition: Any) -> Dict[str, Any]:
+    """Validate one field condition: a bare value or a single {operator: operand}."""
+    if key.startswith("$"):
+        raise ValueError(f"Unknown filter operator: {key}")
+
+    if not isinstance(condition, dict):
+        _check_scalar(key, condition)
+        return {key: condition}
+
+    if len(condition) != 1:
+        raise ValueError(f"Filter on '{key}' must have exactly one operator")
+    operator, operand = next(iter(condition.items()))
+    if operator not in COMPARISON_OPERATORS:
+        raise ValueError(f"Unknown filter operator: {operator}")
+
+    if operator in ("$in", "$nin"):
+        if not isinstance(operand, list) or not operand:
+            raise ValueError(f"'{operator}' on '{key}' needs a non-empty list")
+        for value in operand:
+            _check_scalar(key, value)
+    else:
+        _check_scalar(key, operand)
+        if operator in ("$gt", "$gte", "$lt", "$lte") and (
+            isinstance(operand, bool) or not isinstance(operand, (int, float))
+        ):
+            raise ValueError(f"'{operator}' on '{key}' needs a number")
+    return {key: {operator: operand}}
+
+def normalize_filter(where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Validate a metadata filter and bring it into canonical form.
+
+    Filters use the Chroma "where" dialect: ``{"type": "pdf"}``,
+    ``{"uploaded_at": {"$gte": 1700000000}}``, ``{"source": {"$in": [...]}}``
+    and ``{"$and": [...]}`` / ``{"$or": [...]}``. Several fields in one
+    dictionary are combined with "$and".
+
+    Args:
+        where: Filter expression (None or empty for no filter)
+
+    Returns:
+        The canonical filter, or None for no filter
+
+    Raises:
+        ValueError: If the expression is malformed
+    """
+    if not where:
+        return None
+    if not isinstance(where, dict):
+        raise ValueError("Filter must be an object")
+
+    clauses: List[Dict[str, Any]] = []
+    for key, condition in where.items():
+        if key in LOGICAL_OPERATORS:
+            if not isinstance(condition, list) or not condition:
+                raise ValueError(f"'{key}' needs a non-empty list of filters")
+            operands = []
+            for operand in condition:
+                normalized = normalize_filter(operand)
+                if normalized is None:
+                    raise ValueError(f"'{key}' cannot contain an empty filter")
+                operands.append(normalized)
+            clauses.append(operands[0] if len(operands) == 1 else {key: operands})
+        else:
+            clauses.append(_normalize_condition(key, condition))
+
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def filter_key(where: Optional[Dict[str, Any]]) -> str:
+    """Stable string form of a filter, for use in cache and coalescing keys."""
+    return json.dumps(where, sort_keys=True) if where else ""
@@ -0,0 +1,297 @@
+"""
+Metrics
+Stage timing spans, provider counters and Prometheus text exposition
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+import httpx
+import requests
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; spans from sub-millisecond index lookups to slow LLM generations
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+def _escape(value: str) -> str:
+    """Escape a label value for the exposition format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """Render a Prometheus label set, e.g. '{stage="embed",le="0.5"}'."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    """Render a sample value the way Prometheus expects."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """Add to the counter of one label set."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Current value of one label set."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def collect(self) -> List[str]:
+        """Exposition lines for this counter."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Gauge:
+    """Value that can go up and down, optionally split by labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels: str):
+        """Set the value of one label set."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels: str) -> float:
+        """Current value of one label set."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def collect(self) -> List[str]:
+        """Exposition lines for this gauge."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        """Record one observation."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self) -> List[str]:
+        """Exposition lines for this histogram."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((key, list(series[0]), series[1], series[2]) for key, series in self._series.items())
+
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Named collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Create and register a counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Create and register a gauge."""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """Create and register a histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+QUERY_SECONDS = REGISTRY.histogram(
+    "rag_query_seconds", "End-to-end latency of answered questions", ["cached"]
+)
+QUERY_STAGE_SECONDS = REGISTRY.histogram(
+    "rag_query_stage_seconds", "Latency of query stages (embed, cache_lookup, search, rerank, context, generate)", ["stage"]
+)
+INGEST_STAGE_SECONDS = REGISTRY.histogram(
+    "rag_ingest_stage_seconds", "Latency of ingestion stage steps (parse per block, chunk per split, embed and write per batch)", ["stage"]
+)
+PROVIDER_REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_provider_request_seconds", "Latency of HuggingFace API requests", ["provider"]
+)
+PROVIDER_ERRORS = REGISTRY.counter(
+    "rag_provider_errors_total", "Failed HuggingFace API requests", ["provider", "reason"]
+)
+PROVIDER_RETRIES = REGISTRY.counter(
+    "rag_provider_retries_total", "Retried HuggingFace API requests", ["provider", "reason"]
+)
+COALESCED_REQUESTS = REGISTRY.counter(
+    "rag_coalesced_requests_total", "Requests served by joining an identical in-flight computation", ["kind"]
+)
+PROVIDER_CONCURRENCY_LIMIT = REGISTRY.gauge(
+    "rag_provider_concurrency_limit", "Adaptive limit on concurrent HuggingFace API requests", ["provider"]
+)
+PROVIDER_CIRCUIT_OPEN = REGISTRY.gauge(
+    "rag_provider_circuit_open", "1 while a provider's circuit breaker rejects requests", ["provider"]
+)
+TENANTS_RESIDENT = REGISTRY.gauge(
+    "rag_tenants_resident", "Tenant knowledge bases currently open"
+)
+TENANT_MEMORY_BYTES = REGISTRY.gauge(
+    "rag_tenant_memory_bytes", "Estimated memory of the open tenant indexes"
+)
+TENANT_EVICTIONS = REGISTRY.counter(
+    "rag_tenant_evictions_total", "Tenant knowledge bases closed to stay within limits", ["reason"]
+)
+
+# Stage durations of the request being served, when it asked for them
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """
+    Collect the stage durations (seconds) of spans run in this context.
+
+    The context is inherited by ``asyncio.to_thread`` calls, so stages run
+    off the event loop are included.
+
+    Yields:
+        Dictionary filled with stage name -> total seconds
+    """
+    timings: Dict[str, float] = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+@contextmanager
+def span(histogram: Histogram, stage: str):
+    """Time a block as one observation of a stage histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+def timed_iter(iterable, histogram: Histogram, stage: str):
+    """Yield from an iterable, timing each item it produces as one stage observation."""
+    iterator = iter(iterable)
+    while True:
+        with span(histogram, stage):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+def timings_ms(timings: Dict[str, float]) -> Dict[str, float]:
+    """Convert collected stage timings to rounded milliseconds."""
+    return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+def _error_reason(error: Exception) -> str:
+    """Classify a failed request for the error counter."""
+    if isinstance(error, (requests.exceptions.Timeout, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(error, (requests.exceptions.ConnectionError, httpx.ConnectError)):
+        return "connection"
+    return "exception"
+
+@contextmanager
+def provider_request(provider: str):
+    """Time one provider HTTP request, counting it as an error if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        PROVIDER_ERRORS.inc(provider=provider, reason=_error_reason(e))
+        raise
+    finally:
+        PROVIDER_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=provider)
+
+def record_provider_status(provider: str, status_code: int):
+    """Count a non-200 provider response as an error."""
+    if status_code != 200:
+        PROVIDER_ERRORS.inc(provider=provider, reason=f"http_{status_code}")
@@ -0,0 +1,526 @@
+"""
+Provider Client
+Rate limiting, retries, adaptive concurrency and circuit breaking for API calls
+"""
+import asyncio
+import random
+import threading
+import time
+import httpx
+import requests
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, Union
+from http_client import get_async_client, get_session
+from metrics import (
+    PROVIDER_CIRCUIT_OPEN, PROVIDER_CONCURRENCY_LIMIT, PROVIDER_RETRIES,
+    provider_request, record_provider_status
+)
+
+# Overload and transient upstream failures; anything else is not retried
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class ProviderError(Exception):
+    """A provider request that failed (after any retries)."""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retryable: bool = False,
+        retry_after: Optional[float] = None
+    ):
+        """
+        Args:
+            message: Human-readable description
+            status_code: Upstream HTTP status, if a response was received
+            retryable: Whether the failure is transient (overload, outage)
+            retry_after: Seconds after which trying again may succeed
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class CircuitOpenError(ProviderError):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+def _retry_after(response: Union[requests.Response, httpx.Response]) -> Optional[float]:
+    """Server-requested wait from a Retry-After header or HF's "estimated_time"."""
+    header = response.headers.get("Retry-After")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            pass
+    if response.status_code == 503:
+        try:
+            estimated = response.json().get("estimated_time")
+            if estimated is not None:
+                return max(0.0, float(estimated))
+        except Exception:
+            pass
+    return None
+
+def _default_error_message(response: Union[requests.Response, httpx.Response]) -> str:
+    """Describe a non-200 response."""
+    try:
+        detail = response.json().get("error", response.text)
+    except Exception:
+        detail = response.text
+    return f"API Error ({response.status_code}): {detail}"
+
+def retry_budget(timeout: float, max_retries: int, backoff_max: float) -> float:
+    """
+    Longest a retried request can take to fail: every attempt times out
+    and every retry waits the longest backoff.
+
+    Args:
+        timeout: Per-attempt timeout in seconds
+        max_retries: Retries after the first attempt
+        backoff_max: Longest backoff in seconds
+
+    Returns:
+        Seconds
+    """
+    max_retries = max(0, max_retries)
+    return (max_retries + 1) * timeout + max_retries * backoff_max
+
+class TokenBucket:
+    """Token-bucket request rate limiter shared by threads and event loops."""
+
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate: Sustained requests per second (0 disables limiting)
+            burst: Requests allowed back to back after an idle period
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token, returning how long to wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1.0
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self):
+        """Wait (without blocking the event loop) until a request may be sent."""
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit adapted AIMD-style, like TCP congestion control.
+
+    Each success raises the limit by 1/limit (about +1 per round of
+    requests); an overload response halves it, at most once per
+    ``decrease_interval`` so one burst of 429s counts as one signal.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64, decrease_interval: float = 1.0):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def _try_acquire(self) -> bool:
+        with self._condition:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        """Block until a request slot is free."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    async def aacquire(self):
+        """Wait for a request slot without blocking the event loop."""
+        # Slots are shared with threads, so poll with a short, growing sleep
+        delay = 0.001
+        while not self._try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def release(self, success: Optional[bool]):
+        """
+        Free a slot and adapt the limit.
+
+        Args:
+            success: True after a good response, False after an overload
+                response, None if the outcome says nothing about load
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if success:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            elif success is False:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.decrease_interval:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            self._condition.notify_all()
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated provider failures.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    requests are rejected for ``reset_timeout`` seconds; then one trial
+    request is let through, closing the circuit on success.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_request(self) -> bool:
+        """
+        Raise CircuitOpenError unless a request may be sent.
+
+        Returns:
+            True if the request is the half-open trial, whose outcome must
+            be recorded or, failing that, given up with ``abort_trial``
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self._trial_in_flight:
+                raise CircuitOpenError(
+                    "Provider temporarily unavailable (circuit open after repeated failures)",
+                    retryable=True,
+                    retry_after=max(remaining, 1.0)
+                )
+            self._trial_in_flight = True
+            return True
+
+    def abort_trial(self):
+        """Let another request try once a trial ended without an outcome (e.g. was cancelled)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if this opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            was_open = self.opened_at is not None
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+                return not was_open
+            return False
+
+class ProviderClient:
+    """
+    Resilient HTTP client for one inference provider endpoint family.
+
+    Every request passes a token-bucket rate limiter, an adaptive (AIMD)
+    concurrency limit and a circuit breaker. 429s, 5xx responses,
+    timeouts and connection errors are retried with exponential backoff
+    and full jitter, waiting at least as long as the server's Retry-After.
+    Failures surface as ``ProviderError``, never as fake results.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        session: Optional[requests.Session] = None,
+        async_client: Optional[httpx.AsyncClient] = None,
+        rate_limit: float = 0.0,
+        burst: int = 10,
+        max_concurrency: int = 16,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30.0,
+        error_message: Optional[Callable[[Any], str]] = None
+    ):
+        """
+        Initialize the client.
+
+        Args:
+            name: Provider name used in metrics ("embeddings", "llm")
+            session: Pooled HTTP session (shared process-wide if None)
+            async_client: Pooled async HTTP client (shared process-wide if None)
+            rate_limit: Sustained requests per second (0 for no limit)
+            burst: Token-bucket capacity
+            max_concurrency: Ceiling (and starting value) of the adaptive
+                concurrency limit
+            max_retries: Retries after the first attempt
+            backoff_base: First backoff ceiling in seconds (doubles per retry)
+            backoff_max: Longest backoff in seconds
+            breaker_threshold: Consecutive failures that open the circuit
+            breaker_reset: Seconds the circuit stays open
+            error_message: Describes a failed response (defaults to status and body)
+        """
+        self.name = name
+        self.session = session or get_session()
+        self.async_client = async_client or get_async_client()
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.error_message = error_message or _default_error_message
+
+        self.rate_limiter = TokenBucket(rate_limit, burst)
+        self.limiter = AdaptiveLimiter(max_concurrency, maximum=max_concurrency)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self._stats_lock = threading.Lock()
+        PROVIDER_CONCURRENCY_LIMIT.set(self.limiter.limit, provider=name)
+        PROVIDER_CIRCUIT_OPEN.set(0, provider=name)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Delay before retry number ``attempt`` (0-based)."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _classify(self, response) -> Optional[ProviderError]:
+        """None for a 200 response, else the error it represents."""
+        if response.status_code == 200:
+            return None
+        return ProviderError(
+            self.error_message(response),
+            status_code=response.status_code,
+            retryable=response.status_code in RETRYABLE_STATUS,
+            retry_after=_retry_after(response)
+        )
+
+    @staticmethod
+    def _transport_error(error: Exception) -> ProviderError:
+        """Wrap a timeout or connection failure."""
+        if isinstance(error, (requests.exceptions.Timeout, httpx.TimeoutException)):
+            return ProviderError("Request timeout. Model took too long to respond.", retryable=True)
+        return ProviderError(f"Connection error: {error}", retryable=True)
+
+    def _finish(self, error: Optional[ProviderError]) -> Optional[bool]:
+        """Update breaker and limiter state after one attempt; returns the limiter signal."""
+        with self._stats_lock:
+            self.requests += 1
+
+        # Outages (5xx, timeouts, connection errors) trip the breaker; any
+        # other answer, even a 4xx or 429, shows the provider is up
+        if error is not None and error.retryable and error.status_code != 429:
+            if self.breaker.record_failure():
+                PROVIDER_CIRCUIT_OPEN.set(1, provider=self.name)
+                print(f"⚠️  {self.name} provider circuit opened after repeated failures")
+        else:
+            self.breaker.record_success()
+            PROVIDER_CIRCUIT_OPEN.set(0, provider=self.name)
+
+        if error is None:
+            return True
+        # Only overload responses say the provider wants less concurrency
+        return False if error.status_code in (429, 503) else None
+
+    def _unexpected_failure(self, signal: list, error: Exception):
+        """Count an attempt that raised something other than a transport error as an outage (not retried)."""
+        signal[0] = self._finish(self._transport_error(error))
+        with self._stats_lock:
+            self.failures += 1
+
+    def _should_retry(self, error: ProviderError, attempt: int) -> bool:
+        retry = error.retryable and attempt < self.max_retries and not isinstance(error, CircuitOpenError)
+        if retry:
+            with self._stats_lock:
+                self.retries += 1
+            PROVIDER_RETRIES.inc(
+                provider=self.name,
+                reason=f"http_{error.status_code}" if error.status_code else "transport"
+            )
+        else:
+            with self._stats_lock:
+                self.failures += 1
+        return retry
+
+    @contextmanager
+    def _slot(self) -> Iterator[list]:
+        """Hold a concurrency slot; the caller stores the limiter signal in the yielded list."""
+        trial = self.breaker.before_request()
+        try:
+            self.rate_limiter.acquire()
+            self.limiter.acquire()
+            signal = [None]
+            try:
+                yield signal
+            finally:
+                self.limiter.release(signal[0])
+                PROVIDER_CONCURRENCY_LIMIT.set(self.limiter.limit, provider=self.name)
+        finally:
+            if trial:
+                # No-op once recorded; otherwise the circuit would stay half-open for good
+                self.breaker.abort_trial()
+
+    @asynccontextmanager
+    async def _aslot(self) -> AsyncIterator[list]:
+        """Async counterpart of ``_slot``."""
+        trial = self.breaker.before_request()
+        try:
+            await self.rate_limiter.aacquire()
+            await self.limiter.aacquire()
+            signal = [None]
+            try:
+                yield signal
+            finally:
+                self.limiter.release(signal[0])
+                PROVIDER_CONCURRENCY_LIMIT.set(self.limiter.limit, provider=self.name)
+        finally:
+            if trial:
+                # Also reached when cancelled mid-request, before any outcome
+                self.breaker.abort_trial()
+
+    @contextmanager
+    def stream(self, url: str, headers: dict, payload: dict, timeout: float, stream: bool = True) -> Iterator[requests.Response]:
+        """
+        Send a POST and yield its successful response.
+
+        Failed attempts are retried before anything is yielded; the
+        concurrency slot is held until the caller is done with the body.
+
+        Raises:
+            ProviderError: If the request fails (after retries)
+        """
+        attempt = 0
+        while True:
+            with self._slot() as signal:
+                error = None
+                try:
+                    with provider_request(self.name):
+                        response = self.session.post(url, headers=headers, json=payload, timeout=timeout, stream=stream)
+                except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                    error = self._transport_error(e)
+                except Exception as e:
+                    self._unexpected_failure(signal, e)
+                    raise
+                else:
+                    record_provider_status(self.name, response.status_code)
+                    error = self._classify(response)
+                    if error is not None:
+                        response.close()
+                signal[0] = self._finish(error)
+
+                if error is None:
+                    with response:
+                        yield response
+                    return
+
+            if not self._should_retry(error, attempt):
+                raise error
+            time.sleep(self._backoff(attempt, error.retry_after))
+            attempt += 1
+
+    def post(self, url: str, headers: dict, payload: dict, timeout: float) -> Any:
+        """
+        Send a POST and return its decoded JSON body.
+
+        Raises:
+            ProviderError: If the request fails (after retries)
+        """
+        with self.stream(url, headers, payload, timeout, stream=False) as response:
+            try:
+                return response.json()
+            except ValueError:
+                raise ProviderError(f"Malformed response: {response.text[:200]}", status_code=200)
+
+    @asynccontextmanager
+    async def astream(self, url: str, headers: dict, payload: dict, timeout: float) -> AsyncIterator[httpx.Response]:
+        """Async counterpart of ``stream``."""
+        attempt = 0
+        while True:
+            async with self._aslot() as signal:
+                error = None
+                try:
+                    with provider_request(self.name):
+                        request = self.async_client.build_request("POST", url, headers=headers, json=payload, timeout=timeout)
+                        response = await self.async_client.send(request, stream=True)
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    error = self._transport_error(e)
+                except Exception as e:
+                    self._unexpected_failure(signal, e)
+                    raise
+                else:
+                    record_provider_status(self.name, response.status_code)
+                    if response.status_code != 200:
+                        await response.aread()
+                        error = self._classify(response)
+                        await response.aclose()
+                signal[0] = self._finish(error)
+
+                if error is None:
+                    try:
+                        yield response
+                    finally:
+                        await response.aclose()
+                    return
+
+            if not self._should_retry(error, attempt):
+                raise error
+            await asyncio.sleep(self._backoff(attempt, error.retry_after))
+            attempt += 1
+
+    async def apost(self, url: str, headers: dict, payload: dict, timeout: float) -> Any:
+        """Async counterpart of ``post``."""
+        async with self.astream(url, headers, payload, timeout) as response:
+            await response.aread()
+            try:
+                return response.json()
+            except ValueError:
+                raise ProviderError(f"Malformed response: {response.text[:200]}", status_code=200)
+
+    def get_stats(self) -> dict:
+        """Get request, retry and limiter statistics."""
+        with self._stats_lock:
+            requests_sent, retries, failures = self.requests, self.retries, self.failures
+        return {
+            "requests": requests_sent,
+            "retries": retries,
+            "failures": failures,
+            "concurrency_limit": round(self.limiter.limit, 2),
+            "in_flight": self.limiter.in_flight,
+            "circuit": self.breaker.state
+        }
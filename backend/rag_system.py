@@ -3,11 +3,34 @@ Cloud-Only RAG System with HuggingFace Inference Providers
 No local models required - everything runs in the cloud
 """
 import os
+import copy
+import time
+import asyncio
+import threading
+import numpy as np
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 from config import get_config
-from llm_provider import HuggingFaceLLM
-from embeddings_provider import HuggingFaceEmbeddings
+from llm_provider import HuggingFaceLLM, REQUEST_TIMEOUT as LLM_REQUEST_TIMEOUT
+from embeddings_provider import HuggingFaceEmbeddings, REQUEST_TIMEOUT as EMBEDDING_REQUEST_TIMEOUT
 from vector_store import VectorStore
+from vector_backends import create_vector_backend
 from document_loader import DocumentLoader
+from http_client import awarm_async_client, get_async_client, get_session, warm_session
+from provider_client import ProviderClient, retry_budget
+from embedding_cache import EmbeddingCache
+from answer_cache import SemanticAnswerCache
+from context_builder import ContextBuilder
+from single_flight import SingleFlight, normalize_text
+from metadata_filter import filter_key, normalize_filter
+from metrics import (
+    INGEST_STAGE_SECONDS, QUERY_SECONDS, QUERY_STAGE_SECONDS,
+    collect_timings, span, timings_ms
+)
+
+# Components created on first use (or by warm_up), in dependency order
+_LAZY_COMPONENTS = ("embeddings", "vector_store", "reranker")
 
 class CloudRAG:
     """RAG system using HuggingFace Inference Providers."""
@@ -27,40 +50,330 @@ class CloudRAG:
         # Initialize components
         print("Initializing components...\n")
         
+        # Pooled HTTP clients shared by both providers
+        self._session = get_session(self.config.HTTP_POOL_SIZE)
+        self._async_client = get_async_client(self.config.HTTP_POOL_SIZE)
+        self._http_pools_warm = {"sync": False, "async": False}
+        
         # LLM
         self.llm = HuggingFaceLLM(
             model_name=self.config.LLM_MODEL,
             api_token=self.config.HF_TOKEN,
             max_tokens=self.config.MAX_TOKENS,
-            temperature=self.config.TEMPERATURE
+            temperature=self.config.TEMPERATURE,
+            api_base=self.config.HF_API_BASE,
+            client=self._create_provider_client("llm", self._session, self._async_client)
         )
         
-        # Embeddings
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=self.config.EMBEDDING_MODEL,
-            api_token=self.config.HF_TOKEN
-        )
+        # Embedding cache
+        self.embedding_cache = None
+        if self.config.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(
+                path=self.config.EMBEDDING_CACHE_PATH,
+                max_entries=self.config.EMBEDDING_CACHE_MAX_ENTRIES
+            )
         
-        # Vector store
-        self.vector_store = VectorStore(
-            collection_name=self.config.COLLECTION_NAME,
-            persist_directory=self.config.VECTOR_DB_DIR,
-            embedding_function=self.embeddings
+        # Embeddings, vector store and reranker load on first use, so the
+        # API can serve before they are ready; warm_up loads them ahead of time
+        self.collection_name = self.config.COLLECTION_NAME
+        self._create_collection = True
+        self._init_components()
+        
+        # Deduplicated, token-budgeted context assembly
+        self.context_builder = ContextBuilder(
+            token_budget=self.config.CONTEXT_TOKEN_BUDGET,
+            duplicate_threshold=self.config.CONTEXT_DUPLICATE_THRESHOLD,
+            merge_adjacent=self.config.CONTEXT_MERGE_ADJACENT
         )
         
+        # Semantic answer cache
+        self.answer_cache = self._create_answer_cache()
+        
+        # Coalescing of identical in-flight requests
+        self.single_flight = None
+        self.single_flight_timeout = self._single_flight_timeout()
+        if self.config.SINGLE_FLIGHT_ENABLED:
+            self.single_flight = SingleFlight(timeout=self.single_flight_timeout)
+        
         # Document loader
         self.document_loader = DocumentLoader(
             chunk_size=self.config.CHUNK_SIZE,
-            chunk_overlap=self.config.CHUNK_OVERLAP
+            chunk_overlap=self.config.CHUNK_OVERLAP,
+            stream_block_chars=self.config.STREAM_BLOCK_CHARS,
+            parser_workers=self.config.PARSER_WORKERS,
+            pdf_pages_per_shard=self.config.PDF_PAGES_PER_SHARD
         )
         
+        self.embedding_model = (
+            self.config.LOCAL_EMBEDDING_MODEL if self.config.EMBEDDING_BACKEND == "local"
+            else self.config.EMBEDDING_MODEL
+        )
         print("\n" + "="*70)
         print("✅ System initialized successfully!")
         print(f"📦 LLM: {self.config.LLM_MODEL}")
-        print(f"🔤 Embeddings: {self.config.EMBEDDING_MODEL}")
-        print(f"💾 Documents: {self.vector_store.count()}")
+        print(f"🔤 Embeddings: {self.embedding_model}")
+        print(f"💾 Collection: {self.collection_name}")
         print("="*70 + "\n")
     
+    def _init_components(self, shared: Optional[Dict[str, Any]] = None):
+        """Reset the lazily created components, keeping any given ones."""
+        self._components: Dict[str, Any] = dict(shared or {})
+        self._component_locks = {name: threading.Lock() for name in _LAZY_COMPONENTS}
+        self._warm_up_seconds: Dict[str, float] = {}
+        self._warm_up_errors: Dict[str, str] = {}
+    
+    def _component(self, name: str) -> Any:
+        """Get a lazily created component, creating it on first use."""
+        try:
+            return self._components[name]
+        except KeyError:
+            pass
+        
+        # Concurrent first uses wait for a single creation
+        with self._component_locks[name]:
+            if name not in self._components:
+                started = time.perf_counter()
+                self._components[name] = getattr(self, f"_create_{name}")()
+                self._warm_up_seconds[name] = round(time.perf_counter() - started, 3)
+                self._warm_up_errors.pop(name, None)
+        return self._components[name]
+    
+    async def acomponent(self, name: str) -> Any:
+        """
+        Async counterpart of the component properties.
+        
+        A component still loading is waited for in a worker thread, so the
+        event loop keeps serving meanwhile; async code paths must use this
+        rather than the properties.
+        
+        Args:
+            name: "embeddings", "vector_store" or "reranker"
+            
+        Returns:
+            The loaded component
+        """
+        try:
+            return self._components[name]
+        except KeyError:
+            return await asyncio.to_thread(self._component, name)
+    
+    @property
+    def embeddings(self):
+        """Embeddings provider (loaded on first use)."""
+        return self._component("embeddings")
+    
+    @property
+    def vector_store(self) -> VectorStore:
+        """Vector store of the collection (opened on first use)."""
+        return self._component("vector_store")
+    
+    @property
+    def reranker(self):
+        """Reranker for over-fetched candidates, or None (loaded on first use)."""
+        return self._component("reranker")
+    
+    def warm_up(self) -> dict:
+        """
+        Load the embeddings, vector store and reranker, and open a pooled
+        connection to the provider API, so the first requests don't wait.
+        
+        A component that fails to load is reported by ``get_readiness``
+        and retried on its first use.
+        
+        Returns:
+            Readiness, as from ``get_readiness``
+        """
+        for name in _LAZY_COMPONENTS:
+            try:
+                self._component(name)
+            except Exception as e:
+                self._warm_up_errors[name] = str(e)
+                print(f"⚠️  Could not load {name}: {e}")
+        
+        self._http_pools_warm["sync"] = warm_session(self._session, self.config.HF_API_BASE)
+        print(f"🔥 Warm-up done: {self._warm_up_seconds}")
+        return self.get_readiness()
+    
+    async def awarm_up(self) -> dict:
+        """Async counterpart of ``warm_up`` that also warms the async connection pool."""
+        await asyncio.to_thread(self.warm_up)
+        self._http_pools_warm["async"] = await awarm_async_client(self._async_client, self.config.HF_API_BASE)
+        return self.get_readiness()
+    
+    def get_readiness(self) -> dict:
+        """
+        Report which components are loaded.
+        
+        Returns:
+            Dictionary with "ready" (every component loaded), per-component
+            status, HTTP pool status, load times and load errors
+        """
+        components = {name: name in self._components for name in _LAZY_COMPONENTS}
+        return {
+            "ready": all(components.values()),
+            "components": components,
+            "http_pools": dict(self._http_pools_warm),
+            "load_seconds": dict(self._warm_up_seconds),
+            "errors": dict(self._warm_up_errors)
+        }
+    
+    def for_collection(self, collection_name: str, create: bool = True) -> "CloudRAG":
+        """
+        Get a view of the system over another collection.
+        
+        The view shares the providers, embedding cache, document loader and
+        context builder with this instance, and has its own vector store
+        (opened on first use), answer cache and request coalescing (so
+        answers never cross collections).
+        
+        Args:
+            collection_name: Name of the collection
+            create: Create the collection if missing; if False, opening the
+                vector store raises ``CollectionNotFoundError`` instead
+            
+        Returns:
+            CloudRAG scoped to the collection
+        """
+        view = copy.copy(self)
+        view.collection_name = collection_name
+        view._create_collection = create
+        shared = {"embeddings": self.embeddings}
+        if self.config.RERANKER != "overlap":
+            # The overlap reranker takes term weights from the collection's own lexical index
+            shared["reranker"] = self.reranker
+        view._init_components(shared)
+        view.answer_cache = self._create_answer_cache()
+        if self.single_flight is not None:
+            view.single_flight = SingleFlight(timeout=self.single_flight_timeout)
+        return view
+    
+    def _create_vector_store(self) -> VectorStore:
+        """Open the vector store of the collection with the configured backend."""
+        return VectorStore(
+            collection_name=self.collection_name,
+            persist_directory=self.config.VECTOR_DB_DIR,
+            embedding_function=self.embeddings,
+            backend=create_vector_backend(
+                self.config.VECTOR_BACKEND,
+                self.collection_name,
+                self.config.VECTOR_DB_DIR,
+                create=self._create_collection,
+                **self._vector_backend_options()
+            ),
+            hybrid_search=self.config.HYBRID_SEARCH_ENABLED,
+            dense_weight=self.config.HYBRID_DENSE_WEIGHT,
+            lexical_weight=self.config.HYBRID_LEXICAL_WEIGHT,
+            rrf_k=self.config.HYBRID_RRF_K,
+            hybrid_candidates=self.config.HYBRID_CANDIDATES
+        )
+    
+    def _create_answer_cache(self) -> Optional[SemanticAnswerCache]:
+        """Create the semantic answer cache (None if disabled)."""
+        if not self.config.ANSWER_CACHE_ENABLED:
+            return None
+        return SemanticAnswerCache(
+            max_entries=self.config.ANSWER_CACHE_MAX_ENTRIES,
+            max_distance=self.config.ANSWER_CACHE_MAX_DISTANCE
+        )
+    
+    def _create_embeddings(self):
+        """Create the embeddings provider selected by EMBEDDING_BACKEND."""
+        backend = self.config.EMBEDDING_BACKEND
+        
+        if backend == "local":
+            from local_embeddings import LocalEmbeddings
+            
+            return LocalEmbeddings(
+                model_name=self.config.LOCAL_EMBEDDING_MODEL,
+                quantized=self.config.LOCAL_EMBEDDING_QUANTIZED,
+                batch_size=self.config.EMBEDDING_BATCH_SIZE,
+                num_threads=self.config.LOCAL_EMBEDDING_THREADS,
+                pooling=self.config.LOCAL_EMBEDDING_POOLING,
+                cache=self.embedding_cache
+            )
+        
+        if backend == "huggingface":
+            return HuggingFaceEmbeddings(
+                model_name=self.config.EMBEDDING_MODEL,
+                api_token=self.config.HF_TOKEN,
+                batch_size=self.config.EMBEDDING_BATCH_SIZE,
+                max_batch_chars=self.config.EMBEDDING_BATCH_MAX_CHARS,
+                max_in_flight=self.config.EMBEDDING_MAX_IN_FLIGHT,
+                cache=self.embedding_cache,
+                api_base=self.config.HF_API_BASE,
+                client=self._create_provider_client("embeddings", self._session, self._async_client)
+            )
+        
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    
+    def _create_provider_client(self, name: str, session, async_client) -> ProviderClient:
+        """Create the rate-limited, retrying client of one HuggingFace provider."""
+        return ProviderClient(
+            name,
+            session=session,
+            async_client=async_client,
+            rate_limit=self.config.PROVIDER_RATE_LIMIT,
+            burst=self.config.PROVIDER_BURST,
+            max_concurrency=self.config.PROVIDER_MAX_CONCURRENCY,
+            max_retries=self.config.PROVIDER_MAX_RETRIES,
+            backoff_base=self.config.PROVIDER_BACKOFF_BASE,
+            backoff_max=self.config.PROVIDER_BACKOFF_MAX,
+            breaker_threshold=self.config.PROVIDER_BREAKER_THRESHOLD,
+            breaker_reset=self.config.PROVIDER_BREAKER_RESET
+        )
+    
+    def _single_flight_timeout(self) -> float:
+        """Seconds a coalesced request waits for its leader (SINGLE_FLIGHT_TIMEOUT, or derived if 0)."""
+        if self.config.SINGLE_FLIGHT_TIMEOUT > 0:
+            return self.config.SINGLE_FLIGHT_TIMEOUT
+        
+        # Outlast a leader that exhausts its retries on one embedding and one
+        # generation request, plus slack for search and reranking
+        budget = sum(
+            retry_budget(timeout, self.config.PROVIDER_MAX_RETRIES, self.config.PROVIDER_BACKOFF_MAX)
+            for timeout in (EMBEDDING_REQUEST_TIMEOUT, LLM_REQUEST_TIMEOUT)
+        )
+        return budget + 30.0
+    
+    def _create_reranker(self):
+        """Create the reranker selected by RERANKER (None to disable reranking)."""
+        kind = self.config.RERANKER
+        
+        if kind == "none":
+            return None
+        
+        if kind == "overlap":
+            from reranker import TokenOverlapReranker
+            
+            lexical_index = self.vector_store.lexical_index
+            return TokenOverlapReranker(idf=lexical_index.idf if lexical_index is not None else None)
+        
+        if kind == "cross-encoder":
+            from reranker import CrossEncoderReranker
+            
+            return CrossEncoderReranker(
+                model_name=self.config.RERANK_MODEL,
+                batch_size=self.config.RERANK_BATCH_SIZE
+            )
+        
+        raise ValueError(f"Unknown reranker: {kind}")
+    
+    def _vector_backend_options(self) -> dict:
+        """Get the options of the configured vector backend."""
+        if self.config.VECTOR_BACKEND == "chroma":
+            # Chroma keeps collection indexes in its own cache; share the tenant budget
+            return {"memory_limit_bytes": self.config.TENANT_MEMORY_BUDGET_MB * 1024 * 1024}
+        if self.config.VECTOR_BACKEND != "local":
+            return {}
+        return {
+            "hnsw_min_items": self.config.HNSW_MIN_ITEMS,
+            "hnsw_m": self.config.HNSW_M,
+            "hnsw_ef_construction": self.config.HNSW_EF_CONSTRUCTION,
+            "hnsw_ef_search": self.config.HNSW_EF_SEARCH,
+            "vector_dtype": self.config.VECTOR_DTYPE,
+            "rerank_factor": self.config.VECTOR_RERANK_FACTOR
+        }
+    
     def add_document(self, file_path: str, doc_type: str = None):
         """
         Add a document to the knowledge base.
@@ -71,53 +384,271 @@ class CloudRAG:
         """
         print(f"\n📄 Loading document: {file_path}")
         
-        # Load and chunk document
-        chunks = self.document_loader.load_document(file_path, doc_type)
-        
-        print(f"📑 Created {len(chunks)} chunks")
+        # Chunks already stored under this source, to diff against
+        previous_ids = self.vector_store.get_source_ids(file_path)
+        current_ids = set()
         
-        # Extract texts and metadata
-        texts = [chunk["content"] for chunk in chunks]
-        metadatas = [chunk["metadata"] for chunk in chunks]
+        # Stream chunks in bounded batches so memory stays flat for large files
+        total = 0
+        for batch in self.document_loader.iter_document_batches(
+            file_path, doc_type, self.config.INGEST_BATCH_SIZE
+        ):
+            texts = [chunk["content"] for chunk in batch]
+            metadatas = [chunk["metadata"] for chunk in batch]
+            embeddings = self.embed_new_chunks(texts, metadatas)
+            current_ids.update(self.index_chunks(texts, metadatas, embeddings))
+            total += len(batch)
         
-        # Add to vector store
-        self.vector_store.add_documents(texts, metadatas)
+        removed = self.remove_stale_chunks(file_path, previous_ids, current_ids)
         
+        print(f"📑 Created {total} chunks ({removed} stale chunks removed)")
         print(f"✅ Document added successfully\n")
     
-    def query(self, question: str) -> dict:
+    def embed_new_chunks(self, texts: List[str], metadatas: List[dict]) -> List[Optional[np.ndarray]]:
         """
-        Query the RAG system.
+        Embed only the chunks of a batch that are not stored yet.
+        
+        Returns:
+            One entry per chunk: its embedding, or None if already stored
+        """
+        embeddings = [None] * len(texts)
+        with span(INGEST_STAGE_SECONDS, "embed"):
+            new = self.vector_store.new_chunk_positions(texts, metadatas)
+            if new:
+                for i, embedding in zip(new, self.embeddings.embed_documents([texts[i] for i in new])):
+                    embeddings[i] = embedding
+        return embeddings
+    
+    async def aembed_new_chunks(self, texts: List[str], metadatas: List[dict]) -> List[Optional[np.ndarray]]:
+        """Async counterpart of ``embed_new_chunks``."""
+        embeddings = [None] * len(texts)
+        with span(INGEST_STAGE_SECONDS, "embed"):
+            vector_store = await self.acomponent("vector_store")
+            new = await asyncio.to_thread(vector_store.new_chunk_positions, texts, metadatas)
+            if new:
+                embedder = await self.acomponent("embeddings")
+                for i, embedding in zip(new, await embedder.aembed_documents([texts[i] for i in new])):
+                    embeddings[i] = embedding
+        return embeddings
+    
+    def index_chunks(
+        self,
+        texts: List[str],
+        metadatas: List[dict],
+        embeddings: Optional[List[Optional[np.ndarray]]] = None
+    ) -> List[str]:
+        """
+        Write chunks to the vector store.
+        
+        Chunks are stamped with an ``uploaded_at`` Unix timestamp (unless
+        their metadata already has one) so questions can be scoped by date.
         
         Args:
-            question: User question
+            texts: Chunk texts
+            metadatas: Chunk metadata dictionaries
+            embeddings: Precomputed embeddings, None entries for chunks
+                already stored (computed if None)
             
         Returns:
-            Dictionary with response and sources
+            Stable IDs of the written chunks
         """
-        print(f"\n❓ Question: {question}\n")
+        uploaded_at = int(time.time())
+        metadatas = [{"uploaded_at": uploaded_at, **metadata} for metadata in metadatas]
         
-        # Retrieve relevant documents
-        print("🔍 Searching knowledge base...")
-        relevant_docs = self.vector_store.search(
-            query=question,
-            top_k=self.config.TOP_K_RESULTS
+        with span(INGEST_STAGE_SECONDS, "write"):
+            ids, written = self.vector_store.upsert_documents(texts, metadatas, embeddings)
+        
+        # New content may change answers; metadata refreshes of stored chunks
+        # don't, since filtered questions bypass the answer cache
+        if written and self.answer_cache:
+            self.answer_cache.invalidate()
+        
+        return ids
+    
+    def remove_stale_chunks(self, source: str, previous_ids: set, current_ids: set) -> int:
+        """
+        Delete the chunks of a re-ingested source that no longer exist.
+        
+        Args:
+            source: Source document
+            previous_ids: Chunk IDs stored for the source before ingestion
+            current_ids: Chunk IDs written by this ingestion
+            
+        Returns:
+            Number of chunks deleted
+        """
+        stale = previous_ids - current_ids
+        if stale:
+            self.vector_store.delete_ids(list(stale))
+            if self.answer_cache:
+                self.answer_cache.invalidate()
+            print(f"🧹 Removed {len(stale)} stale chunks from {source}")
+        return len(stale)
+    
+    def rollback_chunks(self, source: str, previous_ids: set, written_ids: set) -> int:
+        """
+        Delete the chunks an unfinished ingestion of a source added, leaving
+        the previously stored version as it was.
+        
+        Args:
+            source: Source document
+            previous_ids: Chunk IDs stored for the source before ingestion
+            written_ids: Chunk IDs the ingestion wrote (or tried to)
+            
+        Returns:
+            Number of chunks deleted
+        """
+        added = written_ids - previous_ids
+        if added:
+            self.vector_store.delete_ids(list(added))
+            if self.answer_cache:
+                self.answer_cache.invalidate()
+            print(f"↩️  Rolled back {len(added)} chunks of {source}")
+        return len(added)
+    
+    async def aadd_document(self, file_path: str, doc_type: str = None):
+        """
+        Add a document to the knowledge base without blocking the event loop.
+        
+        Parsing runs in a worker thread, embeddings use the async provider
+        client, and the vector store write is offloaded as well.
+        
+        Args:
+            file_path: Path to the document
+            doc_type: Type of document (auto-detected if None)
+        """
+        print(f"\n📄 Loading document: {file_path}")
+        
+        vector_store = await self.acomponent("vector_store")
+        previous_ids = await asyncio.to_thread(vector_store.get_source_ids, file_path)
+        current_ids = set()
+        
+        batches = self.document_loader.iter_document_batches(
+            file_path, doc_type, self.config.INGEST_BATCH_SIZE
         )
         
-        if not relevant_docs:
+        total = 0
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            
+            texts = [chunk["content"] for chunk in batch]
+            metadatas = [chunk["metadata"] for chunk in batch]
+            embeddings = await self.aembed_new_chunks(texts, metadatas)
+            current_ids.update(await asyncio.to_thread(
+                self.index_chunks, texts, metadatas, embeddings
+            ))
+            total += len(batch)
+        
+        removed = await asyncio.to_thread(self.remove_stale_chunks, file_path, previous_ids, current_ids)
+        
+        print(f"📑 Created {total} chunks ({removed} stale chunks removed)")
+        print(f"✅ Document added successfully\n")
+    
+    @staticmethod
+    def _flight_key(question: str, where: Optional[dict] = None) -> tuple:
+        """Coalescing key of a question (and the filter scoping it)."""
+        return normalize_text(question), filter_key(where)
+    
+    def _coalesced(self, kind: str, key: tuple, fn, *args):
+        """
+        Run ``fn(*args)`` once for concurrent identical requests.
+        
+        Callers with the same kind of work ("embed", "retrieve", "answer")
+        and the same ``_flight_key`` share one call and its result.
+        """
+        if self.single_flight is None:
+            return fn(*args)
+        return self.single_flight.do(kind, key, fn, *args)
+    
+    async def _acoalesced(self, kind: str, key: tuple, fn, *args):
+        """Async counterpart of ``_coalesced`` for a coroutine function ``fn``."""
+        if self.single_flight is None:
+            return await fn(*args)
+        return await self.single_flight.ado(kind, key, fn, *args)
+    
+    def _lookup_cached_answer(
+        self,
+        question: str,
+        query_embedding: np.ndarray,
+        where: Optional[dict] = None
+    ) -> Tuple[Optional[dict], Optional[int]]:
+        """
+        Look up a cached answer for a question.
+        
+        Cached answers were drawn from the whole knowledge base, so
+        filtered questions bypass the cache.
+        
+        Returns:
+            Tuple of (cached result or None, cache version to store against,
+            None if the answer must not be cached)
+        """
+        if not self.answer_cache or where:
+            return None, None
+        
+        cache_version = self.answer_cache.version
+        with span(QUERY_STAGE_SECONDS, "cache_lookup"):
+            cached = self.answer_cache.lookup(query_embedding, self.vector_store.ids_exist)
+        if cached is not None:
+            print("⚡ Answer cache hit\n")
+            cached["question"] = question
+        
+        return cached, cache_version
+    
+    def _candidate_count(self) -> int:
+        """Number of chunks to retrieve per question (over-fetched when reranking)."""
+        if self.reranker:
+            return max(self.config.TOP_K_RESULTS, self.config.RERANK_CANDIDATES)
+        return self.config.TOP_K_RESULTS
+    
+    def _select_context(self, question: str, candidates: List[dict]) -> List[dict]:
+        """Rerank retrieved candidates and assemble the prompt context from the best."""
+        if self.reranker and candidates:
+            with span(QUERY_STAGE_SECONDS, "rerank"):
+                candidates = self.reranker.rerank(question, candidates, self.config.TOP_K_RESULTS)
+        
+        with span(QUERY_STAGE_SECONDS, "context"):
+            return self.context_builder.build(candidates)
+    
+    def _retrieve(self, question: str, query_embedding: np.ndarray, where: Optional[dict] = None) -> List[dict]:
+        """Retrieve the chunks relevant to a question, among those matching a filter."""
+        print("🔍 Searching knowledge base...")
+        
+        with span(QUERY_STAGE_SECONDS, "search"):
+            relevant_docs = self.vector_store.search(
+                query=question,
+                top_k=self._candidate_count(),
+                query_embedding=query_embedding,
+                where=where
+            )
+        relevant_docs = self._select_context(question, relevant_docs)
+        
+        if relevant_docs:
+            print(f"📚 Found {len(relevant_docs)} relevant chunks\n")
+        else:
             print("⚠️  No relevant documents found in knowledge base")
             print("💭 Generating response without context...\n")
-            
-            response = self.llm.generate(question)
-            
-            return {
-                "question": question,
-                "response": response,
-                "sources": [],
-                "num_sources": 0
-            }
         
-        print(f"📚 Found {len(relevant_docs)} relevant chunks\n")
+        return relevant_docs
+    
+    def _retrieve_many(self, questions: List[str], query_embeddings: np.ndarray) -> List[List[dict]]:
+        """Retrieve the relevant chunks for several questions with one vector search."""
+        with span(QUERY_STAGE_SECONDS, "search"):
+            candidates = self.vector_store.search_many(
+                questions,
+                self._candidate_count(),
+                query_embeddings
+            )
+        return [
+            self._select_context(question, docs)
+            for question, docs in zip(questions, candidates)
+        ]
+    
+    def _build_prompt(self, question: str, relevant_docs: List[dict]) -> str:
+        """Build the LLM prompt (the bare question if nothing was retrieved)."""
+        if not relevant_docs:
+            return question
         
         # Build context from retrieved documents
         context = "\n\n".join([
@@ -125,8 +656,7 @@ class CloudRAG:
             for i, doc in enumerate(relevant_docs)
         ])
         
-        # Build prompt
-        prompt = f"""Based on the following context, answer the question in a clear, well-structured format.
+        return f"""Based on the following context, answer the question in a clear, well-structured format.
 
 Instructions:
 - Use bullet points or numbered lists when listing multiple items
@@ -141,13 +671,10 @@ Context:
 Question: {question}
 
 Answer:"""
-        
-        # Generate response
-        print("💭 Generating response...\n")
-        response = self.llm.generate(prompt)
-        
-        # Format sources
-        sources = [
+    
+    def _format_sources(self, relevant_docs: List[dict]) -> List[dict]:
+        """Format retrieved chunks as response sources."""
+        return [
             {
                 "source": doc["metadata"].get("source", "Unknown"),
                 "chunk": doc["metadata"].get("chunk_index", 0),
@@ -155,13 +682,504 @@ Answer:"""
             }
             for doc in relevant_docs
         ]
+    
+    def _store_answer(
+        self,
+        query_embedding: np.ndarray,
+        result: dict,
+        relevant_docs: List[dict],
+        cache_version: Optional[int]
+    ):
+        """Store a generated answer in the answer cache (unless the lookup opted out)."""
+        if self.answer_cache and result["response"] and cache_version is not None:
+            self.answer_cache.store(
+                query_embedding,
+                result,
+                [chunk_id for doc in relevant_docs for chunk_id in doc["ids"]],
+                version=cache_version
+            )
+    
+    def _record_query(self, answer: tuple, question: str, elapsed: float, include_timings: bool) -> dict:
+        """
+        Record a query's latency and build its result.
         
-        return {
+        Args:
+            answer: ``(result, generated, timings)`` from ``_answer`` or
+                ``_aanswer``, possibly shared with coalesced callers
+            question: The caller's own question
+            elapsed: Seconds the caller waited
+            include_timings: Attach the stage breakdown
+            
+        Returns:
+            The caller's copy of the result
+        """
+        result, generated, timings = answer
+        QUERY_SECONDS.observe(elapsed, cached=str(not generated).lower())
+        
+        # Coalesced callers share one result; give each its own question
+        result = {**result, "question": question}
+        if not include_timings:
+            return result
+        return {**result, "timings": timings_ms({**timings, "total": elapsed})}
+    
+    def _answer(self, question: str, where: Optional[dict] = None) -> Tuple[dict, bool, Dict[str, float]]:
+        """
+        Answer a question, timing its stages.
+        
+        Returns:
+            Tuple of the result, whether it was generated (rather than
+            served from the answer cache) and the seconds spent per stage
+        """
+        with collect_timings() as timings:
+            result, generated = self._query(question, where)
+        return result, generated, timings
+    
+    def query(self, question: str, include_timings: bool = False, filters: Optional[dict] = None) -> dict:
+        """
+        Query the RAG system.
+        
+        Args:
+            question: User question
+            include_timings: Add "timings", the milliseconds spent in each
+                stage (embed, cache_lookup, search, rerank, context,
+                generate) and in total
+            filters: Metadata filter scoping retrieval, e.g.
+                ``{"type": "pdf"}`` or ``{"uploaded_at": {"$gte": 1700000000}}``
+                (see ``metadata_filter.normalize_filter``)
+            
+        Returns:
+            Dictionary with response and sources
+            
+        Raises:
+            ValueError: If the filter is malformed
+        """
+        where = normalize_filter(filters)
+        started = time.perf_counter()
+        answer = self._coalesced("answer", self._flight_key(question, where), self._answer, question, where)
+        return self._record_query(answer, question, time.perf_counter() - started, include_timings)
+    
+    def _query(self, question: str, where: Optional[dict] = None) -> Tuple[dict, bool]:
+        """Answer a question (the body of ``query``), returning the result and whether it was generated."""
+        print(f"\n❓ Question: {question}\n")
+        
+        with span(QUERY_STAGE_SECONDS, "embed"):
+            query_embedding = self._coalesced("embed", self._flight_key(question), self.embeddings.embed_query, question)
+        
+        # Serve paraphrases of recent questions from the answer cache
+        cached, cache_version = self._lookup_cached_answer(question, query_embedding, where)
+        if cached is not None:
+            return cached, False
+        
+        # Retrieve relevant documents
+        relevant_docs = self._coalesced(
+            "retrieve", self._flight_key(question, where), self._retrieve, question, query_embedding, where
+        )
+        prompt = self._build_prompt(question, relevant_docs)
+        
+        # Generate response
+        print("💭 Generating response...\n")
+        with span(QUERY_STAGE_SECONDS, "generate"):
+            response = self.llm.generate(prompt)
+        
+        sources = self._format_sources(relevant_docs)
+        
+        result = {
             "question": question,
             "response": response,
             "sources": sources,
             "num_sources": len(sources)
         }
+        
+        self._store_answer(query_embedding, result, relevant_docs, cache_version)
+        
+        return result, True
+    
+    def query_stream(self, question: str, filters: Optional[dict] = None) -> Iterator[dict]:
+        """
+        Query the RAG system, streaming the answer as it is generated.
+        
+        Sources are emitted first, then one event per generated text
+        fragment, then a final event with the complete response.
+        
+        Args:
+            question: User question
+            filters: Metadata filter scoping retrieval (see ``query``)
+            
+        Yields:
+            Event dictionaries: ``{"event": "sources" | "token" | "done", "data": {...}}``
+        """
+        where = normalize_filter(filters)
+        print(f"\n❓ Question (streaming): {question}\n")
+        
+        with span(QUERY_STAGE_SECONDS, "embed"):
+            query_embedding = self._coalesced("embed", self._flight_key(question), self.embeddings.embed_query, question)
+        
+        cached, cache_version = self._lookup_cached_answer(question, query_embedding, where)
+        if cached is not None:
+            yield {"event": "sources", "data": {
+                "question": question,
+                "sources": cached["sources"],
+                "num_sources": cached["num_sources"]
+            }}
+            yield {"event": "token", "data": {"text": cached["response"]}}
+            yield {"event": "done", "data": {"response": cached["response"], "cached": True}}
+            return
+        
+        relevant_docs = self._coalesced(
+            "retrieve", self._flight_key(question, where), self._retrieve, question, query_embedding, where
+        )
+        sources = self._format_sources(relevant_docs)
+        
+        yield {"event": "sources", "data": {
+            "question": question,
+            "sources": sources,
+            "num_sources": len(sources)
+        }}
+        
+        print("💭 Streaming response...\n")
+        fragments = []
+        with span(QUERY_STAGE_SECONDS, "generate"):
+            for fragment in self.llm.generate_stream(self._build_prompt(question, relevant_docs)):
+                fragments.append(fragment)
+                yield {"event": "token", "data": {"text": fragment}}
+        
+        response = "".join(fragments).strip()
+        
+        self._store_answer(query_embedding, {
+            "question": question,
+            "response": response,
+            "sources": sources,
+            "num_sources": len(sources)
+        }, relevant_docs, cache_version)
+        
+        yield {"event": "done", "data": {"response": response, "cached": False}}
+    
+    async def aquery(self, question: str, include_timings: bool = False, filters: Optional[dict] = None) -> dict:
+        """
+        Query the RAG system without blocking the event loop.
+        
+        Args:
+            question: User question
+            include_timings: Add "timings" (see ``query``)
+            filters: Metadata filter scoping retrieval (see ``query``)
+            
+        Returns:
+            Dictionary with response and sources
+            
+        Raises:
+            ValueError: If the filter is malformed
+        """
+        where = normalize_filter(filters)
+        started = time.perf_counter()
+        answer = await self._acoalesced("answer", self._flight_key(question, where), self._aanswer, question, where)
+        return self._record_query(answer, question, time.perf_counter() - started, include_timings)
+    
+    async def _aanswer(self, question: str, where: Optional[dict] = None) -> Tuple[dict, bool, Dict[str, float]]:
+        """Async counterpart of ``_answer``."""
+        with collect_timings() as timings:
+            result, generated = await self._aquery(question, where)
+        return result, generated, timings
+    
+    async def _aquery(self, question: str, where: Optional[dict] = None) -> Tuple[dict, bool]:
+        """Answer a question (the body of ``aquery``), returning the result and whether it was generated."""
+        print(f"\n❓ Question: {question}\n")
+        
+        with span(QUERY_STAGE_SECONDS, "embed"):
+            embedder = await self.acomponent("embeddings")
+            query_embedding = await self._acoalesced("embed", self._flight_key(question), embedder.aembed_query, question)
+        
+        cached, cache_version = await asyncio.to_thread(self._lookup_cached_answer, question, query_embedding, where)
+        if cached is not None:
+            return cached, False
+        
+        relevant_docs = await self._acoalesced(
+            "retrieve", self._flight_key(question, where), asyncio.to_thread, self._retrieve, question, query_embedding, where
+        )
+        prompt = self._build_prompt(question, relevant_docs)
+        
+        print("💭 Generating response...\n")
+        with span(QUERY_STAGE_SECONDS, "generate"):
+            response = await self.llm.agenerate(prompt)
+        
+        sources = self._format_sources(relevant_docs)
+        
+        result = {
+            "question": question,
+            "response": response,
+            "sources": sources,
+            "num_sources": len(sources)
+        }
+        
+        self._store_answer(query_embedding, result, relevant_docs, cache_version)
+        
+        return result, True
+    
+    async def aquery_stream(self, question: str, filters: Optional[dict] = None) -> AsyncIterator[dict]:
+        """
+        Async counterpart of ``query_stream``.
+        
+        Args:
+            question: User question
+            filters: Metadata filter scoping retrieval (see ``query``)
+            
+        Yields:
+            Event dictionaries: ``{"event": "sources" | "token" | "done", "data": {...}}``
+        """
+        where = normalize_filter(filters)
+        print(f"\n❓ Question (streaming): {question}\n")
+        
+        with span(QUERY_STAGE_SECONDS, "embed"):
+            embedder = await self.acomponent("embeddings")
+            query_embedding = await self._acoalesced("embed", self._flight_key(question), embedder.aembed_query, question)
+        
+        cached, cache_version = await asyncio.to_thread(self._lookup_cached_answer, question, query_embedding, where)
+        if cached is not None:
+            yield {"event": "sources", "data": {
+                "question": question,
+                "sources": cached["sources"],
+                "num_sources": cached["num_sources"]
+            }}
+            yield {"event": "token", "data": {"text": cached["response"]}}
+            yield {"event": "done", "data": {"response": cached["response"], "cached": True}}
+            return
+        
+        relevant_docs = await self._acoalesced(
+            "retrieve", self._flight_key(question, where), asyncio.to_thread, self._retrieve, question, query_embedding, where
+        )
+        sources = self._format_sources(relevant_docs)
+        
+        yield {"event": "sources", "data": {
+            "question": question,
+            "sources": sources,
+            "num_sources": len(sources)
+        }}
+        
+        print("💭 Streaming response...\n")
+        fragments = []
+        with span(QUERY_STAGE_SECONDS, "generate"):
+            async for fragment in self.llm.agenerate_stream(self._build_prompt(question, relevant_docs)):
+                fragments.append(fragment)
+                yield {"event": "token", "data": {"text": fragment}}
+        
+        response = "".join(fragments).strip()
+        
+        self._store_answer(query_embedding, {
+            "question": question,
+            "response": response,
+            "sources": sources,
+            "num_sources": len(sources)
+        }, relevant_docs, cache_version)
+        
+        yield {"event": "done", "data": {"response": response, "cached": False}}
+    
+    def _prepare_batch(
+        self,
+        questions: List[str],
+        query_embeddings: np.ndarray
+    ) -> List[Tuple[Optional[dict], Optional[int], List[dict]]]:
+        """
+        Look up cached answers and retrieve context for a chunk of batch questions.
+        
+        Returns:
+            One (cached result or None, cache version, relevant chunks) tuple per question
+        """
+        lookups = [
+            self._lookup_cached_answer(question, query_embedding)
+            for question, query_embedding in zip(questions, query_embeddings)
+        ]
+        misses = [i for i, (cached, _) in enumerate(lookups) if cached is None]
+        
+        retrieved = {}
+        if misses:
+            retrieved = dict(zip(misses, self._retrieve_many(
+                [questions[i] for i in misses],
+                query_embeddings[misses]
+            )))
+        
+        return [
+            (cached, cache_version, retrieved.get(i, []))
+            for i, (cached, cache_version) in enumerate(lookups)
+        ]
+    
+    def _batch_result(
+        self,
+        index: int,
+        question: str,
+        query_embedding: np.ndarray,
+        relevant_docs: List[dict],
+        cache_version: Optional[int],
+        response: str
+    ) -> dict:
+        """Format and cache one generated batch answer."""
+        sources = self._format_sources(relevant_docs)
+        result = {
+            "question": question,
+            "response": response,
+            "sources": sources,
+            "num_sources": len(sources)
+        }
+        
+        self._store_answer(query_embedding, result, relevant_docs, cache_version)
+        
+        return {"index": index, **result}
+    
+    @staticmethod
+    def _batch_error(index: int, question: str, error: Exception) -> dict:
+        """Result line for a batch question that failed."""
+        return {"index": index, "question": question, "error": str(error)}
+    
+    def _answer_batch_question(
+        self,
+        index: int,
+        question: str,
+        query_embedding: np.ndarray,
+        relevant_docs: List[dict],
+        cache_version: Optional[int]
+    ) -> dict:
+        """Generate one batch answer (failures are returned, not raised)."""
+        try:
+            with span(QUERY_STAGE_SECONDS, "generate"):
+                response = self.llm.generate(self._build_prompt(question, relevant_docs))
+            return self._batch_result(index, question, query_embedding, relevant_docs, cache_version, response)
+        except Exception as e:
+            return self._batch_error(index, question, e)
+    
+    def query_batch(self, questions: List[str]) -> Iterator[dict]:
+        """
+        Answer many questions, yielding the results in input order.
+        
+        Questions are processed in chunks of BATCH_QUERY_CHUNK: each chunk's
+        embeddings are computed in batched calls and its vector searches run
+        as one multi-query search. Up to BATCH_LLM_CONCURRENCY answers are
+        generated at once, overlapping with retrieval for later chunks.
+        
+        Args:
+            questions: User questions
+            
+        Yields:
+            One result per question: the ``query`` result plus its "index",
+            or {"index", "question", "error"} if that question failed
+        """
+        print(f"\n❓ Batch of {len(questions)} questions\n")
+        
+        chunk_size = max(1, self.config.BATCH_QUERY_CHUNK)
+        concurrency = max(1, self.config.BATCH_LLM_CONCURRENCY)
+        # Bound the answers buffered ahead of the one the caller waits for
+        max_pending = 2 * max(chunk_size, concurrency)
+        
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        pending = deque()
+        try:
+            for start in range(0, len(questions), chunk_size):
+                chunk = questions[start:start + chunk_size]
+                
+                try:
+                    with span(QUERY_STAGE_SECONDS, "embed"):
+                        query_embeddings = self.embeddings.embed_queries(chunk)
+                    prepared = self._prepare_batch(chunk, query_embeddings)
+                except Exception as e:
+                    prepared = None
+                    chunk_error = e
+                
+                for offset, question in enumerate(chunk):
+                    index = start + offset
+                    if prepared is None:
+                        future = Future()
+                        future.set_result(self._batch_error(index, question, chunk_error))
+                    elif prepared[offset][0] is not None:
+                        future = Future()
+                        future.set_result({"index": index, **prepared[offset][0]})
+                    else:
+                        _, cache_version, relevant_docs = prepared[offset]
+                        future = executor.submit(
+                            self._answer_batch_question,
+                            index, question, query_embeddings[offset], relevant_docs, cache_version
+                        )
+                    pending.append(future)
+                
+                while pending and (pending[0].done() or len(pending) > max_pending):
+                    yield pending.popleft().result()
+            
+            while pending:
+                yield pending.popleft().result()
+        
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    async def _aanswer_batch_question(
+        self,
+        semaphore: asyncio.Semaphore,
+        index: int,
+        question: str,
+        query_embedding: np.ndarray,
+        relevant_docs: List[dict],
+        cache_version: Optional[int]
+    ) -> dict:
+        """Async counterpart of ``_answer_batch_question``, limited by a semaphore."""
+        try:
+            async with semaphore:
+                with span(QUERY_STAGE_SECONDS, "generate"):
+                    response = await self.llm.agenerate(self._build_prompt(question, relevant_docs))
+            return self._batch_result(index, question, query_embedding, relevant_docs, cache_version, response)
+        except Exception as e:
+            return self._batch_error(index, question, e)
+    
+    async def aquery_batch(self, questions: List[str]) -> AsyncIterator[dict]:
+        """
+        Async counterpart of ``query_batch``.
+        
+        Args:
+            questions: User questions
+            
+        Yields:
+            One result per question, in input order
+        """
+        print(f"\n❓ Batch of {len(questions)} questions\n")
+        
+        chunk_size = max(1, self.config.BATCH_QUERY_CHUNK)
+        concurrency = max(1, self.config.BATCH_LLM_CONCURRENCY)
+        max_pending = 2 * max(chunk_size, concurrency)
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        try:
+            for start in range(0, len(questions), chunk_size):
+                chunk = questions[start:start + chunk_size]
+                
+                try:
+                    with span(QUERY_STAGE_SECONDS, "embed"):
+                        embedder = await self.acomponent("embeddings")
+                        query_embeddings = await embedder.aembed_queries(chunk)
+                    prepared = await asyncio.to_thread(self._prepare_batch, chunk, query_embeddings)
+                except Exception as e:
+                    prepared = None
+                    chunk_error = e
+                
+                for offset, question in enumerate(chunk):
+                    index = start + offset
+                    if prepared is None:
+                        future = loop.create_future()
+                        future.set_result(self._batch_error(index, question, chunk_error))
+                    elif prepared[offset][0] is not None:
+                        future = loop.create_future()
+                        future.set_result({"index": index, **prepared[offset][0]})
+                    else:
+                        _, cache_version, relevant_docs = prepared[offset]
+                        future = asyncio.create_task(self._aanswer_batch_question(
+                            semaphore, index, question, query_embeddings[offset], relevant_docs, cache_version
+                        ))
+                    pending.append(future)
+                
+                while pending and (pending[0].done() or len(pending) > max_pending):
+                    yield await pending.popleft()
+            
+            while pending:
+                yield await pending.popleft()
+        
+        finally:
+            for future in pending:
+                future.cancel()
     
     def ingest_document(self, doc_type: str, file_path: str):
         """
@@ -185,18 +1203,37 @@ Answer:"""
         """
         return self.query(question)
     
+    def flush(self):
+        """Persist buffered index state (nothing to do if the vector store was never opened)."""
+        vector_store = self._components.get("vector_store")
+        if vector_store is not None:
+            vector_store.flush()
+    
     def clear_knowledge_base(self):
         """Clear all documents from the knowledge base."""
         self.vector_store.clear()
+        
+        if self.answer_cache:
+            self.answer_cache.invalidate()
     
     def get_stats(self) -> dict:
         """Get system statistics."""
         return {
             "model": self.config.LLM_MODEL,
-            "embedding_model": self.config.EMBEDDING_MODEL,
+            "embedding_model": self.embedding_model,
             "documents": self.vector_store.count(),
             "chunk_size": self.config.CHUNK_SIZE,
-            "top_k": self.config.TOP_K_RESULTS
+            "top_k": self.config.TOP_K_RESULTS,
+            "embedding_cache": self.embedding_cache.get_stats() if self.embedding_cache else None,
+            "answer_cache": self.answer_cache.get_stats() if self.answer_cache else None,
+            "reranker": self.reranker.get_stats() if self.reranker else None,
+            "context": self.context_builder.get_stats(),
+            "single_flight": self.single_flight.get_stats() if self.single_flight else None,
+            "providers": {
+                name: component.client.get_stats()
+                for name, component in (("llm", self.llm), ("embeddings", self.embeddings))
+                if hasattr(component, "client")
+            }
         }
 
 def main():
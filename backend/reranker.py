@@ -0,0 +1,219 @@
+"""
+Rerankers
+Rescore over-fetched retrieval candidates so only the best reach the prompt
+"""
+import math
+import threading
+import time
+import numpy as np
+from collections import deque
+from typing import Callable, Dict, List, Optional
+from lexical_index import tokenize
+
+class _LatencyStats:
+    """Call counts and recent latencies of a reranker."""
+
+    def __init__(self, window: int = 1000):
+        """Track totals plus the latencies of the last ``window`` calls."""
+        self.calls = 0
+        self.candidates = 0
+        self.total_seconds = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, num_candidates: int, seconds: float):
+        """Record one rerank call."""
+        with self._lock:
+            self.calls += 1
+            self.candidates += num_candidates
+            self.total_seconds += seconds
+            self._recent.append(seconds)
+
+    def to_dict(self) -> dict:
+        """Summarize call counts and latency percentiles."""
+        with self._lock:
+            recent = sorted(self._recent)
+            calls = self.calls
+            candidates = self.candidates
+            total = self.total_seconds
+
+        def percentile(p: float) -> float:
+            if not recent:
+                return 0.0
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))] * 1000, 3)
+
+        return {
+            "calls": calls,
+            "candidates": candidates,
+            "avg_ms": round(total / calls * 1000, 3) if calls else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95)
+        }
+
+class TokenOverlapReranker:
+    """
+    Model-free reranker scoring candidates by weighted query term overlap.
+
+    A candidate's score is the IDF-weighted share of query terms it
+    contains, plus a bonus for query bigrams it contains verbatim and a
+    small prior from its retrieval rank (so ties keep retrieval order).
+    """
+
+    name = "overlap"
+
+    def __init__(
+        self,
+        idf: Optional[Callable[[str], float]] = None,
+        phrase_weight: float = 0.5,
+        rank_weight: float = 0.1
+    ):
+        """
+        Initialize the reranker.
+
+        Args:
+            idf: Term IDF lookup (e.g. the BM25 index's); IDF is estimated
+                from the candidates themselves if None
+            phrase_weight: Weight of the query bigram match share
+            rank_weight: Weight of the retrieval rank prior
+        """
+        self.idf = idf
+        self.phrase_weight = phrase_weight
+        self.rank_weight = rank_weight
+        self.stats = _LatencyStats()
+
+    def rerank(self, query: str, documents: List[Dict], top_k: int) -> List[Dict]:
+        """
+        Reorder candidates and keep the best.
+
+        Args:
+            query: User question
+            documents: Retrieval results, best first
+            top_k: Number of documents to keep
+
+        Returns:
+            The top_k documents, each with a "rerank_score"
+        """
+        started = time.perf_counter()
+
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        query_bigrams = set(zip(query_terms, query_terms[1:]))
+        doc_terms = [tokenize(doc["content"]) for doc in documents]
+        doc_sets = [set(terms) for terms in doc_terms]
+
+        if self.idf is not None:
+            weights = {term: self.idf(term) for term in query_terms}
+        else:
+            weights = {
+                term: math.log(1 + len(documents) / (1 + sum(term in terms for terms in doc_sets)))
+                for term in query_terms
+            }
+        total_weight = sum(weights.values()) or 1.0
+
+        scored = []
+        for rank, (doc, terms, term_set) in enumerate(zip(documents, doc_terms, doc_sets)):
+            coverage = sum(weight for term, weight in weights.items() if term in term_set) / total_weight
+            phrase = 0.0
+            if query_bigrams:
+                phrase = len(query_bigrams & set(zip(terms, terms[1:]))) / len(query_bigrams)
+            score = coverage + self.phrase_weight * phrase + self.rank_weight / (rank + 1)
+            scored.append({**doc, "rerank_score": round(score, 6)})
+
+        scored.sort(key=lambda doc: doc["rerank_score"], reverse=True)
+        self.stats.record(len(documents), time.perf_counter() - started)
+        return scored[:top_k]
+
+    def get_stats(self) -> dict:
+        """Get reranker statistics."""
+        return {"type": self.name, **self.stats.to_dict()}
+
+class CrossEncoderReranker:
+    """CPU cross-encoder (ONNX Runtime) scoring each (question, chunk) pair jointly."""
+
+    name = "cross-encoder"
+
+    def __init__(
+        self,
+        model_name: str = "Xenova/ms-marco-MiniLM-L-6-v2",
+        quantized: bool = True,
+        batch_size: int = 16,
+        num_threads: int = 0,
+        max_length: int = 512
+    ):
+        """
+        Load the tokenizer and ONNX cross-encoder.
+
+        Args:
+            model_name: Local directory or HuggingFace Hub repo with
+                "tokenizer.json" and an ONNX export
+            quantized: Use int8 weights
+            batch_size: Pairs scored per inference call
+            num_threads: ONNX Runtime intra-op threads (0 lets it decide)
+            max_length: Maximum tokens per pair (the chunk is truncated)
+        """
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError("onnxruntime not installed. Install with: pip install onnxruntime tokenizers")
+
+        from local_embeddings import create_onnx_session, resolve_model_file, resolve_onnx_model
+
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+
+        self.tokenizer = Tokenizer.from_file(resolve_model_file(model_name, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length, strategy="only_second")
+        self.tokenizer.enable_padding()
+
+        self.session = create_onnx_session(resolve_onnx_model(model_name, quantized), num_threads)
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self._lock = threading.Lock()
+        self.stats = _LatencyStats()
+
+        print(f"✅ Cross-encoder reranker initialized: {model_name}")
+
+    def _score(self, query: str, texts: List[str]) -> np.ndarray:
+        """Relevance logits of (query, text) pairs."""
+        scores = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            encodings = self.tokenizer.encode_batch([(query, text) for text in batch])
+
+            inputs = {
+                "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                "attention_mask": np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            }
+            if "token_type_ids" in self._input_names:
+                inputs["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+
+            with self._lock:
+                logits = self.session.run(None, inputs)[0]
+            # Single-logit models score directly; two-class models use the "relevant" logit
+            scores.append(logits[:, -1] if logits.ndim == 2 else logits)
+
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+    def rerank(self, query: str, documents: List[Dict], top_k: int) -> List[Dict]:
+        """
+        Reorder candidates and keep the best.
+
+        Args:
+            query: User question
+            documents: Retrieval results, best first
+            top_k: Number of documents to keep
+
+        Returns:
+            The top_k documents, each with a "rerank_score"
+        """
+        started = time.perf_counter()
+
+        scores = self._score(query, [doc["content"] for doc in documents])
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        reranked = [{**documents[i], "rerank_score": round(float(scores[i]), 6)} for i in order]
+
+        self.stats.record(len(documents), time.perf_counter() - started)
+        return reranked
+
+    def get_stats(self) -> dict:
+        """Get reranker statistics."""
+        return {"type": self.name, "model": self.model_name, **self.stats.to_dict()}
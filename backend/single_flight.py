@@ -0,0 +1,148 @@
+"""
+Single Flight
+Coalesces identical concurrent computations into one shared call
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, wait
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from metrics import COALESCED_REQUESTS
+
+def normalize_text(text: str) -> str:
+    """Key form of a question: whitespace collapsed, case folded."""
+    return " ".join(text.split()).casefold()
+
+class SingleFlight:
+    """
+    Runs each distinct in-flight computation once.
+
+    The first caller for a (kind, key) pair becomes the leader and runs the
+    computation; callers arriving while it runs wait for the leader's
+    result (or exception) instead of starting their own. Keys are dropped
+    as soon as the leader finishes, so nothing is cached beyond the call.
+
+    Sync callers (in threads) and async callers (on an event loop) share
+    the same in-flight calls. If a leader is cancelled, its waiters retry
+    and one of them takes over.
+    """
+
+    def __init__(self, timeout: float = 120.0):
+        """
+        Args:
+            timeout: Seconds a waiter waits for the leader before raising
+                TimeoutError (the leader's own call is not interrupted)
+        """
+        self.timeout = timeout
+        self._calls: Dict[Tuple[str, Hashable], Future] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, kind: str, outcome: str):
+        with self._lock:
+            stats = self._stats.setdefault(kind, {"leaders": 0, "coalesced": 0, "timeouts": 0})
+            stats[outcome] += 1
+
+    def _join(self, kind: str, key: Hashable) -> Tuple[Future, bool]:
+        """Get the in-flight call for a key, registering a new one if there is none."""
+        call_key = (kind, key)
+        with self._lock:
+            future = self._calls.get(call_key)
+            if future is not None:
+                return future, False
+            future = self._calls[call_key] = Future()
+        self._count(kind, "leaders")
+        return future, True
+
+    def _finish(self, kind: str, key: Hashable, future: Future):
+        with self._lock:
+            if self._calls.get((kind, key)) is future:
+                del self._calls[(kind, key)]
+
+    def _timed_out(self, kind: str) -> TimeoutError:
+        self._count(kind, "timeouts")
+        return TimeoutError(f"Timed out after {self.timeout}s waiting for an identical in-flight {kind} request")
+
+    def do(self, kind: str, key: Hashable, fn: Callable[..., Any], *args) -> Any:
+        """
+        Call ``fn(*args)``, or share the result of an identical call in flight.
+
+        Args:
+            kind: Kind of computation (e.g. "embed"); keys of different
+                kinds never collide
+            key: Identity of the computation within its kind
+            fn: Function computing the result
+            *args: Arguments for ``fn``
+
+        Returns:
+            The result of ``fn`` (the same object for every caller, so do
+            not mutate it)
+
+        Raises:
+            TimeoutError: If a waiter gave up on the leader
+        """
+        while True:
+            future, leader = self._join(kind, key)
+            if leader:
+                try:
+                    result = fn(*args)
+                except Exception as e:
+                    future.set_exception(e)
+                    raise
+                except BaseException:
+                    future.cancel()
+                    raise
+                else:
+                    future.set_result(result)
+                    return result
+                finally:
+                    self._finish(kind, key, future)
+
+            self._count(kind, "coalesced")
+            COALESCED_REQUESTS.inc(kind=kind)
+            wait([future], timeout=self.timeout)
+            if not future.done():
+                raise self._timed_out(kind)
+            if not future.cancelled():
+                return future.result()
+
+    async def ado(self, kind: str, key: Hashable, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        """
+        Async counterpart of ``do`` for a coroutine function ``fn``.
+
+        Cancelling a waiter leaves the leader running; cancelling the
+        leader hands the computation over to a waiter.
+        """
+        while True:
+            future, leader = self._join(kind, key)
+            if leader:
+                try:
+                    result = await fn(*args)
+                except Exception as e:
+                    future.set_exception(e)
+                    raise
+                except BaseException:
+                    future.cancel()
+                    raise
+                else:
+                    future.set_result(result)
+                    return result
+                finally:
+                    self._finish(kind, key, future)
+
+            self._count(kind, "coalesced")
+            COALESCED_REQUESTS.inc(kind=kind)
+            shared = asyncio.wrap_future(future)
+            # Mark the error as retrieved even if this waiter stops listening
+            shared.add_done_callback(lambda f: f.cancelled() or f.exception())
+            done, _ = await asyncio.wait({shared}, timeout=self.timeout)
+            if not done:
+                raise self._timed_out(kind)
+            if not shared.cancelled():
+                return shared.result()
+
+    def get_stats(self) -> dict:
+        """Get per-kind leader, coalesced and timeout counts."""
+        with self._lock:
+            stats = {kind: dict(counts) for kind, counts in self._stats.items()}
+            stats["in_flight"] = len(self._calls)
+        return stats
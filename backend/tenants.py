@@ -0,0 +1,311 @@
+"""
+Tenants
+Per-tenant knowledge bases, opened on demand and closed least recently used
+"""
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
+from single_flight import SingleFlight
+from vector_backends import CollectionNotFoundError
+from metrics import TENANT_EVICTIONS, TENANT_MEMORY_BYTES, TENANTS_RESIDENT
+
+# Lowercase letters, digits, "-" and "_", starting and ending alphanumeric,
+# so "<COLLECTION_NAME>__<tenant>" is a valid collection and directory name
+_TENANT_ID_PATTERN = re.compile(r"^[a-z0-9](?:[a-z0-9_-]{0,30}[a-z0-9])?$")
+
+# Tenants whose request, open and eviction counts are kept (resident ones always are)
+_MAX_TRACKED_TENANTS = 1024
+
+class UnknownTenantError(LookupError):
+    """Raised when a tenant without a knowledge base is used for reading."""
+
+class _Tenant:
+    """An open tenant knowledge base."""
+
+    def __init__(self, rag):
+        self.rag = rag
+        self.leases = 0
+        self.memory_bytes = rag.vector_store.memory_bytes()
+        self.last_used = time.time()
+
+class TenantManager:
+    """
+    Serves one knowledge base (collection) per tenant from a shared CloudRAG.
+
+    The default tenant is the base instance and always stays open. Other
+    tenants are opened on first use as views sharing the base instance's
+    providers, and kept in least-recently-used order. Only writes (uploads)
+    create a tenant's collection; reading an unknown tenant raises
+    ``UnknownTenantError``. Once more than
+    ``max_resident`` are open, or their estimated index memory exceeds
+    ``memory_budget_bytes``, the least recently used ones are flushed and
+    closed. A tenant is never closed while leased to a request or an
+    ingestion job, nor while it is the most recently used. Closing (which
+    may flush an index to disk) happens outside the manager's lock, so it
+    never holds up other tenants.
+    """
+
+    def __init__(
+        self,
+        rag,
+        default_tenant: str = "default",
+        max_resident: int = 64,
+        memory_budget_bytes: int = 0
+    ):
+        """
+        Args:
+            rag: Base CloudRAG instance, serving the default tenant
+            default_tenant: Tenant of requests that name none
+            max_resident: Tenants (besides the default) kept open at most
+            memory_budget_bytes: Estimated index memory of the open tenants
+                above which idle ones are closed (0 for no budget)
+        """
+        self.rag = rag
+        self.default_tenant = default_tenant
+        self.max_resident = max(1, max_resident)
+        self.memory_budget_bytes = memory_budget_bytes
+
+        self._resident: "OrderedDict[str, _Tenant]" = OrderedDict()
+        # Evicted tenants still being closed; reopening waits for the close
+        self._closing: Dict[str, threading.Event] = {}
+        self._lock = threading.RLock()
+        # Concurrent first requests for a tenant share one open
+        self._opens = SingleFlight(timeout=rag.single_flight_timeout)
+        # Least recently counted first
+        self._counters: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+
+    def resolve(self, tenant_id: Optional[str]) -> str:
+        """
+        Normalize a requested tenant ID.
+
+        Args:
+            tenant_id: Tenant ID (case-insensitive; None or blank for the default)
+
+        Returns:
+            The canonical tenant ID
+
+        Raises:
+            ValueError: If the ID is malformed
+        """
+        if tenant_id is None or not tenant_id.strip():
+            return self.default_tenant
+        tenant_id = tenant_id.strip().lower()
+        if tenant_id != self.default_tenant and not _TENANT_ID_PATTERN.match(tenant_id):
+            raise ValueError(
+                "Tenant IDs are 1-32 letters, digits, '-' or '_', starting and ending with a letter or digit"
+            )
+        return tenant_id
+
+    def collection_name(self, tenant_id: str) -> str:
+        """Name of a tenant's collection."""
+        base = self.rag.config.COLLECTION_NAME
+        return base if tenant_id == self.default_tenant else f"{base}__{tenant_id}"
+
+    def _count(self, tenant_id: str, counter: str):
+        with self._lock:
+            counters = self._counters.pop(tenant_id, None) or {"requests": 0, "opens": 0, "evictions": 0}
+            counters[counter] += 1
+            self._counters[tenant_id] = counters
+            if len(self._counters) > _MAX_TRACKED_TENANTS:
+                # Forget the least recently counted tenant that is not open
+                stale = next(
+                    (other for other in self._counters
+                     if other not in self._resident and other != self.default_tenant),
+                    None
+                )
+                if stale is not None:
+                    del self._counters[stale]
+
+    def acquire(self, tenant_id: Optional[str] = None, create: bool = False):
+        """
+        Lease a tenant's knowledge base, opening it if needed.
+
+        Every acquire must be paired with a ``release`` of the same tenant.
+
+        Args:
+            tenant_id: Tenant ID (None for the default tenant)
+            create: Create the tenant's collection if it does not exist
+                (for writes; reads of unknown tenants fail)
+
+        Returns:
+            CloudRAG scoped to the tenant's collection
+
+        Raises:
+            ValueError: If the ID is malformed
+            UnknownTenantError: If the tenant has no collection and create is False
+        """
+        tenant_id = self.resolve(tenant_id)
+        if tenant_id == self.default_tenant:
+            self._count(tenant_id, "requests")
+            return self.rag
+
+        while True:
+            with self._lock:
+                tenant = self._resident.get(tenant_id)
+                if tenant is not None:
+                    tenant.leases += 1
+                    tenant.last_used = time.time()
+                    self._resident.move_to_end(tenant_id)
+                    self._count(tenant_id, "requests")
+                    return tenant.rag
+            # Retried if closed again before this caller could lease it
+            try:
+                self._opens.do("tenant_open", tenant_id, self._open, tenant_id, create)
+            except UnknownTenantError:
+                # Joined a read's open; a write opens again, creating the collection
+                if not create:
+                    raise
+                self._opens.do("tenant_open", tenant_id, self._open, tenant_id, True)
+
+    def release(self, tenant_id: Optional[str] = None):
+        """Return a leased knowledge base, closing idle tenants if over the limits."""
+        tenant_id = self.resolve(tenant_id)
+        if tenant_id == self.default_tenant:
+            return
+
+        with self._lock:
+            tenant = self._resident.get(tenant_id)
+            if tenant is None:
+                return
+            tenant.leases -= 1
+            tenant.last_used = time.time()
+            # Ingestion may have grown the indexes while leased
+            tenant.memory_bytes = tenant.rag.vector_store.memory_bytes()
+            evicted = self._evict()
+        self._close(evicted)
+
+    @contextmanager
+    def lease(self, tenant_id: Optional[str] = None, create: bool = False):
+        """Lease a tenant's knowledge base for the duration of a block (see ``acquire``)."""
+        rag = self.acquire(tenant_id, create)
+        try:
+            yield rag
+        finally:
+            self.release(tenant_id)
+
+    @asynccontextmanager
+    async def alease(self, tenant_id: Optional[str] = None, create: bool = False):
+        """Async counterpart of ``lease``; opening and closing run in a worker thread."""
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self.acquire, tenant_id, create))
+        try:
+            rag = await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The open still completes in its thread; give the lease back then
+            acquiring.add_done_callback(
+                lambda f: f.cancelled() or f.exception() or self.release(tenant_id)
+            )
+            raise
+        try:
+            yield rag
+        finally:
+            await asyncio.to_thread(self.release, tenant_id)
+
+    def _open(self, tenant_id: str, create: bool):
+        """Open a tenant's collection and make it resident."""
+        with self._lock:
+            if tenant_id in self._resident:
+                return
+            closing = self._closing.get(tenant_id)
+        if closing is not None:
+            # Never have two instances of one collection open at once
+            closing.wait()
+
+        try:
+            tenant = _Tenant(self.rag.for_collection(self.collection_name(tenant_id), create=create))
+        except CollectionNotFoundError:
+            raise UnknownTenantError(f"Unknown tenant: {tenant_id}") from None
+        print(f"📂 Opened tenant '{tenant_id}'")
+
+        with self._lock:
+            self._resident[tenant_id] = tenant
+            self._count(tenant_id, "opens")
+            evicted = self._evict()
+        self._close(evicted)
+
+    def _evict(self) -> List[tuple]:
+        """
+        Take least recently used idle tenants out of residency until within
+        the limits (caller holds the lock).
+
+        Returns:
+            (tenant ID, tenant) pairs for the caller to ``_close`` once it
+            has released the lock
+        """
+        evicted = []
+        while len(self._resident) > 1:
+            memory = sum(tenant.memory_bytes for tenant in self._resident.values())
+            if len(self._resident) > self.max_resident:
+                reason = "count"
+            elif self.memory_budget_bytes and memory > self.memory_budget_bytes:
+                reason = "memory"
+            else:
+                break
+
+            # The most recently used tenant stays open even if over the budget alone
+            candidates = list(self._resident.items())[:-1]
+            victim = next((tenant_id for tenant_id, tenant in candidates if tenant.leases == 0), None)
+            if victim is None:
+                break
+            evicted.append(self._take(victim))
+            self._count(victim, "evictions")
+            TENANT_EVICTIONS.inc(reason=reason)
+
+        TENANTS_RESIDENT.set(len(self._resident))
+        TENANT_MEMORY_BYTES.set(sum(tenant.memory_bytes for tenant in self._resident.values()))
+        return evicted
+
+    def _take(self, tenant_id: str) -> tuple:
+        """Remove a tenant from residency, marking it as closing (caller holds the lock)."""
+        self._closing[tenant_id] = threading.Event()
+        return tenant_id, self._resident.pop(tenant_id)
+
+    def _close(self, evicted: List[tuple]):
+        """Flush and close tenants taken out of residency (without holding the lock)."""
+        for tenant_id, tenant in evicted:
+            try:
+                tenant.rag.vector_store.close()
+                print(f"📪 Closed tenant '{tenant_id}'")
+            finally:
+                with self._lock:
+                    self._closing.pop(tenant_id).set()
+
+    def close(self):
+        """Close every open tenant (at shutdown)."""
+        with self._lock:
+            evicted = [self._take(tenant_id) for tenant_id in list(self._resident)]
+            TENANTS_RESIDENT.set(0)
+            TENANT_MEMORY_BYTES.set(0)
+        self._close(evicted)
+
+    def get_stats(self) -> dict:
+        """Get residency, memory and per-tenant request, open and eviction counts."""
+        now = time.time()
+        with self._lock:
+            memory = sum(tenant.memory_bytes for tenant in self._resident.values())
+            tenants = {}
+            for tenant_id, counters in self._counters.items():
+                stats = dict(counters)
+                tenant = self._resident.get(tenant_id)
+                if tenant is not None:
+                    stats.update({
+                        "resident": True,
+                        "leases": tenant.leases,
+                        "memory_mb": round(tenant.memory_bytes / 1024 / 1024, 2),
+                        "idle_seconds": round(now - tenant.last_used, 1)
+                    })
+                else:
+                    stats["resident"] = tenant_id == self.default_tenant
+                tenants[tenant_id] = stats
+
+            return {
+                "default_tenant": self.default_tenant,
+                "resident": len(self._resident),
+                "max_resident": self.max_resident,
+                "memory_mb": round(memory / 1024 / 1024, 2),
+                "memory_budget_mb": round(self.memory_budget_bytes / 1024 / 1024, 2),
+                "tenants": tenants
+            }
@@ -0,0 +1,132 @@
+"""
+Ingestion Queue tests
+Re-ingestion of a source and rollback of unfinished jobs
+"""
+import time
+from types import SimpleNamespace
+from ingestion import IngestionQueue
+
+class FakeVectorStore:
+    """Chunks keyed by their text, each with its source."""
+
+    def __init__(self):
+        self.chunks = {}
+
+    def get_source_ids(self, source: str) -> set:
+        return {chunk_id for chunk_id, chunk_source in self.chunks.items() if chunk_source == source}
+
+    def chunk_ids(self, texts, metadatas):
+        return list(texts)
+
+    def delete_ids(self, ids):
+        for chunk_id in ids:
+            self.chunks.pop(chunk_id, None)
+
+class FakeLoader:
+    """Reads one chunk per line."""
+
+    def iter_document_batches(self, file_path, doc_type, batch_size):
+        with open(file_path) as f:
+            lines = f.read().split()
+        for i in range(0, len(lines), batch_size):
+            yield [{"content": line, "metadata": {}} for line in lines[i:i + batch_size]]
+
+class FakeRAG:
+    """The parts of CloudRAG the pipeline uses; embedding chunks in ``slow`` takes a while."""
+
+    def __init__(self, slow=(), fail=()):
+        self.vector_store = FakeVectorStore()
+        self.document_loader = FakeLoader()
+        self.slow = set(slow)
+        self.fail = set(fail)
+
+    def embed_new_chunks(self, texts, metadatas):
+        if self.slow.intersection(texts):
+            time.sleep(0.3)
+        if self.fail.intersection(texts):
+            raise RuntimeError("provider down")
+        return [None] * len(texts)
+
+    def index_chunks(self, texts, metadatas, embeddings=None):
+        for text, metadata in zip(texts, metadatas):
+            self.vector_store.chunks[text] = metadata["source"]
+        return list(texts)
+
+    def remove_stale_chunks(self, source, previous_ids, current_ids):
+        stale = previous_ids - current_ids
+        self.vector_store.delete_ids(stale)
+        return len(stale)
+
+    def rollback_chunks(self, source, previous_ids, written_ids):
+        added = written_ids - previous_ids
+        self.vector_store.delete_ids(added)
+        return len(added)
+
+def _upload(tmp_path, name: str, chunks) -> str:
+    path = tmp_path / name
+    path.write_text("\n".join(chunks))
+    return str(path)
+
+def _wait(*jobs):
+    deadline = time.time() + 10
+    while any(job.status in ("queued", "running") for job in jobs):
+        assert time.time() < deadline, "ingestion did not finish"
+        time.sleep(0.01)
+
+def test_same_source_jobs_do_not_interleave(tmp_path):
+    rag = FakeRAG(slow={"X"})
+    source = str(tmp_path / "doc.txt")
+    rag.vector_store.chunks = {"P0": source, "P1": source, "P2": source}
+    ingestion = IngestionQueue(rag, num_workers=2, batch_size=1)
+    try:
+        # A is still embedding when B is submitted; B must wait for it
+        first = ingestion.submit(_upload(tmp_path, "a.tmp", ["P0", "X"]), "doc.txt", source=source)
+        time.sleep(0.05)
+        second = ingestion.submit(_upload(tmp_path, "b.tmp", ["P1", "P2", "Y"]), "doc.txt", source=source)
+        _wait(first, second)
+    finally:
+        ingestion.shutdown()
+
+    assert first.status == second.status == "completed"
+    # The newer upload wins, not a mix of both (e.g. ['X', 'Y'])
+    assert sorted(rag.vector_store.get_source_ids(source)) == ["P1", "P2", "Y"]
+    with open(source) as f:
+        assert f.read().split() == ["P1", "P2", "Y"]
+    assert not (tmp_path / "a.tmp").exists()
+    assert not (tmp_path / "b.tmp").exists()
+    assert ingestion._source_locks == {}
+
+def test_failed_reingestion_keeps_previous_version(tmp_path):
+    rag = FakeRAG(fail={"Z"})
+    source = str(tmp_path / "doc.txt")
+    rag.vector_store.chunks = {"P0": source, "P1": source}
+    ingestion = IngestionQueue(rag, num_workers=1, batch_size=1)
+    try:
+        job = ingestion.submit(_upload(tmp_path, "a.tmp", ["P1", "X", "Z"]), "doc.txt", source=source)
+        _wait(job)
+    finally:
+        ingestion.shutdown()
+
+    assert job.status == "failed"
+    assert sorted(rag.vector_store.get_source_ids(source)) == ["P0", "P1"]
+    assert any(error.startswith("rolled back: job failed") for error in job.errors)
+    assert not (tmp_path / "a.tmp").exists()
+
+def test_cancelled_reingestion_keeps_previous_version(tmp_path):
+    rag = FakeRAG(slow={"X"})
+    source = str(tmp_path / "doc.txt")
+    rag.vector_store.chunks = {"P0": source}
+    ingestion = IngestionQueue(rag, num_workers=1, batch_size=1)
+    try:
+        job = ingestion.submit(_upload(tmp_path, "a.tmp", ["N", "X", "M"]), "doc.txt", source=source)
+        deadline = time.time() + 5
+        while job.status != "running" and time.time() < deadline:
+            time.sleep(0.01)
+        assert ingestion.cancel(job.id)
+        _wait(job)
+    finally:
+        ingestion.shutdown()
+
+    assert job.status == "cancelled"
+    assert sorted(rag.vector_store.get_source_ids(source)) == ["P0"]
+    assert any(error.startswith("rolled back: job was cancelled") for error in job.errors)
@@ -0,0 +1,236 @@
+"""
+Provider Client tests
+Circuit breaker, adaptive concurrency limit and retry behaviour
+"""
+import asyncio
+import httpx
+import pytest
+import requests
+import provider_client
+from provider_client import (
+    AdaptiveLimiter, CircuitBreaker, CircuitOpenError, ProviderClient, ProviderError
+)
+
+def _response(status_code: int, body: bytes = b"{}", headers: dict = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = body
+    response.headers.update(headers or {})
+    return response
+
+def _expire(breaker: CircuitBreaker):
+    """Move the opening of the circuit back past its reset timeout."""
+    breaker.opened_at -= breaker.reset_timeout
+
+class FakeSession:
+    """requests.Session stand-in answering POSTs from a list of responses."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def post(self, url, headers=None, json=None, timeout=None, stream=False):
+        self.calls += 1
+        return self.responses.pop(0)
+
+def _client(session=None, async_client=None, **kwargs) -> ProviderClient:
+    return ProviderClient(
+        "test",
+        session=session or FakeSession([]),
+        async_client=async_client or httpx.AsyncClient(),
+        **kwargs
+    )
+
+# --- Circuit breaker ---
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60.0)
+    assert breaker.record_failure() is False
+    assert breaker.record_failure() is False
+    assert breaker.record_failure() is True
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_request()
+    assert excinfo.value.retryable
+    assert excinfo.value.retry_after > 0
+
+def test_breaker_half_open_trial_success_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    breaker.record_failure()
+    _expire(breaker)
+    assert breaker.state == "half-open"
+
+    assert breaker.before_request() is True
+    # Only one trial at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.before_request() is False
+
+def test_breaker_half_open_trial_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60.0)
+    for _ in range(3):
+        breaker.record_failure()
+    _expire(breaker)
+
+    assert breaker.before_request() is True
+    # A single failed trial reopens the circuit, below the threshold or not
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+def test_breaker_abort_trial_allows_another():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    breaker.record_failure()
+    _expire(breaker)
+
+    assert breaker.before_request() is True
+    breaker.abort_trial()
+    assert breaker.before_request() is True
+
+def test_cancelled_async_trial_is_aborted():
+    async def hang(request):
+        await asyncio.sleep(60)
+
+    async def run(client):
+        task = asyncio.ensure_future(client.apost("http://provider/x", {}, {}, timeout=60))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    client = _client(async_client=httpx.AsyncClient(transport=httpx.MockTransport(hang)), breaker_threshold=1)
+    client.breaker.record_failure()
+    _expire(client.breaker)
+
+    asyncio.run(run(client))
+
+    # The cancelled trial recorded no outcome; the next request must get to try
+    assert client.breaker.state == "half-open"
+    assert client.breaker.before_request() is True
+    assert client.limiter.in_flight == 0
+
+def test_sync_trial_success_closes_circuit():
+    session = FakeSession([_response(200, b'{"ok": true}')])
+    client = _client(session, breaker_threshold=1)
+    client.breaker.record_failure()
+    _expire(client.breaker)
+
+    assert client.post("http://provider/x", {}, {}, timeout=1) == {"ok": True}
+    assert client.breaker.state == "closed"
+
+# --- Adaptive limiter ---
+
+def test_limiter_halves_on_overload_once_per_interval():
+    limiter = AdaptiveLimiter(16, minimum=1, maximum=16, decrease_interval=60.0)
+    for _ in range(3):
+        limiter.acquire()
+    limiter.release(False)
+    assert limiter.limit == 8
+    # A burst of overload responses counts as one signal
+    limiter.release(False)
+    assert limiter.limit == 8
+
+    limiter.release(None)
+    assert limiter.limit == 8
+    assert limiter.in_flight == 0
+
+def test_limiter_respects_minimum():
+    limiter = AdaptiveLimiter(2, minimum=2, maximum=8, decrease_interval=0.0)
+    limiter.acquire()
+    limiter.release(False)
+    assert limiter.limit == 2
+
+def test_limiter_recovers_additively():
+    limiter = AdaptiveLimiter(16, minimum=1, maximum=16, decrease_interval=0.0)
+    limiter.acquire()
+    limiter.release(False)
+    assert limiter.limit == 8
+
+    # About +1 per round of `limit` successes
+    for _ in range(8):
+        limiter.acquire()
+        limiter.release(True)
+    assert 8.9 < limiter.limit < 9.1
+
+    for _ in range(200):
+        limiter.acquire()
+        limiter.release(True)
+    assert limiter.limit == 16
+
+def test_limiter_caps_concurrency():
+    limiter = AdaptiveLimiter(2, maximum=2)
+    assert limiter._try_acquire()
+    assert limiter._try_acquire()
+    assert not limiter._try_acquire()
+    limiter.release(None)
+    assert limiter._try_acquire()
+
+# --- Retry-After ---
+
+def test_retry_after_header():
+    assert provider_client._retry_after(_response(429, headers={"Retry-After": "7"})) == 7.0
+    assert provider_client._retry_after(_response(429, headers={"Retry-After": "soon"})) is None
+    assert provider_client._retry_after(_response(429)) is None
+
+def test_retry_after_estimated_time():
+    assert provider_client._retry_after(_response(503, b'{"estimated_time": 12.5}')) == 12.5
+    # Only a loading model (503) reports an estimate
+    assert provider_client._retry_after(_response(500, b'{"estimated_time": 12.5}')) is None
+    assert provider_client._retry_after(_response(503, b"not json")) is None
+
+def test_backoff_honours_retry_after(monkeypatch):
+    client = _client(backoff_base=0.5, backoff_max=30.0)
+    monkeypatch.setattr(provider_client.random, "uniform", lambda low, high: high)
+    assert client._backoff(0, None) == 0.5
+    assert client._backoff(3, None) == 4.0
+    assert client._backoff(10, None) == 30.0
+
+    assert client._backoff(0, 5.0) == 5.0
+    assert client._backoff(3, 1.0) == 4.0
+    # Never waits longer than backoff_max, whatever the server asks
+    assert client._backoff(0, 600.0) == 30.0
+
+def test_retries_wait_for_retry_after(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(provider_client.time, "sleep", sleeps.append)
+    monkeypatch.setattr(provider_client.random, "uniform", lambda low, high: 0.0)
+    session = FakeSession([
+        _response(429, headers={"Retry-After": "3"}),
+        _response(503, b'{"estimated_time": 2}'),
+        _response(200, b'{"ok": true}')
+    ])
+    client = _client(session, max_retries=4)
+
+    assert client.post("http://provider/x", {}, {}, timeout=1) == {"ok": True}
+    assert sleeps == [3.0, 2.0]
+    stats = client.get_stats()
+    assert stats["retries"] == 2
+    assert stats["failures"] == 0
+    assert stats["circuit"] == "closed"
+
+def test_non_retryable_error_is_raised_at_once(monkeypatch):
+    monkeypatch.setattr(provider_client.time, "sleep", lambda seconds: None)
+    session = FakeSession([_response(400, b'{"error": "bad input"}')])
+    client = _client(session, max_retries=4)
+
+    with pytest.raises(ProviderError) as excinfo:
+        client.post("http://provider/x", {}, {}, timeout=1)
+    assert excinfo.value.status_code == 400
+    assert not excinfo.value.retryable
+    assert session.calls == 1
+
+def test_retries_exhausted_raise_last_error(monkeypatch):
+    monkeypatch.setattr(provider_client.time, "sleep", lambda seconds: None)
+    session = FakeSession([_response(502) for _ in range(3)])
+    client = _client(session, max_retries=2, breaker_threshold=10)
+
+    with pytest.raises(ProviderError) as excinfo:
+        client.post("http://provider/x", {}, {}, timeout=1)
+    assert excinfo.value.status_code == 502
+    assert session.calls == 3
+    assert client.breaker.failures == 3
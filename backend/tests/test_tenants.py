@@ -0,0 +1,167 @@
+"""
+Tenant Manager tests
+Residency limits, leases and reopening of per-tenant knowledge bases
+"""
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from tenants import TenantManager, UnknownTenantError
+from vector_backends import CollectionNotFoundError
+
+class FakeVectorStore:
+    def __init__(self, name: str, memory_bytes: int, closed: list, close_gate: threading.Event):
+        self.name = name
+        self._memory_bytes = memory_bytes
+        self._closed = closed
+        self._close_gate = close_gate
+
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    def close(self):
+        self._close_gate.wait(5)
+        self._closed.append(self.name)
+
+class FakeRAG:
+    """Base CloudRAG stand-in whose views are collections held in memory."""
+
+    def __init__(self, memory_bytes: int = 0):
+        self.config = SimpleNamespace(COLLECTION_NAME="docs")
+        self.single_flight_timeout = 5.0
+        self.memory_bytes = memory_bytes
+        self.collections = set()
+        self.opened = []
+        self.closed = []
+        self.close_gate = threading.Event()
+        self.close_gate.set()
+
+    def for_collection(self, name: str, create: bool = False):
+        if name not in self.collections:
+            if not create:
+                raise CollectionNotFoundError(name)
+            self.collections.add(name)
+        self.opened.append(name)
+        vector_store = FakeVectorStore(name, self.memory_bytes, self.closed, self.close_gate)
+        return SimpleNamespace(vector_store=vector_store)
+
+def _touch(manager: TenantManager, *tenant_ids: str):
+    for tenant_id in tenant_ids:
+        with manager.lease(tenant_id, create=True):
+            pass
+
+def test_default_tenant_is_the_base_instance():
+    rag = FakeRAG()
+    manager = TenantManager(rag)
+    assert manager.acquire(None) is rag
+    assert manager.acquire("Default") is rag
+    assert rag.opened == []
+
+def test_unknown_tenant_read_raises():
+    rag = FakeRAG()
+    manager = TenantManager(rag)
+    with pytest.raises(UnknownTenantError):
+        manager.acquire("acme")
+    with pytest.raises(UnknownTenantError):
+        with manager.lease("acme"):
+            pass
+    assert manager.get_stats()["resident"] == 0
+
+    # A write creates the collection; reads work from then on
+    _touch(manager, "acme")
+    with manager.lease("acme") as view:
+        assert view.vector_store.name == "docs__acme"
+
+def test_malformed_tenant_rejected():
+    manager = TenantManager(FakeRAG())
+    with pytest.raises(ValueError):
+        manager.acquire("../etc")
+
+def test_evicts_least_recently_used_by_count():
+    rag = FakeRAG()
+    manager = TenantManager(rag, max_resident=2)
+    _touch(manager, "a", "b")
+    _touch(manager, "a")
+    _touch(manager, "c")
+
+    assert rag.closed == ["docs__b"]
+    assert list(manager._resident) == ["a", "c"]
+    assert manager.get_stats()["tenants"]["b"]["evictions"] == 1
+
+def test_evicts_by_memory_budget():
+    rag = FakeRAG(memory_bytes=100)
+    manager = TenantManager(rag, max_resident=10, memory_budget_bytes=250)
+    _touch(manager, "a", "b")
+    assert rag.closed == []
+
+    _touch(manager, "c")
+    assert rag.closed == ["docs__a"]
+    assert list(manager._resident) == ["b", "c"]
+
+def test_most_recent_tenant_kept_over_budget():
+    rag = FakeRAG(memory_bytes=1000)
+    manager = TenantManager(rag, memory_budget_bytes=10)
+    _touch(manager, "a", "b")
+    assert rag.closed == ["docs__a"]
+    assert list(manager._resident) == ["b"]
+
+def test_leased_tenants_are_never_evicted():
+    rag = FakeRAG()
+    manager = TenantManager(rag, max_resident=1)
+    manager.acquire("a", create=True)
+    manager.acquire("b", create=True)
+    _touch(manager, "c")
+
+    # Over the limit, but only idle tenants may be closed
+    assert rag.closed == []
+    assert list(manager._resident) == ["a", "b", "c"]
+
+    manager.release("a")
+    assert rag.closed == ["docs__a"]
+    manager.release("b")
+    assert rag.closed == ["docs__a", "docs__b"]
+    assert list(manager._resident) == ["c"]
+
+def test_reopen_waits_for_close_in_progress():
+    rag = FakeRAG()
+    manager = TenantManager(rag, max_resident=1)
+    _touch(manager, "a")
+
+    # Evicting "a" blocks in its close
+    rag.close_gate.clear()
+    evicting = threading.Thread(target=_touch, args=(manager, "b"), daemon=True)
+    evicting.start()
+    deadline = time.time() + 5
+    while "a" not in manager._closing and time.time() < deadline:
+        time.sleep(0.01)
+    assert "a" in manager._closing
+
+    reopened = []
+    reopening = threading.Thread(target=lambda: reopened.append(manager.acquire("a")), daemon=True)
+    reopening.start()
+    time.sleep(0.2)
+    # Never two instances of one collection open at once
+    assert reopened == []
+    assert rag.opened.count("docs__a") == 1
+
+    rag.close_gate.set()
+    evicting.join(5)
+    reopening.join(5)
+    assert rag.closed[0] == "docs__a"
+    assert len(reopened) == 1
+    assert rag.opened.count("docs__a") == 2
+    assert "a" in manager._resident
+    assert manager._closing == {}
+    manager.release("a")
+
+def test_concurrent_opens_share_one():
+    rag = FakeRAG()
+    rag.collections.add("docs__a")
+    manager = TenantManager(rag)
+    threads = [threading.Thread(target=_touch, args=(manager, "a")) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert rag.opened == ["docs__a"]
+    assert manager.get_stats()["tenants"]["a"]["requests"] == 8
@@ -0,0 +1,933 @@
+"""
+Vector Index Backends
+Storage engines behind VectorStore: ChromaDB or an in-process NumPy/HNSW index
+"""
+import json
+import os
+import sqlite3
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence
+
+# Rows of compressed vectors decoded per step when scoring; small enough
+# for the float32 scratch block to stay in CPU cache
+_SCORE_BLOCK_ROWS = 1024
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+# Filters matching at most this many chunks are searched by scoring just
+# those rows; wider ones scan (or over-fetch from HNSW) with a mask
+_PREFILTER_SUBSET_ROWS = 4096
+
+# Matching slots are remembered for this many recent filters, until the next write
+_FILTER_CACHE_SIZE = 32
+
+_SQL_COMPARISONS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+# Chroma clients by persist directory and memory limit; Chroma's client set-up
+# is not thread-safe, and every collection of a directory can share one client
+_chroma_clients: Dict[tuple, Any] = {}
+_chroma_clients_lock = threading.Lock()
+
+class CollectionNotFoundError(LookupError):
+    """Raised when opening a collection that does not exist without creating it."""
+
+class ChromaBackend:
+    """ChromaDB persistent collection."""
+
+    def __init__(
+        self,
+        collection_name: str,
+        persist_directory: str,
+        memory_limit_bytes: int = 0,
+        create: bool = True
+    ):
+        """
+        Open (or create) a Chroma collection.
+
+        Args:
+            collection_name: Name of the collection
+            persist_directory: Directory to persist data
+            memory_limit_bytes: Bound on the indexes Chroma keeps loaded,
+                evicting least recently used collections (0 for no bound)
+            create: Create the collection if it does not exist
+
+        Raises:
+            CollectionNotFoundError: If the collection does not exist and
+                create is False
+        """
+        self.client = self._get_client(persist_directory, memory_limit_bytes)
+        self.collection_name = collection_name
+        if not create and not self._collection_exists():
+            raise CollectionNotFoundError(f"Collection not found: {collection_name}")
+        self.collection = self._open_collection()
+
+    @staticmethod
+    def _get_client(persist_directory: str, memory_limit_bytes: int):
+        """Get the shared client of a persist directory, creating it on first use."""
+        key = (os.path.abspath(persist_directory), memory_limit_bytes)
+        with _chroma_clients_lock:
+            client = _chroma_clients.get(key)
+            if client is None:
+                # Chroma is slow to import, so only pay for it when it is selected
+                import chromadb
+                from chromadb.config import Settings
+
+                settings = Settings(anonymized_telemetry=False)
+                if memory_limit_bytes:
+                    settings = Settings(
+                        anonymized_telemetry=False,
+                        chroma_segment_cache_policy="LRU",
+                        chroma_memory_limit_bytes=memory_limit_bytes
+                    )
+                client = _chroma_clients[key] = chromadb.PersistentClient(path=persist_directory, settings=settings)
+            return client
+
+    def _collection_exists(self) -> bool:
+        """Whether the collection exists (list_collections gives names or collections, by version)."""
+        return self.collection_name in {
+            getattr(collection, "name", collection) for collection in self.client.list_collections()
+        }
+
+    def _open_collection(self):
+        """Get or create the collection with cosine distance."""
+        return self.client.get_or_create_collection(
+            name=self.collection_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def count(self) -> int:
+        """Get number of chunks in the collection."""
+        return self.collection.count()
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = (),
+        limit: Optional[int] = None,
+        offset: Optional[int] = None
+    ) -> Dict[str, list]:
+        """Fetch chunks by ID and/or metadata filter."""
+        return self.collection.get(ids=ids, where=where, include=list(include), limit=limit, offset=offset)
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """Insert or replace chunks."""
+        self.collection.upsert(
+            ids=ids,
+            embeddings=np.asarray(embeddings, dtype=np.float32),
+            documents=documents,
+            metadatas=metadatas
+        )
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Replace the metadata of stored chunks."""
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids: List[str]):
+        """Delete chunks by ID."""
+        self.collection.delete(ids=ids)
+
+    def query(self, embedding: np.ndarray, top_k: int, where: Optional[Dict[str, Any]] = None) -> Dict[str, list]:
+        """Return the top_k chunks by cosine distance, optionally among those matching a filter."""
+        return self.query_many(np.asarray(embedding)[None, :], top_k, where)[0]
+
+    def query_many(
+        self,
+        embeddings: np.ndarray,
+        top_k: int,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, list]]:
+        """Return the top_k chunks for each query row, in one collection query (pre-filtered by Chroma)."""
+        results = self.collection.query(
+            query_embeddings=np.asarray(embeddings, dtype=np.float32),
+            n_results=top_k,
+            where=where
+        )
+        return [
+            {
+                "ids": results["ids"][i] if results["ids"] else [],
+                "documents": results["documents"][i] if results["documents"] else [],
+                "metadatas": results["metadatas"][i] if results["metadatas"] else [],
+                "distances": results["distances"][i] if results["distances"] else []
+            }
+            for i in range(len(embeddings))
+        ]
+
+    def clear(self):
+        """Delete and recreate the collection."""
+        self.client.delete_collection(self.collection_name)
+        self.collection = self._open_collection()
+
+    def flush(self):
+        """Nothing to do; Chroma persists on every write."""
+
+    def close(self):
+        """Nothing to do; the client and its index cache are shared by all collections."""
+
+    def memory_bytes(self) -> int:
+        """Chroma's indexes live in its own cache (see memory_limit_bytes), so 0."""
+        return 0
+
+class LocalBackend:
+    """
+    In-process vector index.
+
+    Normalized float32 vectors live in a memory-mapped matrix, one row per
+    slot; IDs, documents and metadata live in SQLite. Queries run an exact
+    NumPy cosine top-k, switching to an HNSW graph (hnswlib) once the
+    collection reaches ``hnsw_min_items``.
+
+    With a compressed ``vector_dtype`` (float16, or int8 with a per-row
+    scale) queries scan the compact codes instead, then re-rank a shortlist
+    against the exact float32 rows. Only the codes and the shortlisted rows
+    are paged in, so the resident index shrinks 2x (float16) or ~4x (int8).
+    hnswlib keeps its own float32 copy of every vector in memory, so
+    compressed collections always use this exact scan and never build the
+    HNSW graph.
+
+    Metadata values are also kept in a (key, value) index, so a filtered
+    query looks up the matching slots first and, when few match, scores
+    only those rows.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        persist_directory: str,
+        hnsw_min_items: int = 50000,
+        hnsw_m: int = 16,
+        hnsw_ef_construction: int = 200,
+        hnsw_ef_search: int = 64,
+        vector_dtype: str = "float32",
+        rerank_factor: int = 4,
+        create: bool = True
+    ):
+        """
+        Open (or create) a local collection.
+
+        Args:
+            collection_name: Name of the collection
+            persist_directory: Directory to persist data
+            hnsw_min_items: Collection size from which HNSW is used (0 disables
+                it; ignored with a compressed vector_dtype)
+            hnsw_m: HNSW graph degree (higher is more accurate and larger)
+            hnsw_ef_construction: HNSW build-time candidate list size
+            hnsw_ef_search: HNSW query-time candidate list size
+            vector_dtype: Representation scanned by exact search: "float32",
+                "float16" or "int8"
+            rerank_factor: Shortlist size, as a multiple of top_k, re-ranked
+                with exact vectors when the scanned representation is compressed
+            create: Create the collection if it does not exist
+
+        Raises:
+            CollectionNotFoundError: If the collection does not exist and
+                create is False
+        """
+        if vector_dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {vector_dtype}")
+
+        self.directory = os.path.join(persist_directory, collection_name)
+        if not create and not os.path.exists(os.path.join(self.directory, "chunks.sqlite3")):
+            raise CollectionNotFoundError(f"Collection not found: {collection_name}")
+        os.makedirs(self.directory, exist_ok=True)
+
+        # An HNSW graph would hold full float32 vectors, undoing the compression
+        self.hnsw_min_items = hnsw_min_items if vector_dtype == "float32" else 0
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self.vector_dtype = vector_dtype
+        self.rerank_factor = max(1, rerank_factor)
+
+        self._lock = threading.RLock()
+        self._filter_slots: Dict[str, np.ndarray] = {}
+        self._conn = sqlite3.connect(
+            os.path.join(self.directory, "chunks.sqlite3"),
+            check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id TEXT PRIMARY KEY, slot INTEGER UNIQUE NOT NULL, "
+            "document TEXT, metadata TEXT, source TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+        # Secondary index: one row per scalar metadata value of each chunk
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_metadata ("
+            "slot INTEGER NOT NULL, key TEXT NOT NULL, value)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunk_metadata_key_value ON chunk_metadata (key, value)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunk_metadata_slot ON chunk_metadata (slot)")
+        self._conn.commit()
+        self._backfill_metadata_index()
+
+        self._vectors_path = os.path.join(self.directory, "vectors.npy")
+        self._hnsw_path = os.path.join(self.directory, "hnsw.bin")
+        self._hnsw_dirty_path = os.path.join(self.directory, "hnsw.dirty")
+        self._codes_path = os.path.join(self.directory, "codes.npy")
+        self._scales_path = os.path.join(self.directory, "scales.npy")
+        self._vectors: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        if os.path.exists(self._vectors_path):
+            self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+            if self.vector_dtype != "float32":
+                self._load_codes()
+
+        # Slots in use, and slots freed by deletes for reuse
+        self._live = np.zeros(len(self._vectors) if self._vectors is not None else 0, dtype=bool)
+        slots = [row[0] for row in self._conn.execute("SELECT slot FROM chunks")]
+        self._live[slots] = True
+        self._free_slots = sorted(set(range(len(self._live))) - set(slots), reverse=True)
+        # Slots past the high-water mark were never written; queries skip them
+        self._high_water = max(slots) + 1 if slots else 0
+
+        self._hnsw = None
+        self._hnsw_changes = 0
+
+    @property
+    def dim(self) -> Optional[int]:
+        """Vector dimension (None until the first write)."""
+        return self._vectors.shape[1] if self._vectors is not None else None
+
+    def count(self) -> int:
+        """Get number of chunks in the collection."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = (),
+        limit: Optional[int] = None,
+        offset: Optional[int] = None
+    ) -> Dict[str, list]:
+        """Fetch chunks by ID and/or metadata equality filter."""
+        clauses, params = self._where_sql(where)
+        if ids is not None:
+            if not ids:
+                return self._rows_to_result([], include)
+            clauses.append(f"id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+
+        sql = "SELECT id, document, metadata FROM chunks"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY slot"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit if limit is not None else -1, offset or 0])
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return self._rows_to_result(rows, include)
+
+    @staticmethod
+    def _where_sql(where: Optional[Dict[str, Any]]):
+        """
+        Translate a metadata filter into SQL clauses over the chunks table.
+
+        Each field condition becomes a lookup in the (key, value) index;
+        "$and" and "$or" combine them.
+
+        Returns:
+            Tuple of (clauses to AND together, parameters)
+        """
+        clauses, params = [], []
+        for key, condition in (where or {}).items():
+            if key in ("$and", "$or"):
+                parts = []
+                for operand in condition:
+                    operand_clauses, operand_params = LocalBackend._where_sql(operand)
+                    parts.append("(" + " AND ".join(operand_clauses) + ")")
+                    params.extend(operand_params)
+                clauses.append("(" + (" AND " if key == "$and" else " OR ").join(parts) + ")")
+                continue
+
+            operator, operand = next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+            if key == "source" and operator == "$eq":
+                clauses.append("source = ?")
+                params.append(operand)
+            elif operator in ("$in", "$nin"):
+                clauses.append(
+                    "slot IN (SELECT slot FROM chunk_metadata WHERE key = ? AND value "
+                    f"{'IN' if operator == '$in' else 'NOT IN'} ({','.join('?' * len(operand))}))"
+                )
+                params.append(key)
+                params.extend(operand)
+            else:
+                clauses.append(f"slot IN (SELECT slot FROM chunk_metadata WHERE key = ? AND value {_SQL_COMPARISONS[operator]} ?)")
+                params.extend([key, operand])
+        return clauses, params
+
+    @staticmethod
+    def _metadata_rows(slot: int, metadata: Dict[str, Any]) -> List[tuple]:
+        """Secondary index rows of one chunk."""
+        return [
+            (slot, key, value)
+            for key, value in metadata.items()
+            if isinstance(value, (str, int, float, bool))
+        ]
+
+    def _index_metadata(self, slots: List[int], metadatas: List[Dict[str, Any]]):
+        """Replace the secondary index rows of chunks (caller holds the lock and commits)."""
+        self._conn.execute(f"DELETE FROM chunk_metadata WHERE slot IN ({','.join('?' * len(slots))})", slots)
+        self._conn.executemany(
+            "INSERT INTO chunk_metadata (slot, key, value) VALUES (?, ?, ?)",
+            [row for slot, metadata in zip(slots, metadatas) for row in self._metadata_rows(slot, metadata)]
+        )
+
+    def _backfill_metadata_index(self):
+        """Build the secondary index for collections written before it existed."""
+        if self._conn.execute("SELECT 1 FROM chunk_metadata LIMIT 1").fetchone():
+            return
+        if not self._conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone():
+            return
+
+        print("🔄 Building metadata index...")
+        rows = self._conn.execute("SELECT slot, metadata FROM chunks").fetchall()
+        self._conn.executemany(
+            "INSERT INTO chunk_metadata (slot, key, value) VALUES (?, ?, ?)",
+            [row for slot, metadata in rows for row in self._metadata_rows(slot, json.loads(metadata))]
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _rows_to_result(rows, include: Sequence[str]) -> Dict[str, list]:
+        """Shape SQLite rows like a Chroma get() result."""
+        result = {"ids": [row[0] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [row[1] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(row[2]) for row in rows]
+        return result
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """Insert or replace chunks."""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        with self._lock:
+            existing = dict(self._conn.execute(
+                f"SELECT id, slot FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall())
+            self._before_write()
+            slots = [existing[chunk_id] if chunk_id in existing else self._allocate_slot(vectors.shape[1])
+                     for chunk_id in ids]
+
+            self._vectors[slots] = vectors
+            self._vectors.flush()
+            if self._codes is not None:
+                codes, scales = self._encode(vectors)
+                self._codes[slots] = codes
+                self._codes.flush()
+                if scales is not None:
+                    self._scales[slots] = scales
+                    self._scales.flush()
+            self._live[slots] = True
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, slot, document, metadata, source) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (chunk_id, slot, document, json.dumps(metadata), metadata.get("source"))
+                    for chunk_id, slot, document, metadata in zip(ids, slots, documents, metadatas)
+                ]
+            )
+            self._index_metadata(slots, metadatas)
+            self._conn.commit()
+
+            if self._hnsw is not None:
+                self._hnsw_add(np.asarray(slots), vectors)
+
+    def _allocate_slot(self, dim: int) -> int:
+        """Take a free slot, growing the matrix if needed (caller holds the lock)."""
+        if self._vectors is None:
+            self._vectors = np.lib.format.open_memmap(
+                self._vectors_path, mode="w+", dtype=np.float32, shape=(1024, dim)
+            )
+            if self.vector_dtype != "float32":
+                self._create_codes(1024, dim)
+            self._live = np.zeros(1024, dtype=bool)
+            self._free_slots = list(range(1023, -1, -1))
+        elif dim != self._vectors.shape[1]:
+            raise ValueError(f"Embedding dimension {dim} does not match collection dimension {self._vectors.shape[1]}")
+
+        if not self._free_slots:
+            self._grow()
+        slot = self._free_slots.pop()
+        self._high_water = max(self._high_water, slot + 1)
+        return slot
+
+    def _grow(self):
+        """Double the matrix capacity (caller holds the lock)."""
+        capacity = len(self._vectors)
+        self._vectors = self._grow_file(self._vectors_path, self._vectors)
+        if self._codes is not None:
+            self._codes = self._grow_file(self._codes_path, self._codes)
+        if self._scales is not None:
+            self._scales = self._grow_file(self._scales_path, self._scales)
+
+        self._live = np.concatenate([self._live, np.zeros(capacity, dtype=bool)])
+        self._free_slots = list(range(capacity * 2 - 1, capacity - 1, -1))
+
+        if self._hnsw is not None:
+            self._hnsw.resize_index(capacity * 2)
+
+    @staticmethod
+    def _grow_file(path: str, array: np.ndarray) -> np.ndarray:
+        """Copy a memory-mapped array into a file with twice the rows."""
+        tmp_path = f"{path}.tmp"
+        grown = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=array.dtype, shape=(len(array) * 2,) + array.shape[1:]
+        )
+        grown[:len(array)] = array
+        grown.flush()
+        del grown, array
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode="r+")
+
+    def _encode(self, vectors: np.ndarray):
+        """Compress unit vectors to the scanned representation; returns (codes, scales)."""
+        if self.vector_dtype == "float16":
+            return vectors.astype(np.float16), None
+
+        # Symmetric int8 with one scale per row
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _create_codes(self, capacity: int, dim: int):
+        """Create empty code (and scale) files (caller holds the lock)."""
+        self._codes = np.lib.format.open_memmap(
+            self._codes_path, mode="w+", dtype=np.dtype(self.vector_dtype), shape=(capacity, dim)
+        )
+        self._scales = None
+        if self.vector_dtype == "int8":
+            self._scales = np.lib.format.open_memmap(
+                self._scales_path, mode="w+", dtype=np.float32, shape=(capacity,)
+            )
+
+    def _load_codes(self):
+        """Open the compressed vectors, re-encoding them if missing or of another dtype."""
+        if os.path.exists(self._codes_path):
+            codes = np.load(self._codes_path, mmap_mode="r+")
+            if codes.dtype == np.dtype(self.vector_dtype) and codes.shape == self._vectors.shape and (
+                self.vector_dtype != "int8" or os.path.exists(self._scales_path)
+            ):
+                self._codes = codes
+                if self.vector_dtype == "int8":
+                    self._scales = np.load(self._scales_path, mmap_mode="r+")
+                return
+            del codes
+
+        print(f"🔄 Encoding vectors as {self.vector_dtype}...")
+        self._create_codes(*self._vectors.shape)
+        for start in range(0, len(self._vectors), _SCORE_BLOCK_ROWS):
+            end = start + _SCORE_BLOCK_ROWS
+            codes, scales = self._encode(np.asarray(self._vectors[start:end]))
+            self._codes[start:end] = codes
+            if scales is not None:
+                self._scales[start:end] = scales
+        self._codes.flush()
+        if self._scales is not None:
+            self._scales.flush()
+
+    @staticmethod
+    def _top_k_columns(scores: np.ndarray, rows: Optional[np.ndarray], top_k: int):
+        """Best top_k rows of each score column; returns [(slots, distances)]."""
+        results = []
+        for column in range(scores.shape[1]):
+            column_scores = scores[:, column]
+            best = np.argpartition(-column_scores, top_k - 1)[:top_k]
+            best = best[np.argsort(-column_scores[best])]
+            results.append((rows[best] if rows is not None else best, 1.0 - column_scores[best]))
+        return results
+
+    def _exact_top_k(self, queries: np.ndarray, top_k: int, allowed: Optional[np.ndarray] = None):
+        """
+        Brute-force top_k over live slots for each query row (caller holds the lock).
+
+        Args:
+            queries: Normalized query rows
+            top_k: Results per query (at most the number of candidate slots)
+            allowed: Sorted slots matching a filter (None for all live slots)
+
+        Returns:
+            List of (slots, distances) per query
+        """
+        if allowed is not None and len(allowed) <= _PREFILTER_SUBSET_ROWS:
+            # Narrow filter: score the matching rows only
+            return self._top_k_columns(self._vectors[allowed] @ queries.T, allowed, top_k)
+
+        live = self._live[:self._high_water]
+        if allowed is not None:
+            live = np.zeros(self._high_water, dtype=bool)
+            live[allowed] = True
+
+        if self._codes is None:
+            slots, scores = self._blockwise_top_k(queries, top_k, live)
+            results = []
+            for row_slots, row_scores in zip(slots, scores):
+                order = np.argsort(-row_scores)
+                results.append((row_slots[order], 1.0 - row_scores[order]))
+            return results
+
+        # Shortlist by approximate scores from the compact codes, then
+        # re-rank each shortlist with exact vectors
+        shortlist_size = min(top_k * self.rerank_factor, int(live.sum()))
+        shortlists, _ = self._blockwise_top_k(queries, shortlist_size, live, decode=True)
+        results = []
+        for shortlist, query in zip(shortlists, queries):
+            shortlist.sort()
+            exact = self._vectors[shortlist] @ query
+            best = np.argsort(-exact)[:top_k]
+            results.append((shortlist[best], 1.0 - exact[best]))
+        return results
+
+    def _blockwise_top_k(self, queries: np.ndarray, keep: int, live: np.ndarray, decode: bool = False):
+        """
+        Best ``keep`` live slots per query, scoring _SCORE_BLOCK_ROWS rows at
+        a time so memory is bounded by the block rather than the collection
+        (caller holds the lock).
+
+        Args:
+            queries: Normalized query rows
+            keep: Slots kept per query (at most the number of live slots)
+            live: Mask of candidate slots below the high-water mark
+            decode: Score the compact codes instead of the float32 vectors
+
+        Returns:
+            Tuple of (slots, scores) arrays, one unordered row per query
+        """
+        best_slots = np.full((len(queries), keep), -1, dtype=np.int64)
+        best_scores = np.full((len(queries), keep), -np.inf, dtype=np.float32)
+        block = np.empty((_SCORE_BLOCK_ROWS, queries.shape[1]), dtype=np.float32) if decode else None
+        for start in range(0, self._high_water, _SCORE_BLOCK_ROWS):
+            end = min(start + _SCORE_BLOCK_ROWS, self._high_water)
+            block_live = live[start:end]
+            if not block_live.any():
+                continue
+            if decode:
+                np.copyto(block[:end - start], self._codes[start:end])
+                scores = queries @ block[:end - start].T
+                if self._scales is not None:
+                    scores *= self._scales[start:end]
+            else:
+                scores = queries @ self._vectors[start:end].T
+            scores[:, ~block_live] = -np.inf
+
+            # Merge the block into each query's running top ``keep``
+            candidate_scores = np.concatenate([best_scores, scores], axis=1)
+            candidate_slots = np.concatenate(
+                [best_slots, np.broadcast_to(np.arange(start, end), scores.shape)], axis=1
+            )
+            top = np.argpartition(-candidate_scores, keep - 1, axis=1)[:, :keep]
+            best_scores = np.take_along_axis(candidate_scores, top, axis=1)
+            best_slots = np.take_along_axis(candidate_slots, top, axis=1)
+        return best_slots, best_scores
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Replace the metadata of stored chunks."""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE chunks SET metadata = ?, source = ? WHERE id = ?",
+                [(json.dumps(metadata), metadata.get("source"), chunk_id)
+                 for chunk_id, metadata in zip(ids, metadatas)]
+            )
+            slots = dict(self._conn.execute(
+                f"SELECT id, slot FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall())
+            present = [(slots[chunk_id], metadata) for chunk_id, metadata in zip(ids, metadatas) if chunk_id in slots]
+            if present:
+                self._index_metadata([slot for slot, _ in present], [metadata for _, metadata in present])
+            self._conn.commit()
+            self._filter_slots.clear()
+
+    def delete(self, ids: List[str]):
+        """Delete chunks by ID."""
+        with self._lock:
+            placeholders = ','.join('?' * len(ids))
+            slots = [row[0] for row in self._conn.execute(
+                f"SELECT slot FROM chunks WHERE id IN ({placeholders})", ids
+            )]
+            self._conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", ids)
+            if slots:
+                self._conn.execute(f"DELETE FROM chunk_metadata WHERE slot IN ({','.join('?' * len(slots))})", slots)
+            self._conn.commit()
+
+            self._before_write()
+            self._live[slots] = False
+            self._free_slots.extend(slots)
+            if self._hnsw is not None:
+                for slot in slots:
+                    self._hnsw.mark_deleted(slot)
+                self._hnsw_changes += len(slots)
+                self._maybe_save_hnsw()
+
+    def query(self, embedding: np.ndarray, top_k: int, where: Optional[Dict[str, Any]] = None) -> Dict[str, list]:
+        """Return the top_k chunks by cosine distance, optionally among those matching a filter."""
+        return self.query_many(np.asarray(embedding)[None, :], top_k, where)[0]
+
+    def query_many(
+        self,
+        embeddings: np.ndarray,
+        top_k: int,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, list]]:
+        """
+        Return the top_k chunks for each query row, scoring all queries in one pass.
+
+        With a filter, the matching slots are looked up in the metadata
+        index first and the search is restricted to them, so up to top_k
+        matching chunks come back however selective the filter is.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            num_live = int(self._live.sum()) if self._vectors is not None else 0
+            allowed = None
+            if num_live and where:
+                allowed = self._matching_slots(where)
+                num_live = len(allowed)
+            if num_live == 0:
+                return [{"ids": [], "documents": [], "metadatas": [], "distances": []} for _ in queries]
+            top_k = min(top_k, num_live)
+
+            use_hnsw = (
+                self.hnsw_min_items
+                and int(self._live.sum()) >= self.hnsw_min_items
+                and (allowed is None or len(allowed) > _PREFILTER_SUBSET_ROWS)
+                and self._ensure_hnsw()
+            )
+            if use_hnsw and allowed is None:
+                labels, distances = self._hnsw.knn_query(queries, k=top_k)
+                matches = list(zip(labels, distances))
+            elif use_hnsw:
+                matches = self._filtered_hnsw_top_k(queries, top_k, allowed)
+            else:
+                matches = self._exact_top_k(queries, top_k, allowed)
+
+            wanted = sorted({int(slot) for slots, _ in matches for slot in slots})
+            rows = {
+                row[0]: row[1:]
+                for row in self._conn.execute(
+                    f"SELECT slot, id, document, metadata FROM chunks WHERE slot IN ({','.join('?' * len(wanted))})",
+                    wanted
+                )
+            }
+
+        results = []
+        for slots, distances in matches:
+            result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            for slot, distance in zip(slots, distances):
+                row = rows.get(int(slot))
+                if row is None:
+                    continue
+                result["ids"].append(row[0])
+                result["documents"].append(row[1])
+                result["metadatas"].append(json.loads(row[2]))
+                result["distances"].append(float(distance))
+            results.append(result)
+        return results
+
+    def _matching_slots(self, where: Dict[str, Any]) -> np.ndarray:
+        """Sorted slots of the chunks matching a filter (caller holds the lock)."""
+        key = json.dumps(where, sort_keys=True)
+        allowed = self._filter_slots.pop(key, None)
+        if allowed is None:
+            clauses, params = self._where_sql(where)
+            allowed = np.array(
+                [row[0] for row in self._conn.execute(
+                    f"SELECT slot FROM chunks WHERE {' AND '.join(clauses)} ORDER BY slot", params
+                )],
+                dtype=np.int64
+            )
+            if len(self._filter_slots) >= _FILTER_CACHE_SIZE:
+                del self._filter_slots[next(iter(self._filter_slots))]
+        # Re-inserting keeps the dict in least-recently-used order
+        self._filter_slots[key] = allowed
+        return allowed
+
+    def _filtered_hnsw_top_k(self, queries: np.ndarray, top_k: int, allowed: np.ndarray):
+        """
+        HNSW search restricted to a wide filter (caller holds the lock).
+
+        Over-fetches in proportion to the filter's selectivity and drops
+        non-matching neighbours; queries still short of top_k fall back to
+        a masked exact scan.
+        """
+        num_live = int(self._live.sum())
+        fetch = min(num_live, max(top_k * 2, int(np.ceil(top_k * num_live / len(allowed) * 2))))
+        labels, distances = self._hnsw.knn_query(queries, k=fetch)
+
+        matches = []
+        short = []
+        for row, (row_labels, row_distances) in enumerate(zip(labels, distances)):
+            keep = np.isin(row_labels, allowed)
+            if keep.sum() < top_k:
+                short.append(row)
+            matches.append((row_labels[keep][:top_k], row_distances[keep][:top_k]))
+
+        if short:
+            for row, match in zip(short, self._exact_top_k(queries[short], top_k, allowed)):
+                matches[row] = match
+        return matches
+
+    def _ensure_hnsw(self) -> bool:
+        """Load or build the HNSW graph (caller holds the lock); False if hnswlib is missing."""
+        if self._hnsw is not None:
+            return True
+
+        try:
+            import hnswlib
+        except ImportError:
+            print("⚠️  hnswlib not installed, using exact search. Install with: pip install hnswlib")
+            self.hnsw_min_items = 0
+            return False
+
+        capacity, dim = self._vectors.shape
+        index = hnswlib.Index(space="ip", dim=dim)
+
+        # A leftover dirty marker means changes were made after the last save
+        if os.path.exists(self._hnsw_path) and not os.path.exists(self._hnsw_dirty_path):
+            index.load_index(self._hnsw_path, max_elements=capacity)
+        else:
+            live_slots = np.flatnonzero(self._live)
+            print(f"🔄 Building HNSW index over {len(live_slots)} vectors...")
+            index.init_index(max_elements=capacity, M=self.hnsw_m, ef_construction=self.hnsw_ef_construction)
+            if len(live_slots):
+                index.add_items(self._vectors[live_slots], live_slots)
+
+        index.set_ef(self.hnsw_ef_search)
+        self._hnsw = index
+        self._save_hnsw()
+        return True
+
+    def _before_write(self):
+        """Keep a persisted HNSW graph in step with a write (caller holds the lock)."""
+        self._filter_slots.clear()
+        if self._hnsw is None and os.path.exists(self._hnsw_path) and self._vectors is not None:
+            if self.hnsw_min_items:
+                self._ensure_hnsw()
+            elif not os.path.exists(self._hnsw_dirty_path):
+                # Not maintained while unused (e.g. with compressed vectors);
+                # rebuilt if HNSW is used again
+                open(self._hnsw_dirty_path, 'w').close()
+        if self._hnsw is not None and not os.path.exists(self._hnsw_dirty_path):
+            open(self._hnsw_dirty_path, 'w').close()
+
+    def _hnsw_add(self, slots: np.ndarray, vectors: np.ndarray):
+        """Add or replace vectors in the HNSW graph (caller holds the lock)."""
+        for slot in slots:
+            # Re-adding a deleted label must first undo the delete
+            try:
+                self._hnsw.unmark_deleted(int(slot))
+            except RuntimeError:
+                pass
+        self._hnsw.add_items(vectors, slots)
+        self._hnsw_changes += len(slots)
+        self._maybe_save_hnsw()
+
+    def _maybe_save_hnsw(self):
+        """Persist the graph once enough changes accumulated (caller holds the lock)."""
+        if self._hnsw_changes > max(1000, self._hnsw.get_current_count() // 100):
+            self._save_hnsw()
+
+    def _save_hnsw(self):
+        """Write the graph to disk and clear the dirty marker."""
+        self._hnsw.save_index(self._hnsw_path)
+        if os.path.exists(self._hnsw_dirty_path):
+            os.remove(self._hnsw_dirty_path)
+        self._hnsw_changes = 0
+
+    def flush(self):
+        """Persist pending HNSW changes (vectors and rows are written through)."""
+        with self._lock:
+            if self._hnsw is not None and self._hnsw_changes:
+                self._save_hnsw()
+
+    def close(self):
+        """Flush, then release the index arrays and the database connection."""
+        with self._lock:
+            self.flush()
+            self._conn.close()
+            self._vectors = None
+            self._codes = None
+            self._scales = None
+            self._hnsw = None
+            self._filter_slots.clear()
+
+    def memory_bytes(self) -> int:
+        """Approximate memory of the scanned vector rows and the HNSW graph."""
+        with self._lock:
+            # Mapped capacity past the high-water mark is never paged in, nor
+            # are float32 rows beyond re-ranked shortlists when codes are scanned
+            scanned = (self._codes, self._scales) if self._codes is not None else (self._vectors,)
+            total = sum(
+                array[:self._high_water].nbytes
+                for array in scanned
+                if array is not None
+            )
+            if self._hnsw is not None:
+                # Vector plus level-0 links of every element
+                total += self._hnsw.get_max_elements() * (self._hnsw.dim * 4 + self.hnsw_m * 2 * 4 + 16)
+            return total
+
+    def clear(self):
+        """Delete every chunk and the index files."""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM chunk_metadata")
+            self._conn.commit()
+            self._filter_slots.clear()
+            self._vectors = None
+            self._codes = None
+            self._scales = None
+            self._live = np.zeros(0, dtype=bool)
+            self._free_slots = []
+            self._high_water = 0
+            self._hnsw = None
+            self._hnsw_changes = 0
+            for path in (self._vectors_path, self._codes_path, self._scales_path,
+                         self._hnsw_path, self._hnsw_dirty_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+def create_vector_backend(kind: str, collection_name: str, persist_directory: str, **options):
+    """
+    Create a vector index backend.
+
+    Args:
+        kind: "chroma" or "local"
+        collection_name: Name of the collection
+        persist_directory: Directory to persist data
+        **options: Backend-specific options (HNSW parameters for "local",
+            memory_limit_bytes for "chroma", and create for both)
+
+    Returns:
+        Backend instance
+    """
+    if kind == "chroma":
+        return ChromaBackend(collection_name, persist_directory, **options)
+    if kind == "local":
+        return LocalBackend(collection_name, persist_directory, **options)
+    raise ValueError(f"Unknown vector backend: {kind}")
@@ -1,112 +1,394 @@
 """
-ChromaDB Vector Store
+Vector Store
 Stores and retrieves document embeddings
 """
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Any
+import hashlib
+import os
+import numpy as np
+from typing import List, Dict, Any, Optional, Set, Tuple
+from lexical_index import BM25Index
+from vector_backends import ChromaBackend
+
+# Filters matching at most this many chunks restrict BM25 scoring up
+# front; wider ones over-fetch BM25 hits and drop those that don't match
+_LEXICAL_PREFILTER_MAX_IDS = 10000
 
 class VectorStore:
-    """ChromaDB vector store for document retrieval."""
+    """Vector store for document retrieval over a pluggable index backend."""
     
     def __init__(
         self,
         collection_name: str,
         persist_directory: str,
-        embedding_function
+        embedding_function,
+        backend=None,
+        hybrid_search: bool = True,
+        dense_weight: float = 1.0,
+        lexical_weight: float = 1.0,
+        rrf_k: int = 60,
+        hybrid_candidates: int = 20
     ):
         """
-        Initialize ChromaDB vector store.
+        Initialize the vector store.
         
         Args:
             collection_name: Name of the collection
             persist_directory: Directory to persist data
             embedding_function: Function to generate embeddings
+            backend: Vector index backend (a Chroma collection if None)
+            hybrid_search: Fuse BM25 lexical results with vector results
+            dense_weight: Weight of the vector ranking in the fusion
+            lexical_weight: Weight of the BM25 ranking in the fusion
+            rrf_k: Reciprocal-rank fusion constant (higher flattens ranks)
+            hybrid_candidates: Candidates taken from each ranking before fusion
         """
-        self.client = chromadb.PersistentClient(
-            path=persist_directory,
-            settings=Settings(anonymized_telemetry=False)
-        )
-        
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            metadata={"hnsw:space": "cosine"}
-        )
+        self.backend = backend or ChromaBackend(collection_name, persist_directory)
         
         self.embedding_function = embedding_function
         
+        self.dense_weight = dense_weight
+        self.lexical_weight = lexical_weight
+        self.rrf_k = rrf_k
+        self.hybrid_candidates = hybrid_candidates
+        
+        # BM25 index kept alongside the collection for exact-term matches
+        self.lexical_index = None
+        if hybrid_search:
+            self.lexical_index = BM25Index(os.path.join(persist_directory, f"{collection_name}.bm25"))
+            self._sync_lexical_index()
+        
         print(f"✅ Vector store initialized: {collection_name}")
-        print(f"   Documents: {self.collection.count()}")
+        print(f"   Documents: {self.backend.count()}")
+    
+    def _sync_lexical_index(self):
+        """Rebuild the lexical index if it is out of step with the collection."""
+        if len(self.lexical_index) == self.backend.count():
+            return
+        
+        print("🔄 Rebuilding lexical index...")
+        self.lexical_index.clear()
+        offset = 0
+        while True:
+            page = self.backend.get(include=["documents"], limit=5000, offset=offset)
+            if not page["ids"]:
+                break
+            self.lexical_index.add(page["ids"], page["documents"])
+            offset += len(page["ids"])
+        print(f"✅ Lexical index rebuilt: {len(self.lexical_index)} chunks")
+    
+    @staticmethod
+    def make_chunk_id(source: str, content: str) -> str:
+        """
+        Build the stable ID of a chunk from its source and content.
+        
+        Re-ingesting an unchanged chunk yields the same ID, so writes are
+        idempotent and a document can be diffed against what is stored.
+        """
+        source_hash = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+        return f"{source_hash}-{content_hash}"
+    
+    def chunk_ids(self, texts: List[str], metadatas: List[Dict[str, Any]]) -> List[str]:
+        """Get the stable IDs of a batch of chunks."""
+        return [
+            self.make_chunk_id(str(metadata.get("source", "")), text)
+            for text, metadata in zip(texts, metadatas)
+        ]
+    
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        """Get the subset of IDs already stored in the collection."""
+        if not ids:
+            return set()
+        return set(self.backend.get(ids=list(ids))["ids"])
     
-    def add_documents(self, texts: List[str], metadatas: List[Dict[str, Any]]):
+    def new_chunk_positions(self, texts: List[str], metadatas: List[Dict[str, Any]]) -> List[int]:
+        """Get the positions of chunks in a batch that are not stored yet."""
+        ids = self.chunk_ids(texts, metadatas)
+        present = self.existing_ids(ids)
+        return [i for i, chunk_id in enumerate(ids) if chunk_id not in present]
+    
+    def get_source_ids(self, source: str) -> Set[str]:
+        """Get the IDs of every stored chunk of a source document."""
+        return set(self.backend.get(where={"source": source})["ids"])
+    
+    def add_documents(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: Optional[List[Optional[np.ndarray]]] = None
+    ) -> List[str]:
         """
-        Add documents to the vector store.
+        Add documents to the vector store (upsert by stable chunk ID).
+        
+        Chunks already stored only have their metadata refreshed; only new
+        chunks are embedded and written.
         
         Args:
             texts: List of document texts
             metadatas: List of metadata dictionaries
+            embeddings: Precomputed embeddings; entries may be None for
+                chunks that are already stored (computed if None)
+            
+        Returns:
+            Chunk IDs of the batch, in order
+        """
+        return self.upsert_documents(texts, metadatas, embeddings)[0]
+    
+    def upsert_documents(
+        self,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        embeddings: Optional[List[Optional[np.ndarray]]] = None
+    ) -> Tuple[List[str], int]:
+        """
+        Add documents like ``add_documents``, also reporting how many were new.
+        
+        Returns:
+            Tuple of (chunk IDs of the batch in order, number of chunks
+            written; 0 if every chunk was already stored)
         """
         if not texts:
-            return
+            return [], 0
         
-        # Generate embeddings
-        embeddings = self.embedding_function.embed_documents(texts)
+        ids = self.chunk_ids(texts, metadatas)
         
-        # Generate IDs
-        current_count = self.collection.count()
-        ids = [f"doc_{current_count + i}" for i in range(len(texts))]
+        # Identical chunks within a source collapse to one entry
+        positions: Dict[str, int] = {}
+        for i, chunk_id in enumerate(ids):
+            positions.setdefault(chunk_id, i)
         
-        # Add to collection
-        self.collection.add(
-            embeddings=embeddings,
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
+        present = self.existing_ids(list(positions))
+        new = [i for chunk_id, i in positions.items() if chunk_id not in present]
+        unchanged = [i for chunk_id, i in positions.items() if chunk_id in present]
+        
+        if unchanged:
+            self.backend.update_metadata(
+                ids=[ids[i] for i in unchanged],
+                metadatas=[metadatas[i] for i in unchanged]
+            )
         
-        print(f"✅ Added {len(texts)} documents to vector store")
+        if new:
+            new_embeddings = [embeddings[i] for i in new] if embeddings is not None else [None] * len(new)
+            missing = [j for j, embedding in enumerate(new_embeddings) if embedding is None]
+            if missing:
+                computed = self.embedding_function.embed_documents([texts[new[j]] for j in missing])
+                for j, embedding in zip(missing, computed):
+                    new_embeddings[j] = embedding
+            
+            self.backend.upsert(
+                ids=[ids[i] for i in new],
+                embeddings=np.stack(new_embeddings),
+                documents=[texts[i] for i in new],
+                metadatas=[metadatas[i] for i in new]
+            )
+            
+            if self.lexical_index is not None:
+                self.lexical_index.add([ids[i] for i in new], [texts[i] for i in new])
+        
+        print(f"✅ Upserted {len(texts)} chunks ({len(new)} new, {len(unchanged)} unchanged)")
+        
+        return ids, len(new)
     
-    def search(self, query: str, top_k: int = 4) -> List[Dict[str, Any]]:
+    def delete_ids(self, ids: List[str]):
+        """Delete chunks by ID."""
+        ids = list(ids)
+        for start in range(0, len(ids), 5000):
+            self.backend.delete(ids[start:start + 5000])
+        
+        if self.lexical_index is not None:
+            self.lexical_index.remove(ids)
+    
+    def search(
+        self,
+        query: str,
+        top_k: int = 4,
+        query_embedding: Optional[np.ndarray] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Search for relevant documents.
         
+        With hybrid search enabled, the vector and BM25 rankings are merged
+        by weighted reciprocal-rank fusion, so chunks containing exact
+        identifiers or error codes surface even when their embeddings don't.
+        
         Args:
             query: Search query
             top_k: Number of results to return
+            query_embedding: Precomputed query embedding (computed if None)
+            where: Metadata filter (see ``metadata_filter.normalize_filter``);
+                only matching chunks are searched
             
         Returns:
             List of relevant documents with metadata
         """
         # Generate query embedding
-        query_embedding = self.embedding_function.embed_query(query)
+        if query_embedding is None:
+            query_embedding = self.embedding_function.embed_query(query)
         
-        # Search
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
+        return self.search_many([query], top_k, np.asarray(query_embedding)[None, :], where)[0]
+    
+    def search_many(
+        self,
+        queries: List[str],
+        top_k: int,
+        query_embeddings: np.ndarray,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several queries at once.
+        
+        The vector search for all queries runs as a single backend call.
+        
+        Args:
+            queries: Search queries
+            top_k: Number of results to return per query
+            query_embeddings: Query embedding matrix, one row per query
+            where: Metadata filter applied to every query
+            
+        Returns:
+            One result list (as returned by ``search``) per query
+        """
+        if not queries:
+            return []
+        
+        hybrid = self.lexical_index is not None and len(self.lexical_index) > 0
+        
+        # Search (the backend applies the filter before ranking)
+        results = self.backend.query_many(
+            query_embeddings,
+            max(top_k, self.hybrid_candidates) if hybrid else top_k,
+            where
         )
         
-        # Format results
-        documents = []
-        if results["documents"] and len(results["documents"]) > 0:
-            for i, doc in enumerate(results["documents"][0]):
+        allowed_ids = self._filter_ids(where) if hybrid and where else None
+        
+        all_documents = []
+        for query, result in zip(queries, results):
+            # Format results
+            documents = []
+            for i, doc in enumerate(result["documents"]):
                 documents.append({
+                    "id": result["ids"][i],
                     "content": doc,
-                    "metadata": results["metadatas"][0][i] if results["metadatas"] else {},
-                    "distance": results["distances"][0][i] if results["distances"] else 0.0
+                    "metadata": result["metadatas"][i] or {},
+                    "distance": result["distances"][i] if result["distances"] else 0.0
                 })
+            
+            if hybrid:
+                lexical_hits = self._lexical_search(query, max(top_k, self.hybrid_candidates), where, allowed_ids)
+                documents = self._fuse(documents, lexical_hits, top_k)
+            
+            all_documents.append(documents)
+        
+        return all_documents
+    
+    def _filter_ids(self, where: Dict[str, Any]) -> Optional[Set[str]]:
+        """IDs of the chunks matching a filter, or None if there are too many to list."""
+        found = self.backend.get(where=where, limit=_LEXICAL_PREFILTER_MAX_IDS + 1)["ids"]
+        return set(found) if len(found) <= _LEXICAL_PREFILTER_MAX_IDS else None
+    
+    def _lexical_search(
+        self,
+        query: str,
+        top_k: int,
+        where: Optional[Dict[str, Any]],
+        allowed_ids: Optional[Set[str]]
+    ) -> List[tuple]:
+        """
+        BM25 search restricted to the chunks matching a filter.
+        
+        Narrow filters pass their matching IDs to the index. For wide ones,
+        hits are over-fetched and checked against the filter, fetching more
+        until top_k match or the index runs out of hits.
+        """
+        if where is None or allowed_ids is not None:
+            return self.lexical_index.search(query, top_k=top_k, allowed_ids=allowed_ids)
         
-        return documents
+        fetch = top_k * 4
+        while True:
+            hits = self.lexical_index.search(query, top_k=fetch)
+            if not hits:
+                return []
+            matching = set(self.backend.get(ids=[chunk_id for chunk_id, _ in hits], where=where)["ids"])
+            kept = [hit for hit in hits if hit[0] in matching]
+            if len(kept) >= top_k or len(hits) < fetch:
+                return kept[:top_k]
+            fetch *= 4
+    
+    def _fuse(
+        self,
+        dense_docs: List[Dict[str, Any]],
+        lexical_hits: List[tuple],
+        top_k: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Merge vector and BM25 rankings with weighted reciprocal-rank fusion.
+        
+        Args:
+            dense_docs: Vector search results, best first
+            lexical_hits: (chunk ID, BM25 score) pairs, best first
+            top_k: Number of results to return
+            
+        Returns:
+            Fused results; each carries its fusion "score" (and "distance"
+            is None for chunks found only lexically)
+        """
+        scores: Dict[str, float] = {}
+        for rank, doc in enumerate(dense_docs):
+            scores[doc["id"]] = self.dense_weight / (self.rrf_k + rank + 1)
+        for rank, (chunk_id, _) in enumerate(lexical_hits):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + self.lexical_weight / (self.rrf_k + rank + 1)
+        
+        ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        
+        by_id = {doc["id"]: doc for doc in dense_docs}
+        lexical_only = [chunk_id for chunk_id in ranked if chunk_id not in by_id]
+        if lexical_only:
+            found = self.backend.get(ids=lexical_only, include=["documents", "metadatas"])
+            for chunk_id, doc, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                by_id[chunk_id] = {
+                    "id": chunk_id,
+                    "content": doc,
+                    "metadata": metadata or {},
+                    "distance": None
+                }
+        
+        return [
+            {**by_id[chunk_id], "score": scores[chunk_id]}
+            for chunk_id in ranked
+            if chunk_id in by_id
+        ]
     
     def clear(self):
         """Clear all documents from the collection."""
-        self.client.delete_collection(self.collection.name)
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection.name,
-            metadata={"hnsw:space": "cosine"}
-        )
+        self.backend.clear()
+        if self.lexical_index is not None:
+            self.lexical_index.clear()
         print("✅ Vector store cleared")
     
+    def ids_exist(self, ids: List[str]) -> bool:
+        """Check that every given document ID is still in the collection."""
+        if not ids:
+            return True
+        found = self.backend.get(ids=list(ids))
+        return len(set(found["ids"])) == len(set(ids))
+    
     def count(self) -> int:
         """Get number of documents in store."""
-        return self.collection.count()
+        return self.backend.count()
+    
+    def flush(self):
+        """Persist any index state the backend buffers in memory."""
+        self.backend.flush()
+    
+    def close(self):
+        """Flush and release the backend; the store is unusable afterwards."""
+        self.backend.close()
+    
+    def memory_bytes(self) -> int:
+        """Approximate memory held in-process by the vector and lexical indexes."""
+        total = self.backend.memory_bytes()
+        if self.lexical_index is not None:
+            total += self.lexical_index.memory_bytes()
+        return total
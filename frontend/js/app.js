@@ -89,8 +89,7 @@ async function uploadFile(file) {
         console.log('Response data:', data);
 
         if (response.ok) {
-            showStatus(`✓ ${file.name} uploaded successfully`, 'success');
-            enableChat();
+            await waitForJob(file.name, data.job_id);
         } else {
             showStatus(`✗ ${file.name}: ${data.detail || 'Upload failed'}`, 'error');
         }
@@ -100,6 +99,37 @@ async function uploadFile(file) {
     }
 }
 
+// Poll an ingestion job until it finishes, showing its progress
+async function waitForJob(fileName, jobId) {
+    while (true) {
+        const response = await fetch(`${API_URL}/jobs/${jobId}`);
+        const job = await response.json();
+
+        if (!response.ok) {
+            showStatus(`✗ ${fileName}: ${job.detail || 'Job lookup failed'}`, 'error');
+            return;
+        }
+
+        if (job.status === 'completed') {
+            showStatus(`✓ ${fileName} processed (${job.chunks_indexed} chunks)`, 'success');
+            enableChat();
+            return;
+        }
+
+        if (job.status === 'failed' || job.status === 'cancelled') {
+            const reason = job.errors.length > 0 ? job.errors.join('; ') : job.status;
+            showStatus(`✗ ${fileName}: ${reason}`, 'error');
+            return;
+        }
+
+        showStatus(
+            `Processing ${fileName}: ${job.chunks_parsed} parsed, ${job.chunks_embedded} embedded, ${job.chunks_indexed} indexed`,
+            'info'
+        );
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 // Handle question submission
 async function handleAskQuestion() {
     const question = elements.questionInput.value.trim();
@@ -113,9 +143,10 @@ async function handleAskQuestion() {
     addMessage(question, 'user');
     
     const loadingMsg = addLoadingMessage();
+    let messageDiv = null;
 
     try {
-        const response = await fetch(`${API_URL}/query`, {
+        const response = await fetch(`${API_URL}/query/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -123,14 +154,41 @@ async function handleAskQuestion() {
             body: JSON.stringify({ question })
         });
 
-        const data = await response.json();
+        if (!response.ok) {
+            const data = await response.json();
+            removeMessage(loadingMsg);
+            addMessage(`Error: ${data.detail}`, 'assistant');
+            return;
+        }
 
-        removeMessage(loadingMsg);
+        let answer = '';
+        let sources = [];
+
+        // Render tokens as they arrive; sources are attached once the answer is done
+        await readEventStream(response, (event, data) => {
+            if (event === 'sources') {
+                sources = data.sources;
+            } else if (event === 'token') {
+                answer += data.text;
+                if (!messageDiv) {
+                    removeMessage(loadingMsg);
+                    messageDiv = addMessage(answer, 'assistant');
+                } else {
+                    updateMessageContent(messageDiv, answer);
+                }
+            } else if (event === 'done') {
+                answer = data.response;
+            } else if (event === 'error') {
+                answer += `${answer ? '\n\n' : ''}Error: ${data.detail}`;
+            }
+        });
 
-        if (response.ok) {
-            addMessage(data.response, 'assistant', data.sources);
+        removeMessage(loadingMsg);
+        if (!messageDiv) {
+            addMessage(answer, 'assistant', sources);
         } else {
-            addMessage(`Error: ${data.detail}`, 'assistant');
+            updateMessageContent(messageDiv, answer);
+            appendSources(messageDiv, sources);
         }
     } catch (error) {
         removeMessage(loadingMsg);
@@ -142,6 +200,40 @@ async function handleAskQuestion() {
     }
 }
 
+// Read a server-sent event stream, calling onEvent(event, data) per event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+
+            if (data) {
+                onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+}
+
 // Handle clear chat
 async function handleClear() {
     if (!confirm('Clear all documents and chat history?')) return;
@@ -162,28 +254,36 @@ async function handleClear() {
     }
 }
 
+// Format content: convert newlines to <br> and preserve formatting
+function formatContent(content) {
+    return content
+        .replace(/\n/g, '<br>')
+        .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>') // Bold
+        .replace(/\*(.*?)\*/g, '<em>$1</em>'); // Italic
+}
+
+// Build the sources list for an answer
+function renderSources(sources) {
+    let html = '<div class="sources"><strong>Sources:</strong><br>';
+    sources.forEach((source, idx) => {
+        html += `<div class="source-item">${idx + 1}. ${source.source} (chunk ${source.chunk})</div>`;
+    });
+    html += '</div>';
+    return html;
+}
+
 // Add message to chat
 function addMessage(content, sender, sources = null) {
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${sender}`;
     
-    // Format content: convert newlines to <br> and preserve formatting
-    const formattedContent = content
-        .replace(/\n/g, '<br>')
-        .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>') // Bold
-        .replace(/\*(.*?)\*/g, '<em>$1</em>'); // Italic
-    
     let html = `
         <div class="message-label">${sender === 'user' ? 'You' : 'Assistant'}</div>
-        <div class="message-content">${formattedContent}</div>
+        <div class="message-content">${formatContent(content)}</div>
     `;
 
     if (sources && sources.length > 0) {
-        html += '<div class="sources"><strong>Sources:</strong><br>';
-        sources.forEach((source, idx) => {
-            html += `<div class="source-item">${idx + 1}. ${source.source} (chunk ${source.chunk})</div>`;
-        });
-        html += '</div>';
+        html += renderSources(sources);
     }
 
     messageDiv.innerHTML = html;
@@ -198,6 +298,20 @@ function addMessage(content, sender, sources = null) {
     return messageDiv;
 }
 
+// Replace the content of a message that is still being streamed
+function updateMessageContent(messageDiv, content) {
+    messageDiv.querySelector('.message-content').innerHTML = formatContent(content);
+    elements.chatContainer.scrollTop = elements.chatContainer.scrollHeight;
+}
+
+// Attach sources to a finished message
+function appendSources(messageDiv, sources) {
+    if (sources && sources.length > 0) {
+        messageDiv.insertAdjacentHTML('beforeend', renderSources(sources));
+        elements.chatContainer.scrollTop = elements.chatContainer.scrollHeight;
+    }
+}
+
 // Add loading message
 function addLoadingMessage() {
     const messageDiv = document.createElement('div');